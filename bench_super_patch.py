@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+bench_super_patch.py — Banc d'essai reproductible de super_patch.py sur charges synthétiques.
+
+Scénarios (générés de façon déterministe, graine fixe):
+- large-<N>k: fichier .ts de N lignes, des centaines de groupes exacts (10k → 200k lignes)
+- whitespace: cible ré-indentée de 2 espaces par rapport au diff (ancrage fuzzy + delta d'indentation)
+- moves: hunks contenant des déplacements de blocs (_split_move_groups: nombre de groupes résolus vérifié)
+- pages: diff multi-fichiers calqué sur aiapp/frontend/src/pages/<univers>/<produit>/tabs/<onglet>/
+- already: diff déjà appliqué (chemin "Groupe déjà appliqué")
+- warm-cache: même diff rejoué avec le cache des résolutions (FIX #27) chaud
+
+Mesures: latence par exécution et par groupe (percentiles p50/p90/p99 via --metrics interne), débit
+(lignes/s, groupes/s), vérification du résultat; comparaison avec une baseline JSON (--save-baseline pour l'écrire).
+
+Usage:
+  python3 bench_super_patch.py [--quick] [--repeat N] [--only SCEN] [--baseline F] [--save-baseline] [--threshold 0.2]
+"""
+
+import sys, os, io, json, time, random, shutil, tempfile, argparse, contextlib
+from typing import List, Tuple, Optional, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import super_patch as sp
+
+# ===== CONFIGURATION =====
+SEED = 20240611
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+CONTEXT = 3
+BLOCK = 10  # lignes par fonction synthétique (accolades équilibrées pour le validateur .ts)
+
+# Hunk = (old_start 0-based, lignes ' '/'-'/'+' préfixées)
+Hunk = Tuple[int, List[str]]
+
+# ===== GÉNÉRATION DE CONTENU =====
+def gen_ts_lines(rng: random.Random, n: int, tag: str = "") -> List[str]:
+    """Fichier TypeScript synthétique de n lignes: fonctions de BLOCK lignes à corps uniques; (rng,n,tag)->lines."""
+    lines: List[str] = []
+    b = 0
+    while len(lines) < n:
+        lines.append(f"export function {tag}f{b}(a: number): number {{\n")
+        for j in range(BLOCK - 3):
+            lines.append(f"  const x{b}_{j} = a + {rng.randint(0, 999)}; // {tag}{rng.choice(('init', 'sum', 'scale', 'load'))}\n")
+        lines.append(f"  return x{b}_0;\n")
+        lines.append("}\n")
+        b += 1
+    return lines
+
+def body_positions(lines: List[str]) -> List[int]:
+    """Positions des lignes de corps modifiables sans casser les accolades; lines->list[int]."""
+    return [i for i, l in enumerate(lines) if l.startswith("  const ")]
+
+def pick_spaced(rng: random.Random, positions: List[int], count: int, gap: int) -> List[int]:
+    """Choisir jusqu'à count positions triées espacées d'au moins gap lignes; (rng,pos,count,gap)->list[int]."""
+    chosen: List[int] = []
+    for p in sorted(rng.sample(positions, min(len(positions), count * 3))):
+        if not chosen or p - chosen[-1] >= gap:
+            chosen.append(p)
+        if len(chosen) >= count:
+            break
+    return chosen
+
+def replace_hunk(lines: List[str], pos: int, old_count: int, new_lines: List[str]) -> Hunk:
+    """Hunk remplaçant lines[pos:pos+old_count] par new_lines avec CONTEXT lignes de contexte; (lines,pos,n,new)->hunk."""
+    start = max(0, pos - CONTEXT)
+    body = [" " + l for l in lines[start:pos]]
+    body += ["-" + l for l in lines[pos:pos + old_count]]
+    body += ["+" + l for l in new_lines]
+    body += [" " + l for l in lines[pos + old_count:pos + old_count + CONTEXT]]
+    return start, body
+
+def move_hunk(lines: List[str], pos: int, size: int = 3, shift: int = 3) -> Hunk:
+    """Hunk déplaçant lines[pos:pos+size] après les shift lignes suivantes, en un seul bloc -/+ (-bloc -suite, +suite +bloc) que _split_move_groups divise en suppression + insertion; (lines,pos,size,shift)->hunk."""
+    start = max(0, pos - CONTEXT)
+    end = pos + size + shift
+    body = [" " + l for l in lines[start:pos]]
+    body += ["-" + l for l in lines[pos:end]]
+    body += ["+" + l for l in lines[pos + size:end] + lines[pos:pos + size]]
+    body += [" " + l for l in lines[end:end + CONTEXT]]
+    return start, body
+
+def apply_hunks(lines: List[str], hunks: List[Hunk]) -> List[str]:
+    """Résultat attendu: appliquer exactement des hunks triés et disjoints; (lines,hunks)->lines."""
+    out: List[str] = []
+    cur = 0
+    for start, body in hunks:
+        out.extend(lines[cur:start])
+        cur = start
+        for l in body:
+            if l[0] in " -":
+                cur += 1
+            if l[0] in " +":
+                out.append(l[1:])
+    out.extend(lines[cur:])
+    return out
+
+def render_diff(path: str, hunks: List[Hunk]) -> str:
+    """Diff unifié d'un fichier à partir de ses hunks (en-têtes sans préfixe a/ b/, -p0); (path,hunks)->str."""
+    out = [f"--- {path}\n", f"+++ {path}\n"]
+    delta = 0
+    for start, body in hunks:
+        old_n = sum(1 for l in body if l[0] in " -")
+        new_n = sum(1 for l in body if l[0] in " +")
+        out.append(f"@@ -{start + 1},{old_n} +{start + 1 + delta},{new_n} @@\n")
+        out.extend(body)
+        delta += new_n - old_n
+    return "".join(out)
+
+EDIT_KINDS = ("rep", "ins", "del", "rep2")
+
+def edit_hunks(rng: random.Random, lines: List[str], groups: int, kinds: Tuple[str, ...] = EDIT_KINDS) -> List[Hunk]:
+    """Hunks de remplacement/insertion/suppression (parmi kinds) sur des lignes de corps; (rng,lines,n,kinds)->hunks."""
+    hunks: List[Hunk] = []
+    for p in pick_spaced(rng, body_positions(lines), groups, 2 * CONTEXT + 3):
+        kind = rng.choice(kinds)
+        indent_line = f"  const e{p} = {rng.randint(0, 99)};\n"
+        if kind == "rep":
+            hunks.append(replace_hunk(lines, p, 1, [indent_line]))
+        elif kind == "ins":
+            hunks.append(replace_hunk(lines, p, 0, [indent_line]))
+        elif kind == "del":
+            hunks.append(replace_hunk(lines, p, 1, []))
+        else:
+            hunks.append(replace_hunk(lines, p, 1, [indent_line, f"  // e{p} two\n"]))
+    return hunks
+
+# ===== SCÉNARIOS =====
+# Un scénario = {"files": {path: contenu initial}, "expected": {path: contenu attendu}, "diff": str, "groups": int, "lines": int, "opts": dict}
+def scenario_large(n_lines: int, groups: int, kinds: Tuple[str, ...] = EDIT_KINDS) -> Dict:
+    """Un gros fichier .ts et des centaines de groupes exacts; (lignes,groupes,kinds)->scenario."""
+    rng = random.Random(SEED + n_lines)
+    lines = gen_ts_lines(rng, n_lines)
+    hunks = edit_hunks(rng, lines, groups, kinds)
+    path = "src/big.ts"
+    return {"files": {path: lines}, "expected": {path: apply_hunks(lines, hunks)},
+            "diff": render_diff(path, hunks), "groups": len(hunks), "lines": len(lines)}
+
+def scenario_whitespace(n_lines: int, groups: int) -> Dict:
+    """Cible ré-indentée de 2 espaces: chaque ancre doit passer par la recherche fuzzy; (lignes,groupes)->scenario."""
+    scen = scenario_large(n_lines, groups)
+    path = "src/big.ts"
+    scen["files"][path] = ["  " + l for l in scen["files"][path]]
+    scen["expected"][path] = ["  " + l for l in scen["expected"][path]]
+    return scen
+
+def scenario_moves(n_lines: int, groups: int) -> Dict:
+    """Hunks de déplacement de blocs de 3 lignes mêlés à des éditions simples; (lignes,groupes)->scenario."""
+    rng = random.Random(SEED + 7)
+    lines = gen_ts_lines(rng, n_lines)
+    hunks: List[Hunk] = []
+    moves = 0
+    # un déplacement occupe 3+3 lignes de corps consécutives: début de fonction + 1 (lignes 1..6 du bloc)
+    starts = [i for i in range(1, len(lines) - BLOCK, BLOCK)]
+    for k, p in enumerate(pick_spaced(rng, starts, groups, 2 * BLOCK)):
+        if k % 2 == 0:
+            hunks.append(move_hunk(lines, p))
+            moves += 1
+        else:
+            hunks.append(replace_hunk(lines, p + 2, 1, [f"  const m{p} = 0;\n"]))
+    path = "src/moves.ts"
+    # chaque déplacement doit être résolu en deux groupes (suppression puis insertion)
+    return {"files": {path: lines}, "expected": {path: apply_hunks(lines, hunks)},
+            "diff": render_diff(path, hunks), "groups": len(hunks), "lines": len(lines),
+            "expect_groups": len(hunks) + moves}
+
+def scenario_pages(n_products: int, groups_per_file: int) -> Dict:
+    """Arborescence pages/<univers>/<produit>/ (index.tsx, <Produit>Page.css, tabs/<onglet>/<Onglet>Tab.tsx|.service.ts); (produits,groupes)->scenario."""
+    rng = random.Random(SEED + 11)
+    universes = ["bare-metal", "public-cloud", "web-cloud", "network", "iam", "private-cloud"]
+    tabs = ["general", "tasks", "accesses", "partitions"]
+    files: Dict[str, List[str]] = {}
+    expected: Dict[str, List[str]] = {}
+    diff: List[str] = []
+    total_groups = 0
+    for i in range(n_products):
+        base = f"aiapp/frontend/src/pages/{universes[i % len(universes)]}/product{i}"
+        paths = [f"{base}/index.tsx"]
+        for tab in tabs[:1 + i % len(tabs)]:
+            cap = tab.capitalize()
+            paths += [f"{base}/tabs/{tab}/{cap}Tab.tsx", f"{base}/tabs/{tab}/{cap}Tab.service.ts"]
+        for path in paths:
+            lines = gen_ts_lines(rng, rng.randint(20, 60) * BLOCK, tag=f"p{i}")
+            hunks = edit_hunks(rng, lines, groups_per_file)
+            files[path] = lines
+            expected[path] = apply_hunks(lines, hunks)
+            diff.append(render_diff(path, hunks))
+            total_groups += len(hunks)
+        css = f"{base}/Product{i}Page.css"
+        css_lines = [f".product{i}-c{k} {{ margin: {k}px; }}\n" for k in range(200)]
+        css_hunks = [replace_hunk(css_lines, k, 1, [f".product{i}-c{k} {{ margin: {k + 1}px; }}\n"]) for k in range(10, 190, 20)]
+        files[css] = css_lines
+        expected[css] = apply_hunks(css_lines, css_hunks)
+        diff.append(render_diff(css, css_hunks))
+        total_groups += len(css_hunks)
+    return {"files": files, "expected": expected, "diff": "".join(diff), "groups": total_groups,
+            "lines": sum(len(v) for v in files.values())}
+
+def scenario_already(n_lines: int, groups: int) -> Dict:
+    """Diff déjà appliqué: chaque groupe est reconnu et ignoré; (lignes,groupes)->scenario."""
+    # Sans suppressions pures: une ligne supprimée absente ne prouve pas que le groupe est déjà appliqué (introuvable)
+    scen = scenario_large(n_lines, groups, tuple(k for k in EDIT_KINDS if k != "del"))
+    scen["files"] = {p: list(v) for p, v in scen["expected"].items()}
+    scen["expect_modes"] = {"already": scen["groups"]}
+    return scen
+
+def scenario_warm_cache(n_lines: int, groups: int) -> Dict:
+    """Diff rejoué avec le cache des résolutions déjà rempli (exécution d'amorçage non mesurée); (lignes,groupes)->scenario."""
+    scen = scenario_whitespace(n_lines, groups)
+    scen["opts"] = {"cache": True}
+    scen["warmup"] = True
+    return scen
+
+def build_scenarios(quick: bool) -> Dict[str, Dict]:
+    """Table nom -> fabrique de scénario (tailles réduites avec quick); quick->dict."""
+    sizes = [10_000] if quick else [10_000, 50_000, 200_000]
+    mid = 10_000 if quick else 50_000
+    table: Dict = {}
+    for n in sizes:
+        table[f"large-{n // 1000}k"] = lambda n=n: scenario_large(n, 300)
+    table["whitespace"] = lambda: scenario_whitespace(mid, 300)
+    table["moves"] = lambda: scenario_moves(mid, 200)
+    table["pages"] = lambda: scenario_pages(12 if quick else 60, 4)
+    table["already"] = lambda: scenario_already(mid, 300)
+    table["warm-cache"] = lambda: scenario_warm_cache(mid, 300)
+    return table
+
+# ===== EXÉCUTION =====
+def _write_tree(root: str, files: Dict[str, List[str]]) -> None:
+    """Écrire les fichiers d'un scénario sous root; (root,files)->None."""
+    for rel, lines in files.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+
+def _apply_in(root: str, diff: str, opts: Dict) -> Tuple[int, float, Dict]:
+    """Appliquer le diff dans root en processus (parse + application, sorties avalées); (root,diff,opts)->(rc,s,metrics)."""
+    cwd = os.getcwd()
+    os.chdir(root)
+    sp._reset_run_state()
+    sp.metrics_enable()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            t0 = time.perf_counter()
+            files = (sp._normalize_devnull_entry(fe) for fe in sp._timed_iter("parse", sp.iter_parse_diff(io.StringIO(diff))))
+            rc = sp.apply_all(files, opts)
+            elapsed = time.perf_counter() - t0
+        return rc, elapsed, sp.metrics_report(rc, opts)
+    finally:
+        os.chdir(cwd)
+
+def _check_tree(root: str, expected: Dict[str, List[str]]) -> int:
+    """Nombre de fichiers dont le contenu diffère du résultat attendu; (root,expected)->int."""
+    bad = 0
+    for rel, lines in expected.items():
+        with open(os.path.join(root, rel), encoding="utf-8") as f:
+            if f.read() != "".join(lines):
+                bad += 1
+    return bad
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile q (0..100) par interpolation linéaire; (values,q)->float."""
+    if not values:
+        return 0.0
+    v = sorted(values)
+    k = (len(v) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(v) - 1)
+    return v[lo] + (v[hi] - v[lo]) * (k - lo)
+
+def run_scenario(scen: Dict, repeat: int, jobs: int) -> Dict:
+    """Exécuter un scénario repeat fois dans des dossiers neufs; scenario->résultats agrégés."""
+    run_times: List[float] = []
+    group_times: List[float] = []
+    modes: Dict[str, int] = {}
+    mismatches = 0
+    path_errors = 0
+    rcs = set()
+    cache_dir = tempfile.mkdtemp(prefix="spbench-cache-")
+    opts = sp.make_options({"cache": False, "jobs": jobs, "cache_dir": cache_dir, "backup_dir": os.path.join(cache_dir, "backups")}, **scen.get("opts", {}))
+    try:
+        for i in range(repeat + (1 if scen.get("warmup") else 0)):
+            root = tempfile.mkdtemp(prefix="spbench-")
+            try:
+                _write_tree(root, scen["files"])
+                rc, elapsed, metrics = _apply_in(root, scen["diff"], opts)
+                if scen.get("warmup") and i == 0:
+                    continue
+                rcs.add(rc)
+                mismatches += _check_tree(root, scen["expected"])
+                run_times.append(elapsed)
+                if "expect_groups" in scen and sum(len(f["groups"]) for f in metrics["files"]) != scen["expect_groups"]:
+                    path_errors += 1
+                run_modes: Dict[str, int] = {}
+                for f in metrics["files"]:
+                    for g in f["groups"]:
+                        group_times.append(g["seconds"])
+                        run_modes[g["mode"]] = run_modes.get(g["mode"], 0) + 1
+                if "expect_modes" in scen and run_modes != scen["expect_modes"]:
+                    path_errors += 1
+                for mode, count in run_modes.items():
+                    modes[mode] = modes.get(mode, 0) + count
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    best = min(run_times)
+    return {
+        "lines": scen["lines"], "groups": scen["groups"], "files": len(scen["files"]), "runs": len(run_times),
+        "rc": sorted(rcs), "mismatches": mismatches, "path_errors": path_errors, "modes": dict(sorted(modes.items())),
+        "run_p50": percentile(run_times, 50), "run_p90": percentile(run_times, 90), "run_p99": percentile(run_times, 99),
+        "group_p50": percentile(group_times, 50), "group_p90": percentile(group_times, 90), "group_p99": percentile(group_times, 99),
+        "lines_per_s": scen["lines"] / best if best else 0.0, "groups_per_s": scen["groups"] / best if best else 0.0,
+    }
+
+# ===== RAPPORT / BASELINE =====
+COMPARED = ("run_p50", "group_p90")
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Lister les régressions: plus de fichiers incorrects que la baseline, ou > 1+threshold fois la baseline sur COMPARED; (results,baseline,t)->list[str]."""
+    regressions: List[str] = []
+    for name, res in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if res["mismatches"] > ref.get("mismatches", 0) or res["rc"] != ref.get("rc", [0]):
+            regressions.append(f"{name}: rc={res['rc']} écarts={res['mismatches']} vs baseline rc={ref.get('rc')} écarts={ref.get('mismatches')}")
+        for key in COMPARED:
+            if ref.get(key) and res[key] > ref[key] * (1 + threshold):
+                regressions.append(f"{name}.{key}: {res[key] * 1000:.2f}ms vs baseline {ref[key] * 1000:.2f}ms (x{res[key] / ref[key]:.2f})")
+    return regressions
+
+def _correct(res: Dict) -> bool:
+    """Le scénario a-t-il produit le résultat attendu (rc 0, fichiers identiques, groupes résolus comme prévu)?; res->bool."""
+    return res["rc"] == [0] and not res["mismatches"] and not res.get("path_errors")
+
+def print_table(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    """Afficher le tableau des résultats (ms) avec le ratio p50 vs baseline; (results,baseline)->None."""
+    print(f"{'scénario':<12} {'lignes':>8} {'groupes':>7} {'run p50':>9} {'p90':>9} {'p99':>9} {'grp p50':>8} {'p90':>8} {'p99':>8} {'lignes/s':>11} {'vs base':>8}  modes")
+    for name, r in results.items():
+        ref = baseline.get(name, {}).get("run_p50")
+        ratio = f"x{r['run_p50'] / ref:.2f}" if ref else "-"
+        flag = "" if _correct(r) else f"  !! rc={r['rc']} écarts={r['mismatches']} groupes inattendus={r.get('path_errors', 0)}"
+        print(f"{name:<12} {r['lines']:>8} {r['groups']:>7} {r['run_p50'] * 1000:>8.1f}ms {r['run_p90'] * 1000:>7.1f}ms {r['run_p99'] * 1000:>7.1f}ms "
+              f"{r['group_p50'] * 1e6:>6.0f}us {r['group_p90'] * 1e6:>6.0f}us {r['group_p99'] * 1e6:>6.0f}us {r['lines_per_s']:>11.0f} {ratio:>8}  "
+              f"{','.join(f'{k}:{v}' for k, v in r['modes'].items())}{flag}")
+
+# ===== MAIN =====
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée: générer, mesurer, comparer à la baseline; argv->rc (1 si résultat incorrect ou régression)."""
+    ap = argparse.ArgumentParser(description="Banc d'essai super_patch.py sur charges synthétiques.")
+    ap.add_argument("--quick", action="store_true", help="tailles réduites (10k lignes) pour un contrôle rapide")
+    ap.add_argument("--repeat", type=int, default=5, help="exécutions mesurées par scénario (défaut 5)")
+    ap.add_argument("--only", action="append", default=None, help="limiter à ce scénario (répétable)")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="--jobs transmis à super_patch (défaut 1)")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE, help="fichier JSON de référence")
+    ap.add_argument("--save-baseline", action="store_true", help="enregistrer les résultats comme nouvelle baseline")
+    ap.add_argument("--threshold", type=float, default=0.2, help="tolérance de régression relative (défaut 0.2 = +20%%)")
+    ap.add_argument("--json", dest="json_out", default=None, help="écrire aussi les résultats bruts dans ce fichier")
+    args = ap.parse_args(argv)
+
+    table = build_scenarios(args.quick)
+    names = args.only or list(table)
+    unknown = [n for n in names if n not in table]
+    if unknown:
+        sys.stderr.write(f"Scénario(s) inconnu(s): {', '.join(unknown)} (disponibles: {', '.join(table)})\n")
+        return 2
+
+    baseline: Dict[str, Dict] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results: Dict[str, Dict] = {}
+    for name in names:
+        sys.stderr.write(f"[BENCH] {name}…\n")
+        results[name] = run_scenario(table[name](), args.repeat, args.jobs)
+
+    print_table(results, baseline)
+    payload = {"python": sys.version.split()[0], "quick": args.quick, "repeat": args.repeat, "results": results}
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=1)
+    wrong = [name for name, r in results.items() if not _correct(r)]
+    if args.save_baseline:
+        # un résultat incorrect ne devient jamais la référence
+        merged = dict(baseline)
+        merged.update({name: r for name, r in results.items() if name not in wrong})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(dict(payload, results=merged), f, indent=1)
+        print(f"[BENCH] Baseline enregistrée: {args.baseline}")
+
+    if wrong:
+        print(f"[BENCH] Résultat différent de l'attendu: {', '.join(wrong)} (voir '!!'; exclus de la baseline).")
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f"[REGRESSION] {line}")
+    return 1 if wrong or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
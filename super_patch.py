@@ -24,39 +24,786 @@ VERSION CORRIGÉE :
 - FIX #17: Affichage diff -u automatique après application pour visualiser les modifications
 - FIX #18: Échappement des lignes commençant par +/- avec double préfixe (++ → +, +- → -, -- → -, -+ → +)
 - FIX #19: Flush correct quand contexte sépare deux blocs + consécutifs (insertions multiples à différents endroits)
+- FIX #20: Moteur d'application en mémoire — tous les groupes d'un fichier appliqués sur current_lines puis écriture unique atomique; 'patch' seulement en mode compatibilité (--engine patch)
+- FIX #21: Index de lignes par fichier (hash exact/normalisé -> positions + empreinte roulante) construit une fois, mis à jour à chaque groupe, partagé par les recherches exactes et fuzzy
+- FIX #22: Mode parallèle --jobs N — préparation des fichiers dans un pool de processus, commit et sorties dans l'ordre du diff; --keep-going pour ne pas s'arrêter au premier échec
+- FIX #23: Mode --transaction — tous les fichiers calculés et validés en mémoire, puis commit en deux phases (staging + renames atomiques) ou aucune écriture
+- FIX #24: Parser en flux (iter_parse_diff) — STDIN lu ligne à ligne, chaque fichier appliqué dès que son entrée est complète; mêmes tolérances ('***', '+++' manquant, /dev/null)
+- FIX #25: Registre de validateurs par extension (py, json, ts/tsx/js, css) exécutés en mémoire avant écriture: parsing JSON réel, équilibre brackets/chaînes/templates/balises JSX, CSS
+- FIX #26: Politique de validation --validate per-file (défaut: résultat final uniquement) | per-group (dichotomie vers le groupe fautif) | off
+- FIX #27: Cache disque (sqlite, LRU borné) des résolutions par (empreinte du contenu, groupe): ancrage, delta d'indentation et verdict réutilisés sans recherche (--no-cache, --cache-dir, --cache-max)
+- FIX #28: --metrics json — temps par phase (parse, resolve, validate, patch, backup, write, diff…), par fichier et par groupe (mode exact/fuzzy/combined-anchor, delta d'indentation), octets lus/écrits, nombre de sous-processus
+- FIX #29: Diff final rendu en processus (patience diff) depuis les contenus en mémoire au lieu de 'diff -u' par fichier: --diff full|summary|none, --diff-context N, --color, sortie hunk par hunk
+- FIX #30: Sauvegardes dans un magasin unique adressé par contenu ($XDG_CACHE_HOME/super_patch/backups ou ~/.cache/super_patch/backups: objets sha256 dédupliqués, lien dur/reflink/copie, manifeste JSONL par exécution), rétention --backup-keep/--backup-max-age, --restore RUN_ID, --list-runs; --backup-mode sidecar pour l'ancien comportement
+- FIX #31: Mode batch --batch DIFF|DOSSIER… / --spool DOSSIER: plusieurs diffs appliqués dans l'ordre par un seul processus, lignes des fichiers gardées en mémoire entre diffs (invalidées par inode/taille/mtime), enregistrement de résultat JSON par diff
+- FIX #32: Mode serveur --serve SOCKET (socket Unix, JSON par ligne): processus résident gardant lignes et index des fichiers au chaud (invalidés par inode/taille/mtime), réponse structurée applied / already-applied / not-found avec indice de correspondance; --client SOCKET envoie le diff de STDIN
+- FIX #33: Indice 'bloc non trouvé' calculé en mémoire (plus de grep): les régions les plus proches du bloc ancré, classées par similarité via l'index de lignes, avec numéro de ligne, score et côte-à-côte tronqué des différences
+- FIX #34: Ancrage flou scoré quand contexte exact et tolérant échouent: candidats tirés de l'index de lignes (occurrences des lignes '-', votes des ancres pour une insertion), contexte noté ligne à ligne, application automatique au-dessus de --fuzzy-min-score (défaut 0.8), contexte du fichier conservé
+- FIX #35: Numéros de ligne des entêtes @@ utilisés comme indice: recherche d'abord autour de la ligne attendue (décalage cumulé suivi de groupe en groupe, comme patch), occurrence la plus proche retenue, recherche indexée complète seulement en repli (--ignore-line-numbers pour l'ancien comportement)
+- FIX #36: Mode gros fichiers (>= --large-file-mb, défaut 16 Mo, sans validateur): fichier projeté en mémoire (mmap) + tableau des débuts de ligne, recherches exactes sur les octets, lignes décodées à la demande, écriture en recopiant les plages inchangées; repli automatique sur le moteur normal dès qu'un groupe demande plus qu'une correspondance exacte
+- FIX #37: Index de lignes par blocs (LINE_CHUNK lignes): positions codées par (bloc, rang) qui ne bougent pas quand un groupe décale la suite du fichier, splice limité aux blocs touchés (découpés au-delà de 2*LINE_CHUNK), empreintes roulantes par bloc; lines/norm exposées en vues séquence
+- FIX #38: Enregistrement par ligne (forme normalisée, empreinte, largeur d'indentation) calculé une fois par version de fichier en colonnes parallèles des blocs de l'index, partagé par recherches tolérantes, deltas d'indentation et ancrage flou; ensembles de mots mémorisés pour la notation du contexte
+- FIX #39: API importable apply_patch(text, root=..., options=...) sans effet de bord à l'import: aucune sortie sur stdout/stderr ni sys.exit, résultat structuré par fichier et par groupe (verdict, mode, ligne, indice) + sorties capturées; le serveur --serve s'appuie dessus
+- FIX #40: --plan FICHIER résout le diff une fois sans rien modifier (par fichier: sha256 du contenu de départ et du résultat, éditions ligne/longueur/lignes insérées, indentation ajustée); --replay FICHIER vérifie les empreintes puis rejoue les éditions sans recherche, en deux phases (rien n'est écrit si un fichier diffère)
+- FIX #41: Groupes affinés par diff de lignes (patience) de g_minus vers g_plus: un remplacement dont le corps est en grande partie inchangé devient des sous-éditions minimales ancrées sur les lignes inchangées; déplacements détectés par identité de ligne (lignes appariées dans l'ordre) au lieu du recouvrement d'ensembles
+- FIX #42: Exécutions concurrentes sur un même arbre: verrou consultatif (flock) par fichier au commit (--lock-timeout), contrôle optimiste entre résolution et écriture (identité stat puis contenu) avec nouvelle résolution en cas de conflit (--conflict-retries), noms de copies voisines réservés en exclusif (suffixe -N dans la même seconde)
+- FIX #43: --bundles SCRIPT: après application, seules les archives new_manager.*.tar du script de génération contenant un fichier modifié (mêmes membres et --exclude que ses 'tar -cf') sont réécrites, membres inchangés recopiés depuis l'ancienne archive sans relire l'arbre (--bundle-root, --bundle-dir pour relocaliser)
 """
 
-import sys, os, re, tempfile, subprocess, shutil
-from typing import List, Tuple, Optional, Dict
+import sys, os, re, io, json, time, hashlib, tempfile, subprocess, shutil, argparse, bisect, contextlib, functools, itertools, collections
+import socket, socketserver, mmap, array, tarfile, fnmatch, shlex, threading
+import collections.abc
+import concurrent.futures
+try:
+    import sqlite3
+except ImportError:  # Python compilé sans sqlite: cache persistant désactivé
+    sqlite3 = None  # type: ignore
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrous consultatifs, seul le contrôle optimiste protège les commits
+    fcntl = None  # type: ignore
+from typing import List, Tuple, Optional, Dict, Iterator, Iterable, Callable, Set
 
 # ===== CONFIGURATION =====
 CONTEXT_ANCHOR_MIN = 1
 CONTEXT_ANCHOR_MAX = 3
+ENGINE_MEMORY = "memory"
+ENGINE_PATCH = "patch"
+VALIDATE_PER_GROUP = "per-group"
+VALIDATE_PER_FILE = "per-file"
+VALIDATE_OFF = "off"
+BACKUP_STORE = "store"
+BACKUP_SIDECAR = "sidecar"
+BACKUP_KEEP_RUNS = 20
+BACKUP_MAX_AGE_DAYS = 30
+FUZZY_MIN_SCORE = 0.8  # confiance minimale de l'ancrage flou pour s'appliquer automatiquement
+LINE_HINT_RADIUS = 64  # lignes sondées de part et d'autre de la ligne attendue avant la recherche indexée complète
+LARGE_FILE_BYTES = 16 * 1024 * 1024  # taille à partir de laquelle un fichier est traité en mode mmap (FIX #36)
+LOCK_TIMEOUT = 30.0  # secondes d'attente du verrou d'un fichier avant abandon (FIX #42)
+CONFLICT_RETRIES = 3  # nouvelles résolutions d'un fichier modifié par un autre processus entre résolution et commit
+
+# ===== OPTIONS =====
+DEFAULT_OPTIONS: Dict = {
+    "engine": ENGINE_MEMORY,        # memory | patch (compatibilité)
+    "jobs": 1,                      # processus de préparation (0 = nombre de CPU)
+    "fail_fast": True,              # arrêt au premier fichier en échec
+    "transaction": False,           # tout ou rien (apply_transaction)
+    "validate": VALIDATE_PER_FILE,  # per-group | per-file | off
+    "cache": True,                  # cache disque des résolutions de groupes
+    "cache_dir": None,              # None = _default_cache_dir()
+    "cache_max_entries": None,      # None = CACHE_MAX_ENTRIES
+    "metrics": False,               # collecte des métriques (--metrics json)
+    "diff": "full",                 # diff final: full | summary | none
+    "diff_context": 3,              # lignes de contexte du diff final
+    "color": False,                 # diff final coloré (ANSI)
+    "backup_mode": BACKUP_STORE,    # store (magasin adressé par contenu) | sidecar (copie src.AAAAmmjjTHHMMSS)
+    "backup_dir": None,             # None = _default_backup_dir()
+    "backup_keep_runs": BACKUP_KEEP_RUNS,        # exécutions conservées dans le magasin
+    "backup_max_age_days": BACKUP_MAX_AGE_DAYS,  # âge maximal d'une exécution conservée
+    "fuzzy_min_score": FUZZY_MIN_SCORE,  # ancrage flou des contextes dérivés (None = désactivé)
+    "line_hints": True,             # numéros de ligne des entêtes @@ comme indice de recherche
+    "large_file_bytes": LARGE_FILE_BYTES,  # mode mmap à partir de cette taille (None = jamais)
+    "lock_timeout": LOCK_TIMEOUT,   # attente du verrou par fichier au commit (None = pas de verrou)
+    "conflict_retries": CONFLICT_RETRIES,  # nouvelles résolutions si le fichier a changé depuis sa lecture
+    "bundles": None,                # script new_generate_manager_tars.sh: archives à tenir à jour après application
+    "bundle_root": None,            # None = dossier du 'cd' du script
+    "bundle_dir": None,             # None = dossier des archives dans le script
+}
+
+def make_options(opts: Optional[Dict] = None, **overrides) -> Dict:
+    """Compléter des options partielles avec DEFAULT_OPTIONS; (opts?,overrides)->dict."""
+    merged = dict(DEFAULT_OPTIONS)
+    merged.update(opts or {})
+    merged.update(overrides)
+    return merged
+
+# ===== FIX #28: MÉTRIQUES (--metrics json) =====
+# Désactivées par défaut (_METRICS None): chaque point d'instrumentation se réduit alors à un test.
+_METRICS: Optional[Dict] = None
+_METRICS_FILE: Optional[Dict] = None  # enregistrement du fichier en cours (temps/octets attribués)
+
+def metrics_enable() -> Dict:
+    """Activer (et remettre à zéro) la collecte des métriques du processus courant; ->dict collecté."""
+    global _METRICS, _METRICS_FILE
+    _METRICS = {"started": time.perf_counter(), "timings": {}, "calls": {}, "subprocess": {},
+                "bytes_read": 0, "bytes_written": 0, "files": []}
+    _METRICS_FILE = None
+    return _METRICS
+
+def _metrics_add(phase: str, seconds: float) -> None:
+    """Cumuler la durée d'une phase (globale + fichier en cours); (phase,s)->None."""
+    m = _METRICS
+    if m is None:
+        return
+    m["timings"][phase] = m["timings"].get(phase, 0.0) + seconds
+    m["calls"][phase] = m["calls"].get(phase, 0) + 1
+    if _METRICS_FILE is not None:
+        ft = _METRICS_FILE["timings"]
+        ft[phase] = ft.get(phase, 0.0) + seconds
+
+def _metrics_bytes(kind: str, n: int) -> None:
+    """Compter des octets lus/écrits ('bytes_read'|'bytes_written'); (kind,n)->None."""
+    if _METRICS is None:
+        return
+    _METRICS[kind] += n
+    if _METRICS_FILE is not None:
+        _METRICS_FILE[kind] += n
+
+def _instrumented(phase: str) -> Callable:
+    """Décorateur: chronométrer chaque appel sous le nom de phase donné; phase->decorator."""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _METRICS is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _metrics_add(phase, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+@contextlib.contextmanager
+def _timed(phase: str) -> Iterator[None]:
+    """Chronométrer un bloc sous le nom de phase donné; phase->ctx."""
+    if _METRICS is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics_add(phase, time.perf_counter() - t0)
+
+def _timed_iter(phase: str, it: Iterable) -> Iterator:
+    """Chronométrer la production de chaque élément d'un itérateur (parsing en flux); (phase,it)->iter."""
+    it = iter(it)
+    while True:
+        with _timed(phase):
+            item = next(it, _timed_iter)
+        if item is _timed_iter:
+            return
+        yield item
+
+def _metrics_new_file(path: str) -> Optional[Dict]:
+    """Créer l'enregistrement d'un fichier (None si métriques désactivées); path->dict|None."""
+    if _METRICS is None:
+        return None
+    rec = {"path": path, "seconds": 0.0, "bytes_read": 0, "bytes_written": 0, "timings": {}, "groups": []}
+    _METRICS["files"].append(rec)
+    return rec
+
+@contextlib.contextmanager
+def _metrics_scope(rec: Optional[Dict]) -> Iterator[None]:
+    """Attribuer au fichier rec les temps et octets mesurés dans le bloc, et cumuler sa durée; rec->ctx."""
+    global _METRICS_FILE
+    if rec is None or _METRICS is None:
+        yield
+        return
+    prev, _METRICS_FILE = _METRICS_FILE, rec
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec["seconds"] += time.perf_counter() - t0
+        _METRICS_FILE = prev
+
+def _metrics_group(res: Dict, seconds: float) -> None:
+    """Enregistrer la résolution d'un groupe (verdict, mode de correspondance, delta d'indentation) du fichier en cours; (res,s)->None."""
+    if _METRICS is None or _METRICS_FILE is None:
+        return
+    groups = _METRICS_FILE["groups"]
+    groups.append({"index": len(groups) + 1, "status": res["status"], "mode": res.get("mode", ""),
+                   "line": res.get("start", 0) + 1 if res["status"] != "notfound" else None,
+                   "indent_delta": res.get("indent_delta", 0), "cached": bool(res.get("cached")),
+                   "seconds": round(seconds, 6)})
+
+def _metrics_merge(other: Optional[Dict]) -> None:
+    """Fusionner les métriques rapportées par un worker dans celles du processus courant; dict->None."""
+    m = _METRICS
+    if m is None or not other:
+        return
+    for key in ("timings", "calls", "subprocess"):
+        for name, value in other[key].items():
+            m[key][name] = m[key].get(name, 0) + value
+    m["bytes_read"] += other["bytes_read"]
+    m["bytes_written"] += other["bytes_written"]
+    m["files"].extend(other["files"])
+
+def _run_subprocess(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run compté et chronométré par binaire; (args,kwargs)->CompletedProcess."""
+    if _METRICS is None:
+        return subprocess.run(args, **kwargs)
+    name = os.path.basename(args[0])
+    _METRICS["subprocess"][name] = _METRICS["subprocess"].get(name, 0) + 1
+    with _timed(f"subprocess.{name}"):
+        return subprocess.run(args, **kwargs)
+
+def metrics_report(rc: int, opts: Optional[Dict] = None) -> Dict:
+    """Rapport JSON-sérialisable des métriques collectées (durées en secondes); (rc,opts)->dict."""
+    m = _METRICS or metrics_enable()
+    opts = make_options(opts)
+    return {
+        "version": 1,
+        "rc": rc,
+        "wall_seconds": round(time.perf_counter() - m["started"], 6),
+        "options": {k: opts[k] for k in ("engine", "jobs", "validate", "cache")},
+        "timings": {k: round(v, 6) for k, v in sorted(m["timings"].items())},
+        "calls": dict(sorted(m["calls"].items())),
+        "subprocess": dict(sorted(m["subprocess"].items())),
+        "bytes_read": m["bytes_read"],
+        "bytes_written": m["bytes_written"],
+        "files": [dict(f, seconds=round(f["seconds"], 6), timings={k: round(v, 6) for k, v in sorted(f["timings"].items())})
+                  for f in m["files"]],
+    }
 
 # ===== UTILITAIRES FICHIERS/TEXTE =====
+# FIX #31 + #32: lignes (et index de lignes) gardées en mémoire entre deux diffs (batch, serveur), invalidées par
+# (inode, taille, mtime, ctime), LRU borné à LINE_CACHE_MAX_FILES fichiers; None = désactivé
+LINE_CACHE_MAX_FILES = 256
+# Fichiers lus entièrement en CRLF: lignes rendues en '\n' pour la recherche, '\r\n' restauré à l'écriture (chemin absolu -> fin de ligne)
+_file_eol: Dict[str, str] = {}
+_line_cache: Optional["collections.OrderedDict[str, Tuple[Tuple[int, int, int, int], List[str], Optional[LineIndex]]]"] = None
+
+def _stat_key(path: str) -> Optional[Tuple[int, int, int, int]]:
+    """Identité d'une version de fichier (inode, taille, mtime_ns, ctime_ns), None si absent; path->tuple|None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+def enable_line_cache(enabled: bool = True) -> None:
+    """Activer (vide) ou désactiver le cache des lignes de fichiers du processus; bool->None."""
+    global _line_cache
+    _line_cache = collections.OrderedDict() if enabled else None
+
+def _remember_lines(path: str, lines: List[str], index: Optional["LineIndex"] = None) -> None:
+    """Garder au chaud le contenu actuel de path (et son index, qui garde sa propre liste) si relire le fichier redonnerait les mêmes lignes; (path,lines,index?)->None."""
+    if _line_cache is None:
+        return
+    key = _stat_key(path)
+    apath = os.path.abspath(path)
+    # Un '\r' hors fin de ligne couperait la ligne en deux à la relecture
+    if key is None or not isinstance(lines, list) or any("\r" in l.rstrip("\r\n") for l in lines):
+        _line_cache.pop(apath, None)
+        return
+    _line_cache[apath] = (key, list(lines), index)
+    _line_cache.move_to_end(apath)
+    while len(_line_cache) > LINE_CACHE_MAX_FILES:
+        _line_cache.popitem(last=False)
+
+def _take_warm_index(path: str, base_lines: List[str]) -> Optional["LineIndex"]:
+    """Reprendre (une seule fois) l'index gardé au chaud de path s'il correspond à la version sur disque et à base_lines; (path,lines)->LineIndex|None."""
+    if _line_cache is None:
+        return None
+    apath = os.path.abspath(path)
+    entry = _line_cache.get(apath)
+    if entry is None or entry[2] is None:
+        return None
+    key, lines, index = entry
+    _line_cache[apath] = (key, lines, None)
+    if key != _stat_key(path) or len(index.lines) != len(base_lines) or list(index.lines) != base_lines:
+        return None
+    return index
+
+def file_eol(path: str) -> str:
+    """Fin de ligne à restaurer à l'écriture de path: '\r\n' si sa dernière lecture l'a trouvé entièrement en CRLF, sinon '\n' (lignes écrites telles quelles); path->str."""
+    return _file_eol.get(os.path.abspath(path), "\n")
+
+@_instrumented("read")
 def read_file_lines(path: str) -> List[str]:
-    """Lire toutes les lignes d'un fichier en UTF-8; path->list[str]."""
-    with open(path, "r", encoding="utf-8") as f:
-        return f.readlines()
+    """Lire toutes les lignes d'un fichier en UTF-8 sans traduire les fins de ligne (depuis le cache si la version sur disque n'a pas changé); un fichier entièrement en CRLF est rendu en '\n' et noté pour file_eol, un fichier mixte est rendu tel quel; path->list[str]."""
+    if _line_cache is not None:
+        key = _stat_key(path)
+        hit = _line_cache.get(os.path.abspath(path))
+        if hit is not None and hit[0] == key:
+            _line_cache.move_to_end(os.path.abspath(path))
+            return list(hit[1])
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if _METRICS is not None:
+            _metrics_bytes("bytes_read", os.fstat(f.fileno()).st_size)
+        lines = f.readlines()
+    ended = [l for l in lines if l.endswith(("\n", "\r"))]
+    if ended and all(l.endswith("\r\n") for l in ended):
+        lines = [l[:-2] + "\n" if l.endswith("\r\n") else l for l in lines]
+        _file_eol[os.path.abspath(path)] = "\r\n"
+    else:
+        _file_eol.pop(os.path.abspath(path), None)
+    if _line_cache is not None and key is not None:
+        _remember_lines(path, lines)
+    return lines
+
+@_instrumented("write")
+def _stage_file(path: str, lines: List[str], eol: str = "\n") -> str:
+    """Écrire lines dans un fichier temporaire du même dossier que path (mode conservé) sans toucher path, chaque '\n' écrit en eol (voir file_eol); (path,lines,eol)->tmp_path."""
+    dir_name = os.path.dirname(path) or "."
+    os.makedirs(dir_name, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        if isinstance(lines, SplicedLines):
+            with os.fdopen(fd, "wb") as f:
+                lines.write_to(f)
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8", newline=eol) as f:
+                f.writelines(lines)
+        if _METRICS is not None:
+            _metrics_bytes("bytes_written", os.path.getsize(tmp_path))
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+    except BaseException:
+        _discard_staged(tmp_path)
+        raise
+    return tmp_path
+
+def _discard_staged(tmp_path: str) -> None:
+    """Supprimer un fichier temporaire de staging sans lever; path->None."""
+    try:
+        os.remove(tmp_path)
+    except Exception:
+        pass
+
+def write_file_atomic(path: str, lines: List[str], eol: str = "\n") -> None:
+    """Écrire lines dans path via fichier temporaire du même dossier + os.replace (mode et fin de ligne eol conservés); (path,lines,eol)->None."""
+    tmp_path = _stage_file(path, lines, eol)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard_staged(tmp_path)
+        raise
+    _remember_lines(path, lines)
 
 # ===== VALIDATION SYNTAXIQUE =====
-def _validate_python_syntax(file_path: str) -> bool:
-    """Vérifier que le fichier Python est syntaxiquement valide; path->bool."""
-    if not file_path.endswith(".py"):
+# Un vérificateur reçoit (path, content) et retourne None si valide, sinon (ligne 1-based|None, message).
+SyntaxIssue = Tuple[Optional[int], str]
+_VALIDATORS: Dict[str, Callable[[str, str], Optional[SyntaxIssue]]] = {}
+
+def register_validator(extensions: Iterable[str], checker: Callable[[str, str], Optional[SyntaxIssue]]) -> None:
+    """Enregistrer un vérificateur en mémoire pour une ou plusieurs extensions ('.tsx', ...); (exts,checker)->None."""
+    for ext in extensions:
+        _VALIDATORS[ext.lower()] = checker
+
+def _validator_for(file_path: str) -> Optional[Callable[[str, str], Optional[SyntaxIssue]]]:
+    """Retrouver le vérificateur associé à l'extension du fichier; path->checker|None."""
+    return _VALIDATORS.get(os.path.splitext(file_path)[1].lower())
+
+@_instrumented("validate")
+def _validate_content(file_path: str, content: str, base_lines: Optional[List[str]] = None) -> bool:
+    """Valider un contenu en mémoire via le registre; une erreur déjà présente dans base_lines (avant patch) n'est pas imputée au patch; (path,content,base?)->bool."""
+    checker = _validator_for(file_path)
+    if checker is None:
+        return True
+    issue = checker(file_path, content)
+    if issue is None:
+        return True
+    if base_lines and checker(file_path, "".join(base_lines)) is not None:
+        sys.stderr.write(f"[VALIDATION WARN] {file_path}: déjà invalide avant patch, erreur ignorée ({issue[1].splitlines()[0]})\n")
+        return True
+    line, msg = issue
+    sys.stderr.write(f"[SYNTAX ERROR] {file_path}:{line if line is not None else '?'}: {msg}\n")
+    return False
+
+def _validate_file(file_path: str, base_path: Optional[str] = None) -> bool:
+    """Relire le fichier sur disque et le valider, base_path (sauvegarde) servant de référence avant patch (mode compatibilité patch); (path,base?)->bool."""
+    if _validator_for(file_path) is None:
         return True
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             content = f.read()
-        compile(content, file_path, 'exec')
+        base_lines = read_file_lines(base_path) if base_path else None
+    except Exception as e:
+        sys.stderr.write(f"[VALIDATION WARN] {file_path}: {e}\n")
         return True
+    return _validate_content(file_path, content, base_lines)
+
+def _check_python(file_path: str, content: str) -> Optional[SyntaxIssue]:
+    """Compiler le module Python; (path,content)->issue|None."""
+    try:
+        compile(content, file_path, 'exec')
+        return None
     except SyntaxError as e:
-        sys.stderr.write(f"[SYNTAX ERROR] {file_path}:{e.lineno}: {e.msg}\n")
-        if e.text:
-            sys.stderr.write(f"  Ligne: {e.text.strip()}\n")
-        return False
+        msg = e.msg or "syntaxe invalide"
+        # e.text peut venir du fichier sur disque (linecache): relire la ligne depuis le contenu validé
+        src_lines = content.splitlines()
+        text = src_lines[e.lineno - 1] if e.lineno and 0 < e.lineno <= len(src_lines) else e.text
+        if text:
+            msg += f"\n  Ligne: {text.strip()}"
+        return e.lineno, msg
     except Exception as e:
         sys.stderr.write(f"[VALIDATION WARN] {file_path}: {e}\n")
+        return None
+
+def _validate_python_syntax(file_path: str, content: Optional[str] = None) -> bool:
+    """Vérifier que le fichier Python (ou son contenu en mémoire) est syntaxiquement valide; (path,content?)->bool."""
+    if not file_path.endswith(".py"):
         return True
+    if content is None:
+        return _validate_file(file_path)
+    return _validate_content(file_path, content)
+
+def _strip_jsonc(content: str) -> str:
+    """Retirer commentaires // et /* */ et virgules finales hors chaînes (tsconfig & co.); s->str."""
+    out: List[str] = []
+    i, n = 0, len(content)
+    while i < n:
+        c = content[i]
+        if c == '"':
+            j = i + 1
+            while j < n and content[j] != '"':
+                j += 2 if content[j] == "\\" else 1
+            out.append(content[i:j + 1])
+            i = j + 1
+        elif content.startswith("//", i):
+            j = content.find("\n", i)
+            i = n if j < 0 else j
+        elif content.startswith("/*", i):
+            j = content.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+        else:
+            out.append(c)
+            i += 1
+    return re.sub(r",(\s*[}\]])", r"\1", "".join(out))
+
+def _check_json(file_path: str, content: str) -> Optional[SyntaxIssue]:
+    """Parser réellement le JSON (JSONC toléré pour tsconfig*/jsconfig*); (path,content)->issue|None."""
+    base = os.path.basename(file_path).lower()
+    if base.startswith(("tsconfig", "jsconfig")):
+        content = _strip_jsonc(content)
+    try:
+        json.loads(content)
+        return None
+    except json.JSONDecodeError as e:
+        return e.lineno, f"JSON invalide: {e.msg} (colonne {e.colno})"
+
+class _ScanError(Exception):
+    """Erreur de structure détectée par un scanner rapide (position dans le texte)."""
+    def __init__(self, pos: int, msg: str) -> None:
+        super().__init__(msg)
+        self.pos = pos
+        self.msg = msg
+
+class _JsxAbort(Exception):
+    """Le '<' rencontré n'ouvre pas un élément JSX (générique, comparaison): revenir au mode code."""
+
+_JS_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_JS_CLOSERS = {")": "(", "]": "[", "}": "{"}
+_JS_EXPR_KEYWORDS = frozenset(("return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void",
+                               "throw", "instanceof", "yield", "await", "default", "extends"))
+_JS_IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+# '(' d'en-tête if/while/for/with: après son ')' commence une instruction, donc un '/' y ouvre une regex
+_JS_HEADER_RE = re.compile(r"(?:^|[^\w$.])(?:if|while|with|for(?:\s+await)?)\s*$")
+_JSX_NAME_RE = re.compile(r"[A-Za-z_$][\w$.:-]*")
+_JSX_ATTR_RE = re.compile(r"[A-Za-z_$][\w$:-]*")
+
+class _JsScanner:
+    """Scanner rapide TS/TSX/JS: équilibre des (), [], {}, chaînes, templates, commentaires, regex et (si jsx) balises JSX."""
+
+    def __init__(self, text: str, jsx: bool) -> None:
+        self.s = text
+        self.n = len(text)
+        self.jsx = jsx
+
+    def run(self) -> None:
+        """Scanner tout le texte; lève _ScanError à la première incohérence."""
+        self.code(0, None)
+
+    def _skip_string(self, i: int) -> int:
+        """Sauter une chaîne '...' ou "..." ouverte en i; retourne l'index après la fermeture."""
+        s, n, q = self.s, self.n, self.s[i]
+        j = i + 1
+        while j < n:
+            c = s[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == q:
+                return j + 1
+            if c == "\n":
+                break
+            j += 1
+        raise _ScanError(i, f"chaîne {q}...{q} non terminée")
+
+    def _skip_template(self, i: int) -> int:
+        """Sauter un template `...${expr}...` ouvert en i; retourne l'index après le '`' final."""
+        s, n = self.s, self.n
+        j = i + 1
+        while j < n:
+            c = s[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "`":
+                return j + 1
+            if c == "$" and j + 1 < n and s[j + 1] == "{":
+                j = self.code(j + 2, j + 1)
+                continue
+            j += 1
+        raise _ScanError(i, "template literal ` non terminé")
+
+    def _skip_regex(self, i: int) -> Optional[int]:
+        """Sauter une regex littérale /.../flags ouverte en i; None si ce n'en est pas une (fin de ligne atteinte)."""
+        s, n = self.s, self.n
+        j = i + 1
+        in_class = False
+        while j < n:
+            c = s[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "\n":
+                return None
+            if in_class:
+                if c == "]":
+                    in_class = False
+            elif c == "[":
+                in_class = True
+            elif c == "/":
+                j += 1
+                while j < n and (s[j].isalnum() or s[j] == "_"):
+                    j += 1
+                return j
+            j += 1
+        return None
+
+    def code(self, i: int, brace_pos: Optional[int]) -> int:
+        """Scanner du code depuis i; si brace_pos, s'arrêter sur le '}' fermant ce '{' et retourner l'index suivant."""
+        s, n = self.s, self.n
+        stack: List[Tuple[str, int]] = []
+        headers: Set[int] = set()
+        expr = True
+        while i < n:
+            c = s[i]
+            if c in " \t\r\n":
+                i += 1
+                continue
+            if c == "/" and i + 1 < n and s[i + 1] == "/":
+                j = s.find("\n", i)
+                i = n if j < 0 else j
+                continue
+            if c == "/" and i + 1 < n and s[i + 1] == "*":
+                j = s.find("*/", i + 2)
+                if j < 0:
+                    raise _ScanError(i, "commentaire /* non fermé")
+                i = j + 2
+                continue
+            if c in "'\"":
+                i = self._skip_string(i)
+                expr = False
+                continue
+            if c == "`":
+                i = self._skip_template(i)
+                expr = False
+                continue
+            if c == "/" and expr:
+                j = self._skip_regex(i)
+                if j is not None:
+                    i = j
+                    expr = False
+                    continue
+            if c in _JS_OPENERS:
+                stack.append((c, i))
+                if c == "(" and _JS_HEADER_RE.search(s, max(0, i - 16), i):
+                    headers.add(i)
+                i += 1
+                expr = True
+                continue
+            if c in _JS_CLOSERS:
+                if not stack:
+                    if c == "}" and brace_pos is not None:
+                        return i + 1
+                    raise _ScanError(i, f"'{c}' sans ouverture correspondante")
+                op, op_pos = stack.pop()
+                if _JS_OPENERS[op] != c:
+                    raise _ScanError(i, f"'{c}' ferme '{op}' ouvert ligne {self.line_of(op_pos)}")
+                i += 1
+                expr = op_pos in headers
+                continue
+            if c == "<" and expr and self.jsx:
+                try:
+                    i = self.jsx_element(i)
+                    expr = False
+                    continue
+                except _JsxAbort:
+                    pass
+            m = _JS_IDENT_RE.match(s, i)
+            if m:
+                expr = m.group(0) in _JS_EXPR_KEYWORDS
+                i = m.end()
+                continue
+            if c.isdigit() or (c == "." and i + 1 < n and s[i + 1].isdigit()):
+                i += 1
+                while i < n and (s[i].isalnum() or s[i] in "._"):
+                    i += 1
+                expr = False
+                continue
+            if c == "=" and i + 1 < n and s[i + 1] == ">":
+                i += 2
+                expr = True
+                continue
+            i += 1
+            expr = c not in ".#"
+        if stack:
+            op, op_pos = stack[-1]
+            raise _ScanError(op_pos, f"'{op}' non fermé")
+        if brace_pos is not None:
+            raise _ScanError(brace_pos, "'{' non fermé")
+        return i
+
+    def _skip_ws(self, i: int) -> int:
+        """Sauter blancs et commentaires dans une balise JSX."""
+        s, n = self.s, self.n
+        while i < n:
+            if s[i] in " \t\r\n":
+                i += 1
+            elif s.startswith("//", i):
+                j = s.find("\n", i)
+                i = n if j < 0 else j
+            elif s.startswith("/*", i):
+                j = s.find("*/", i + 2)
+                if j < 0:
+                    raise _JsxAbort()
+                i = j + 2
+            else:
+                break
+        return i
+
+    def jsx_element(self, i: int) -> int:
+        """Scanner un élément JSX ouvert par '<' en i (balise, attributs, enfants, fermeture); _JsxAbort si ce n'est pas du JSX."""
+        s, n = self.s, self.n
+        j = i + 1
+        name = ""
+        if j < n and s[j] != ">":
+            m = _JSX_NAME_RE.match(s, j)
+            if not m:
+                raise _JsxAbort()
+            name = m.group(0)
+            j = m.end()
+            k = self._skip_ws(j)
+            # Génériques TSX: <T,>(...) / <T extends X>(...) / <T>(...)
+            if k < n and s[k] == ",":
+                raise _JsxAbort()
+            if s.startswith("extends", k) and k > j:
+                raise _JsxAbort()
+            if k < n and s[k] == ">" and len(name) == 1 and name.isupper() and k + 1 < n and s[k + 1] == "(":
+                raise _JsxAbort()
+            # attributs
+            while True:
+                j = self._skip_ws(j)
+                if j >= n:
+                    raise _JsxAbort()
+                c = s[j]
+                if c == ">" or s.startswith("/>", j):
+                    break
+                if c == "{":
+                    j = self.code(j + 1, j)
+                    continue
+                m = _JSX_ATTR_RE.match(s, j)
+                if not m:
+                    raise _JsxAbort()
+                j = self._skip_ws(m.end())
+                if j < n and s[j] == "=":
+                    j = self._skip_ws(j + 1)
+                    if j >= n:
+                        raise _JsxAbort()
+                    if s[j] in "'\"":
+                        k = s.find(s[j], j + 1)
+                        if k < 0:
+                            raise _ScanError(j, f"attribut JSX {s[j]}...{s[j]} non terminé")
+                        j = k + 1
+                    elif s[j] == "{":
+                        j = self.code(j + 1, j)
+                    elif s[j] == "<":
+                        j = self.jsx_element(j)
+                    else:
+                        raise _JsxAbort()
+            if s.startswith("/>", j):
+                return j + 2
+        j += 1
+        # enfants
+        while j < n:
+            c = s[j]
+            if c == "{":
+                j = self.code(j + 1, j)
+                continue
+            if c == "<":
+                if s.startswith("</", j):
+                    k = self._skip_ws(j + 2)
+                    m = _JSX_NAME_RE.match(s, k)
+                    close = m.group(0) if m else ""
+                    k = self._skip_ws(m.end() if m else k)
+                    if k >= n or s[k] != ">":
+                        raise _ScanError(j, "balise JSX fermante mal formée")
+                    if close != name:
+                        expected = f"</{name}>" if name else "</>"
+                        raise _ScanError(j, f"</{close}> ferme {expected} ouvert ligne {self.line_of(i)}")
+                    return k + 1
+                try:
+                    j = self.jsx_element(j)
+                except _JsxAbort:
+                    raise _ScanError(j, "'<' inattendu dans le contenu JSX")
+                continue
+            j += 1
+        raise _ScanError(i, f"<{name}> non fermé")
+
+    def line_of(self, pos: int) -> int:
+        """Numéro de ligne 1-based d'une position."""
+        return self.s.count("\n", 0, pos) + 1
+
+def _check_js_like(file_path: str, content: str) -> Optional[SyntaxIssue]:
+    """Vérifier l'équilibre brackets/chaînes/templates/commentaires (+ balises JSX pour .tsx/.jsx); (path,content)->issue|None."""
+    scanner = _JsScanner(content, jsx=file_path.lower().endswith((".tsx", ".jsx")))
+    try:
+        scanner.run()
+    except _ScanError as e:
+        return scanner.line_of(e.pos), e.msg
+    except RecursionError:
+        return None
+    return None
+
+def _check_css(file_path: str, content: str) -> Optional[SyntaxIssue]:
+    """Vérifier l'équilibre {}, (), [], chaînes et commentaires CSS; (path,content)->issue|None."""
+    stack: List[Tuple[str, int]] = []
+    s, n, i = content, len(content), 0
+    line_of = lambda pos: s.count("\n", 0, pos) + 1
+    while i < n:
+        c = s[i]
+        if s.startswith("/*", i):
+            j = s.find("*/", i + 2)
+            if j < 0:
+                return line_of(i), "commentaire /* non fermé"
+            i = j + 2
+            continue
+        if c in "'\"":
+            j = i + 1
+            while j < n and s[j] != c and s[j] != "\n":
+                j += 2 if s[j] == "\\" else 1
+            if j >= n or s[j] != c:
+                return line_of(i), f"chaîne {c}...{c} non terminée"
+            i = j + 1
+            continue
+        if c in _JS_OPENERS:
+            stack.append((c, i))
+        elif c in _JS_CLOSERS:
+            if not stack:
+                return line_of(i), f"'{c}' sans ouverture correspondante"
+            op, op_pos = stack.pop()
+            if _JS_OPENERS[op] != c:
+                return line_of(i), f"'{c}' ferme '{op}' ouvert ligne {line_of(op_pos)}"
+        i += 1
+    if stack:
+        op, op_pos = stack[-1]
+        return line_of(op_pos), f"'{op}' non fermé"
+    return None
+
+register_validator([".py"], _check_python)
+register_validator([".json"], _check_json)
+register_validator([".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".mts", ".cts"], _check_js_like)
+register_validator([".css"], _check_css)
 
 # ===== NORMALISATION DES CHEMINS =====
 def normalize_old_path(header_path: str) -> str:
@@ -89,50 +836,44 @@ def _parse_hunk_start_pair(raw_header: str) -> Tuple[Optional[int], Optional[int
     return None, None
 
 # ===== PARSING DU DIFF EN ENTREE =====
-def parse_diff(stdin_lines: List[str]) -> List[Dict]:
-    """Parser un diff souple en [{old,new,hunks:[{raw_header,old_start,new_start,lines[]}]}]; lines->struct."""
-    files: List[Dict] = []
-    cur: Optional[Dict] = None
-    i = 0
+def _hdr_path(s: str) -> Optional[str]:
+    """Extraire le chemin d'un entête '---' ou '***'; s->str|None."""
+    m = re.match(r"(?:---|\*\*\*)\s+([^\t\r\n]+)", (s or ""))
+    return m.group(1).strip() if m else None
 
-    def _hdr_path(s: str) -> Optional[str]:
-        m = re.match(r"(?:---|\*\*\*)\s+([^\t\r\n]+)", (s or ""))
-        return m.group(1).strip() if m else None
+def iter_parse_diff(stdin_lines: Iterable[str]) -> Iterator[Dict]:
+    """Parser en flux un diff souple: génère chaque {old,new,hunks:[{raw_header,old_start,new_start,lines[]}]} dès que l'entête suivant (ou EOF) le termine; lines->iter[struct]."""
+    cur: Optional[Dict] = None
+    hunk_lines: Optional[List[str]] = None
+    header_pending = False
+    path_old: Optional[str] = None
 
-    while i < len(stdin_lines):
-        line = stdin_lines[i]
+    for line in stdin_lines:
+        if header_pending:
+            header_pending = False
+            if line.startswith("+++ "):
+                m_new = re.match(r"\+\+\+\s+([^\t\r\n]+)", line)
+                path_new = (m_new.group(1).strip() if m_new else (path_old or ""))
+                cur = {"old": path_old or "", "new": path_new or "", "hunks": []}
+                continue
+            if line.startswith(("--- ", "*** ")):
+                path2 = _hdr_path(line)
+                cur = {"old": path_old or "", "new": path2 or path_old or "", "hunks": []}
+                continue
+            cur = {"old": path_old or "", "new": path_old or "", "hunks": []}
 
         if line.startswith(("--- ", "*** ")):
+            if cur is not None:
+                yield cur
+                cur = None
+            hunk_lines = None
             path_old = _hdr_path(line)
-            path_new = None
-            j = i + 1
-
-            if j < len(stdin_lines) and stdin_lines[j].startswith("+++ "):
-                m_new = re.match(r"\+\+\+\s+([^\t\r\n]+)", stdin_lines[j])
-                path_new = (m_new.group(1).strip() if m_new else (path_old or ""))
-                i = j + 1
-            elif j < len(stdin_lines) and stdin_lines[j].startswith(("--- ", "*** ")):
-                path2 = _hdr_path(stdin_lines[j])
-                path_new = path2 or path_old or ""
-                i = j + 1
-            else:
-                path_new = path_old or ""
-                i = j
-
-            cur = {"old": path_old or "", "new": path_new or "", "hunks": []}
-            files.append(cur)
+            header_pending = True
             continue
 
         if cur is not None and line.startswith("@@"):
             hunk_header = line.rstrip("\n")
-            hunk_lines: List[str] = []
-            i += 1
-            while i < len(stdin_lines):
-                l2 = stdin_lines[i]
-                if l2.startswith("@@") or l2.startswith(("--- ", "*** ")):
-                    break
-                hunk_lines.append(l2)
-                i += 1
+            hunk_lines = []
             old_s, new_s = _parse_hunk_start_pair(hunk_header)
             cur["hunks"].append({
                 "raw_header": hunk_header,
@@ -142,21 +883,33 @@ def parse_diff(stdin_lines: List[str]) -> List[Dict]:
             })
             continue
 
-        i += 1
+        if hunk_lines is not None:
+            hunk_lines.append(line)
+
+    if header_pending:
+        cur = {"old": path_old or "", "new": path_old or "", "hunks": []}
+    if cur is not None:
+        yield cur
 
-    return files
+@_instrumented("parse")
+def parse_diff(stdin_lines: List[str]) -> List[Dict]:
+    """Parser un diff souple en [{old,new,hunks:[{raw_header,old_start,new_start,lines[]}]}]; lines->struct."""
+    return list(iter_parse_diff(stdin_lines))
 
 # ===== NETTOYAGE /dev/null =====
+def _normalize_devnull_entry(fe: Dict) -> Dict:
+    """Si old==/dev/null, remplacer old par new et marquer is_creation; entry->entry."""
+    old_hdr = (fe.get("old") or "").strip()
+    new_hdr = (fe.get("new") or "").strip()
+    if old_hdr and new_hdr and old_hdr.endswith("/dev/null"):
+        fe["old"] = new_hdr
+        fe["is_creation"] = True
+    return fe
+
 def _normalize_devnull_headers(files: List[Dict]) -> None:
     """Si old==/dev/null, remplacer old par new et marquer is_creation; files->None."""
     for fe in files:
-        old_hdr = (fe.get("old") or "").strip()
-        new_hdr = (fe.get("new") or "").strip()
-        if not old_hdr or not new_hdr:
-            continue
-        if old_hdr.endswith("/dev/null"):
-            fe["old"] = new_hdr
-            fe["is_creation"] = True
+        _normalize_devnull_entry(fe)
 
 # ===== FIX #18: DÉCODAGE ÉCHAPPEMENT DOUBLE PRÉFIXE =====
 def _decode_diff_line(line: str) -> Tuple[str, str]:
@@ -189,9 +942,13 @@ def _decode_diff_line(line: str) -> Tuple[str, str]:
         return "", line
 
 # ===== OUTILS SUR HUNKS =====
-def split_groups_with_context(hunk: Dict) -> List[Tuple[List[str], List[str], List[str], List[str]]]:
-    """Découper un hunk en groupes séquentiels (context_before, minus, plus, context_after); FIX #12/#19: flush quand contexte sépare deux blocs +; FIX #18: support échappement double préfixe; hunk->list tuples."""
+def split_groups_with_context(hunk: Dict, pivots: Optional[List[Optional[int]]] = None) -> List[Tuple[List[str], List[str], List[str], List[str]]]:
+    """Découper un hunk en groupes séquentiels (context_before, minus, plus, context_after); FIX #12/#19: flush quand contexte sépare deux blocs +; FIX #18: support échappement double préfixe; FIX #35: si pivots est fourni, y ajouter pour chaque groupe la ligne (0-based, ancien fichier) de sa première ligne -/+ d'après l'entête @@; (hunk,pivots?)->list tuples."""
     lines: List[str] = hunk.get("lines") or []
+    base = hunk.get("old_start")
+    base0 = max(0, base - 1) if base is not None else None
+    old_pos = 0
+    cur_pivot: Optional[int] = None
 
     groups: List[Tuple[List[str], List[str], List[str], List[str]]] = []
     cur_context_before: List[str] = []
@@ -200,13 +957,16 @@ def split_groups_with_context(hunk: Dict) -> List[Tuple[List[str], List[str], Li
     cur_context_after: List[str] = []
 
     def flush():
-        nonlocal cur_context_before, cur_minus, cur_plus, cur_context_after
+        nonlocal cur_context_before, cur_minus, cur_plus, cur_context_after, cur_pivot
         if cur_minus or cur_plus:
             groups.append((cur_context_before.copy(), cur_minus, cur_plus, cur_context_after.copy()))
+            if pivots is not None:
+                pivots.append(base0 + cur_pivot if base0 is not None and cur_pivot is not None else None)
             cur_context_before = cur_context_after.copy()
             cur_context_after = []
         cur_minus = []
         cur_plus = []
+        cur_pivot = None
 
     for l in lines:
         line_type, content = _decode_diff_line(l)
@@ -219,13 +979,17 @@ def split_groups_with_context(hunk: Dict) -> List[Tuple[List[str], List[str], Li
                     cur_context_before = cur_context_after.copy()
                     cur_context_after = []
                 cur_context_before.append(content)
+            old_pos += 1
         elif line_type == "-":
             if cur_context_after and not cur_minus and not cur_plus:
                 cur_context_before = cur_context_after.copy()
                 cur_context_after = []
             elif cur_plus:
                 flush()
+            if not cur_minus and not cur_plus:
+                cur_pivot = old_pos
             cur_minus.append(content)
+            old_pos += 1
         elif line_type == "+":
             # FIX #19: Si on a du contexte après un bloc + et qu'on rencontre un nouveau +, flush d'abord
             if cur_context_after:
@@ -235,11 +999,14 @@ def split_groups_with_context(hunk: Dict) -> List[Tuple[List[str], List[str], Li
                 else:
                     cur_context_before = cur_context_after.copy()
                     cur_context_after = []
+            if not cur_minus and not cur_plus:
+                cur_pivot = old_pos
             cur_plus.append(content)
         else:
             # Ligne non reconnue, traiter comme contexte
             flush()
             cur_context_before.append(l)
+            old_pos += 1
 
     flush()
     return groups
@@ -259,41 +1026,73 @@ def _is_noop_group_fuzzy(g_minus: List[str], g_plus: List[str]) -> bool:
         return True
     if len(g_minus) != len(g_plus):
         return False
-    for m, p in zip(g_minus, g_plus):
-        if m.strip() != p.strip():
-            return False
-    return True
+    return all(m.strip() == p.strip() for m, p in zip(g_minus, g_plus))
 
 # ===== DÉTECTION ET DIVISION DES DÉPLACEMENTS =====
+MOVE_SIMILARITY = 0.5  # part de lignes appariées (au whitespace de bord près) à partir de laquelle -/+ est un déplacement
+
 def _lines_similarity(lines_a: List[str], lines_b: List[str]) -> float:
-    """Calculer le ratio d'intersection entre deux listes de lignes; (a,b)->float 0..1."""
-    if not lines_a or not lines_b:
-        return 0.0
-    set_a = set(l.strip() for l in lines_a if l.strip())
-    set_b = set(l.strip() for l in lines_b if l.strip())
-    if not set_a or not set_b:
+    """FIX #41: Part des lignes non vides (strip) de a et b appariées une à une, dans l'ordre, par le diff de lignes (identité de ligne, pas recouvrement d'ensembles); (a,b)->float 0..1."""
+    keys_a = [k for k in map(str.strip, lines_a) if k]
+    keys_b = [k for k in map(str.strip, lines_b) if k]
+    if not keys_a or not keys_b:
         return 0.0
-    intersection = len(set_a & set_b)
-    union = len(set_a | set_b)
-    return intersection / union if union > 0 else 0.0
+    matched = sum(i2 - i1 for tag, i1, i2, _, _ in line_opcodes(keys_a, keys_b) if tag == "equal")
+    return matched / max(len(keys_a), len(keys_b))
+
+def _split_if_moved(group: Tuple[List[str], List[str], List[str], List[str]], pivot: Optional[int]) -> List[Tuple[Tuple[List[str], List[str], List[str], List[str]], Optional[int]]]:
+    """Diviser un groupe de déplacement/ré-indentation (g_minus ≈ g_plus) en suppression puis insertion, sinon le garder; (group,pivot)->[(group, pivot)]."""
+    ctx_before, g_minus, g_plus, ctx_after = group
+    if g_minus and g_plus and _lines_similarity(g_minus, g_plus) >= MOVE_SIMILARITY:
+        return [((ctx_before, g_minus, [], []), pivot),
+                (([], [], g_plus, ctx_after), pivot + len(g_minus) if pivot is not None else None)]
+    return [(group, pivot)]
+
+def _refine_group(group: Tuple[List[str], List[str], List[str], List[str]], pivot: Optional[int]) -> List[Tuple[Tuple[List[str], List[str], List[str], List[str]], Optional[int]]]:
+    """FIX #41: Découper un remplacement en sous-éditions minimales d'après le diff de lignes de g_minus vers g_plus, aux lignes inchangées portant au moins un mot; contexte avant = lignes déjà à jour, contexte après = lignes inchangées jusqu'à la sous-édition suivante (verdict 'déjà appliqué' intact); (group,pivot)->[(group, pivot)]."""
+    ctx_before, g_minus, g_plus, ctx_after = group
+    if not g_minus or not g_plus:
+        return [(group, pivot)]
+    ops = line_opcodes(g_minus, g_plus)
+    # Régions modifiées [i1, i2, j1, j2], fusionnées à travers les lignes inchangées sans mot (vides, accolades)
+    regions: List[List[int]] = []
+    for tag, i1, i2, j1, j2 in ops:
+        if tag != "equal":
+            regions.append([i1, i2, j1, j2])
+        elif regions and not any(_line_words(l.strip()) for l in g_minus[i1:i2]) and i2 < len(g_minus):
+            regions[-1][1], regions[-1][3] = i2, j2
+    merged: List[List[int]] = []
+    for r in regions:
+        if merged and merged[-1][1] == r[0]:
+            merged[-1][1], merged[-1][3] = r[1], r[3]
+        else:
+            merged.append(r)
+    if len(merged) == 1 and merged[0] == [0, len(g_minus), 0, len(g_plus)]:
+        return _split_if_moved(group, pivot)
+    out: List[Tuple[Tuple[List[str], List[str], List[str], List[str]], Optional[int]]] = []
+    for k, (i1, i2, j1, j2) in enumerate(merged):
+        before = ctx_before + g_plus[:j1]
+        after = g_minus[i2:merged[k + 1][0]] if k + 1 < len(merged) else g_minus[i2:] + ctx_after
+        out += _split_if_moved((before, g_minus[i1:i2], g_plus[j1:j2], after), pivot + i1 if pivot is not None else None)
+    return out
 
-def _split_move_groups(groups: List[Tuple[List[str], List[str], List[str], List[str]]]) -> List[Tuple[List[str], List[str], List[str], List[str]]]:
-    """Pré-diviser les groupes de déplacement (g_minus ≈ g_plus) en 2 passes: suppression puis insertion; groups->groups_expanded."""
+def _split_move_groups(groups: List[Tuple[List[str], List[str], List[str], List[str]]], pivots: Optional[List[Optional[int]]] = None) -> List[Tuple[List[str], List[str], List[str], List[str]]]:
+    """Affiner chaque groupe en sous-éditions minimales (diff de lignes) et pré-diviser les déplacements (g_minus ≈ g_plus) en 2 passes: suppression puis insertion (pivots, si fournis, remplacés par ceux des groupes obtenus); (groups,pivots?)->groups_expanded."""
     result: List[Tuple[List[str], List[str], List[str], List[str]]] = []
+    out_pivots: List[Optional[int]] = []
     
-    for ctx_before, g_minus, g_plus, ctx_after in groups:
-        if _is_noop_group(g_minus, g_plus):
-            result.append((ctx_before, g_minus, g_plus, ctx_after))
+    for gi, group in enumerate(groups):
+        pivot = pivots[gi] if pivots is not None else None
+        if _is_noop_group(group[1], group[2]):
+            result.append(group)
+            out_pivots.append(pivot)
             continue
-        
-        if g_minus and g_plus:
-            similarity = _lines_similarity(g_minus, g_plus)
-            if similarity >= 0.5:
-                result.append((ctx_before, g_minus, [], []))
-                result.append(([], [], g_plus, ctx_after))
-                continue
-        result.append((ctx_before, g_minus, g_plus, ctx_after))
+        for sub, sub_pivot in _refine_group(group, pivot):
+            result.append(sub)
+            out_pivots.append(sub_pivot)
     
+    if pivots is not None:
+        pivots[:] = out_pivots
     return result
 
 # ===== FIX #14: NORMALISATION WHITESPACE =====
@@ -310,11 +1109,19 @@ def _lines_match_fuzzy(haystack_lines: List[str], needle_lines: List[str]) -> bo
             return False
     return True
 
+def _indent_width(line: str) -> int:
+    """Largeur du whitespace de début d'une ligne; line->int."""
+    return len(line) - len(line.lstrip())
+
 def _compute_indent_delta(haystack_line: str, needle_line: str) -> int:
     """Calculer la différence d'indentation entre deux lignes; (h,n)->int (positif si haystack plus indenté)."""
-    h_indent = len(haystack_line) - len(haystack_line.lstrip())
-    n_indent = len(needle_line) - len(needle_line.lstrip())
-    return h_indent - n_indent
+    return _indent_width(haystack_line) - _indent_width(needle_line)
+
+def _indent_delta_at(old_lines: List[str], pos: int, needle_line: str, index: Optional["LineIndex"] = None) -> int:
+    """_compute_indent_delta(old_lines[pos], needle_line), largeur côté fichier lue dans l'index si fourni; (lines,pos,ligne,index?)->int."""
+    if index is not None:
+        return index.indent[pos] - _indent_width(needle_line)
+    return _compute_indent_delta(old_lines[pos], needle_line)
 
 def _adjust_lines_indent(lines: List[str], delta: int) -> List[str]:
     """Ajuster l'indentation de toutes les lignes; (lines,delta)->lines."""
@@ -323,32 +1130,331 @@ def _adjust_lines_indent(lines: List[str], delta: int) -> List[str]:
         if delta > 0:
             result.append(" " * delta + l)
         elif delta < 0:
-            current_indent = len(l) - len(l.lstrip())
-            remove = min(current_indent, -delta)
+            remove = min(_indent_width(l), -delta)
             result.append(l[remove:])
         else:
             result.append(l)
     return result
 
+# ===== INDEX DE LIGNES (HASH + EMPREINTE ROULANTE) =====
+_RH_MOD = (1 << 61) - 1
+_RH_BASE = 1000003
+
+# FIX #38: enregistrement par ligne calculé une fois par version de fichier, en colonnes parallèles de chaque bloc
+_RECORD_COLUMNS = ("lines", "norm", "hnorm", "indent")
+
+def _line_records(lines: List[str]) -> Tuple[List[str], List[int], List[int]]:
+    """Colonnes d'enregistrement de lignes: forme normalisée, son empreinte, largeur d'indentation; lines->(norm,hnorm,indent)."""
+    norm = [_normalize_line_whitespace(l) for l in lines]
+    return norm, [hash(nl) % _RH_MOD for nl in norm], [len(l) - len(nl) for l, nl in zip(lines, norm)]
+
+# FIX #37: lignes rangées par blocs (LINE_CHUNK lignes visées, 2*LINE_CHUNK au plus); les positions de l'index sont
+# codées (uid du bloc << _OFF_BITS | rang dans le bloc) et ne bougent donc pas quand un splice décale la suite du fichier
+LINE_CHUNK = 128
+_OFF_BITS = 16
+_OFF_MASK = (1 << _OFF_BITS) - 1
+
+class _LineChunk:
+    """Bloc de lignes contiguës: lignes et leurs enregistrements (_RECORD_COLUMNS) + préfixes d'empreinte roulante (paresseux)."""
+    __slots__ = ("uid", "lines", "norm", "hnorm", "indent", "prefix")
+
+    def __init__(self, uid: int, lines: List[str], norm: List[str], hnorm: List[int], indent: List[int]) -> None:
+        self.uid = uid
+        self.lines = lines
+        self.norm = norm
+        self.hnorm = hnorm
+        self.indent = indent
+        self.prefix: List[int] = [0]
+
+class _ChunkColumn(collections.abc.Sequence):
+    """Vue séquence en lecture d'une colonne ('lines', 'norm', 'indent') des blocs d'un LineIndex; int|slice->str|list."""
+    __slots__ = ("_index", "_attr")
+
+    def __init__(self, index: "LineIndex", attr: str) -> None:
+        self._index = index
+        self._attr = attr
+
+    def __len__(self) -> int:
+        return self._index._len
+
+    def __getitem__(self, i):
+        idx = self._index
+        if isinstance(i, slice):
+            a, b, step = i.indices(idx._len)
+            if step != 1:
+                return [self[k] for k in range(a, b, step)]
+            return idx._gather(self._attr, a, b)
+        if i < 0:
+            i += idx._len
+        if not 0 <= i < idx._len:
+            raise IndexError(i)
+        k = bisect.bisect_right(idx._starts, i) - 1
+        return getattr(idx._chunks[k], self._attr)[i - idx._starts[k]]
+
+    def __iter__(self) -> Iterator:
+        for ch in self._index._chunks:
+            yield from getattr(ch, self._attr)
+
+class LineIndex:
+    """Index par fichier: lignes rangées par blocs (splice en O(taille d'un bloc + nombre de blocs) au lieu de décaler tout le fichier), positions par ligne exacte et normalisée (lstrip) + empreinte roulante des fenêtres; construit une fois, mis à jour par splice(), partagé par les recherches exactes et tolérantes; lines/norm/indent sont des vues séquence."""
+    __slots__ = ("lines", "norm", "indent", "pos_exact", "pos_norm", "_chunks", "_starts", "_order", "_len", "_next_uid", "_pow")
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        lines = list(lines)
+        self.pos_exact: Dict[str, List[int]] = {}
+        self.pos_norm: Dict[str, List[int]] = {}
+        self._chunks: List[_LineChunk] = []
+        self._next_uid = 0
+        self._pow: List[int] = [1]
+        for a in range(0, len(lines), LINE_CHUNK):
+            ch = self._new_chunk(lines[a:a + LINE_CHUNK])
+            self._chunks.append(ch)
+            self._index_chunk(ch, 0, append=True)
+        self._refresh()
+        self.lines = _ChunkColumn(self, "lines")
+        self.norm = _ChunkColumn(self, "norm")
+        self.indent = _ChunkColumn(self, "indent")
+
+    # --- blocs ---
+    def _new_chunk(self, lines: List[str], *records: List) -> _LineChunk:
+        """Créer un bloc (uid neuf, plus grand que tous les précédents), enregistrements calculés s'ils ne sont pas fournis; (lines,norm?,hnorm?,indent?)->_LineChunk."""
+        ch = _LineChunk(self._next_uid, lines, *(records or _line_records(lines)))
+        self._next_uid += 1
+        return ch
+
+    def _refresh(self) -> None:
+        """Recalculer débuts des blocs, rang par uid et longueur totale; ->None."""
+        starts: List[int] = []
+        n = 0
+        for ch in self._chunks:
+            starts.append(n)
+            n += len(ch.lines)
+        self._starts = starts
+        self._order = {ch.uid: k for k, ch in enumerate(self._chunks)}
+        self._len = n
+
+    def _gather(self, attr: str, a: int, b: int) -> list:
+        """Colonne attr des lignes [a, b) (bornes déjà valides); (attr,a,b)->list."""
+        if a >= b:
+            return []
+        k = bisect.bisect_right(self._starts, a) - 1
+        off = a - self._starts[k]
+        first = getattr(self._chunks[k], attr)
+        if off + (b - a) <= len(first):
+            return first[off:off + b - a]
+        out = first[off:]
+        while len(out) < b - a:
+            k += 1
+            out += getattr(self._chunks[k], attr)[:b - a - len(out)]
+        return out
+
+    def _index_chunk(self, ch: _LineChunk, lo: int, hi: Optional[int] = None, append: bool = False) -> None:
+        """Ajouter aux positions les lignes du bloc de rang [lo, hi) (append: uid plus grand que tous ceux indexés); (bloc,lo,hi?,append)->None."""
+        base = ch.uid << _OFF_BITS
+        pos_exact, pos_norm = self.pos_exact, self.pos_norm
+        for off in range(lo, len(ch.lines) if hi is None else hi):
+            code = base | off
+            if append:
+                pos_exact.setdefault(ch.lines[off], []).append(code)
+                pos_norm.setdefault(ch.norm[off], []).append(code)
+            else:
+                bisect.insort(pos_exact.setdefault(ch.lines[off], []), code)
+                bisect.insort(pos_norm.setdefault(ch.norm[off], []), code)
+
+    def _unindex_chunk(self, ch: _LineChunk, lo: int, hi: Optional[int] = None) -> None:
+        """Retirer des positions les lignes du bloc de rang [lo, hi); (bloc,lo,hi?)->None."""
+        base = ch.uid << _OFF_BITS
+        for off in range(lo, len(ch.lines) if hi is None else hi):
+            self._drop_pos(self.pos_exact, ch.lines[off], base | off)
+            self._drop_pos(self.pos_norm, ch.norm[off], base | off)
+
+    def _positions(self, codes: List[int]) -> List[int]:
+        """Positions courantes (triées) de positions codées; codes->list[int]."""
+        order, starts = self._order, self._starts
+        return sorted(starts[order[c >> _OFF_BITS]] + (c & _OFF_MASK) for c in codes)
+
+    def norm_positions(self, norm_line: str) -> List[int]:
+        """Positions courantes des lignes dont la forme normalisée vaut norm_line; str->list[int] triée."""
+        codes = self.pos_norm.get(norm_line)
+        return self._positions(codes) if codes else []
+
+    # --- empreinte roulante (préfixes par bloc calculés paresseusement) ---
+    @staticmethod
+    def _ensure_prefix(ch: _LineChunk, upto: int) -> None:
+        """Étendre les préfixes d'empreinte du bloc jusqu'au rang upto (exclu); (bloc,int)->None."""
+        prefix = ch.prefix
+        h = ch.hnorm
+        acc = prefix[-1]
+        for k in range(len(prefix) - 1, upto):
+            acc = (acc * _RH_BASE + h[k]) % _RH_MOD
+            prefix.append(acc)
+
+    def _power(self, n: int) -> int:
+        """Retourner _RH_BASE**n mod _RH_MOD (table mémorisée); int->int."""
+        pw = self._pow
+        while len(pw) <= n:
+            pw.append((pw[-1] * _RH_BASE) % _RH_MOD)
+        return pw[n]
+
+    def _window_hash(self, start: int, n: int) -> int:
+        """Empreinte de la fenêtre normalisée [start,start+n), combinée bloc par bloc; (start,n)->int."""
+        k = bisect.bisect_right(self._starts, start) - 1
+        a = start - self._starts[k]
+        acc = 0
+        while n:
+            ch = self._chunks[k]
+            take = min(n, len(ch.lines) - a)
+            self._ensure_prefix(ch, a + take)
+            p = ch.prefix
+            pw = self._power(take)
+            acc = (acc * pw + p[a + take] - p[a] * pw) % _RH_MOD
+            n -= take
+            k += 1
+            a = 0
+        return acc
+
+    @staticmethod
+    def _needle_hash(needle_norm: List[str]) -> int:
+        """Empreinte d'un bloc déjà normalisé; lines->int."""
+        acc = 0
+        for nl in needle_norm:
+            acc = (acc * _RH_BASE + hash(nl) % _RH_MOD) % _RH_MOD
+        return acc
+
+    # --- candidats ---
+    def _candidates(self, keys: List[str], pos_map: Dict[str, List[int]]) -> List[int]:
+        """Débuts candidats d'après la ligne la plus rare du bloc; (keys,map)->list[int] triée."""
+        best_j = -1
+        best: Optional[List[int]] = None
+        for j, k in enumerate(keys):
+            lst = pos_map.get(k)
+            if not lst:
+                return []
+            if best is None or len(lst) < len(best):
+                best_j, best = j, lst
+                if len(lst) == 1:
+                    break
+        limit = self._len - len(keys)
+        return [p - best_j for p in self._positions(best) if 0 <= p - best_j <= limit]
+
+    def find_all(self, needle: List[str]) -> List[int]:
+        """Toutes les occurrences exactes de needle; lines->list[int]."""
+        if not needle:
+            return []
+        n = len(needle)
+        lines = self.lines
+        return [c for c in self._candidates(needle, self.pos_exact) if lines[c:c + n] == needle]
+
+    def find_all_fuzzy(self, needle: List[str]) -> List[Tuple[int, int]]:
+        """Toutes les occurrences tolérantes au whitespace de début; retourne list[(index, indent_delta)]; lines->list[tuple]."""
+        if not needle:
+            return []
+        n = len(needle)
+        needle_norm = [_normalize_line_whitespace(l) for l in needle]
+        cands = self._candidates(needle_norm, self.pos_norm)
+        if not cands:
+            return []
+        target = self._needle_hash(needle_norm)
+        ref = next((k for k, ne in enumerate(needle) if ne.strip()), -1)
+        ref_width = _indent_width(needle[ref]) if ref >= 0 else 0
+        norm, indent = self.norm, self.indent
+        results: List[Tuple[int, int]] = []
+        for c in cands:
+            if self._window_hash(c, n) != target or norm[c:c + n] != needle_norm:
+                continue
+            results.append((c, indent[c + ref] - ref_width if ref >= 0 else 0))
+        return results
+
+    # --- mise à jour incrémentale ---
+    @staticmethod
+    def _drop_pos(pos_map: Dict[str, List[int]], key: str, pos: int) -> None:
+        """Retirer pos de la liste de key; (map,key,pos)->None."""
+        lst = pos_map.get(key)
+        if not lst:
+            return
+        k = bisect.bisect_left(lst, pos)
+        if k < len(lst) and lst[k] == pos:
+            del lst[k]
+            if not lst:
+                del pos_map[key]
+
+    def splice(self, start: int, count: int, new_lines: List[str]) -> None:
+        """Remplacer lines[start:start+count] par new_lines: seuls les blocs touchés sont réécrits et réindexés (découpés au-delà de 2*LINE_CHUNK lignes), les positions des autres blocs restent valides; (start,count,lines)->None."""
+        new_lines = list(new_lines)
+        if not count and not new_lines:
+            return
+        new_cols = (new_lines,) + _line_records(new_lines)
+        if not self._chunks:
+            self._chunks.append(self._new_chunk([]))
+            self._refresh()
+        chunks, starts = self._chunks, self._starts
+        end = start + count
+        ci = len(chunks) - 1 if start >= self._len else bisect.bisect_right(starts, start) - 1
+        cj = ci if count == 0 else bisect.bisect_right(starts, end - 1) - 1
+        lo, hi = start - starts[ci], end - starts[cj]
+        first, last = chunks[ci], chunks[cj]
+        if ci == cj and len(new_lines) == count:
+            # Remplacement à taille égale dans un bloc: aucune autre ligne ne change de rang
+            self._unindex_chunk(first, lo, hi)
+            for name, new in zip(_RECORD_COLUMNS, new_cols):
+                getattr(first, name)[lo:hi] = new
+            del first.prefix[lo + 1:]
+            self._index_chunk(first, lo, hi)
+            return
+        # Tout ce qui suit start dans les blocs touchés change de rang (ou disparaît): retiré puis réindexé
+        self._unindex_chunk(first, lo)
+        for ch in chunks[ci + 1:cj + 1]:
+            self._unindex_chunk(ch, 0)
+        for name, new in zip(_RECORD_COLUMNS, new_cols):
+            setattr(first, name, getattr(first, name)[:lo] + new + getattr(last, name)[hi:])
+        del first.prefix[lo + 1:]
+        replacement = [first] if first.lines else []
+        if len(first.lines) > 2 * LINE_CHUNK:
+            keep = max(lo, LINE_CHUNK)
+            rest = [getattr(first, name)[keep:] for name in _RECORD_COLUMNS]
+            for name in _RECORD_COLUMNS:
+                del getattr(first, name)[keep:]
+            for a in range(0, len(rest[0]), LINE_CHUNK):
+                replacement.append(self._new_chunk(*(col[a:a + LINE_CHUNK] for col in rest)))
+        self._index_chunk(first, lo)
+        for ch in replacement[1:]:
+            self._index_chunk(ch, 0, append=True)
+        chunks[ci:cj + 1] = replacement
+        self._refresh()
+
 # ===== RECHERCHE BLOCS =====
-def find_contiguous_block(haystack: List[str], needle: List[str], start_from: int = 0) -> Optional[int]:
-    """Trouver l'index de needle (contigu) dans haystack à partir de start_from (match exact); ->int|None."""
+def find_contiguous_block(haystack: List[str], needle: List[str], start_from: int = 0, index: Optional[LineIndex] = None) -> Optional[int]:
+    """Trouver l'index de needle (contigu) dans haystack à partir de start_from (match exact, via index si fourni); ->int|None."""
     if not needle:
         return start_from
+    if index is not None:
+        for occ in index.find_all(needle):
+            if occ >= start_from:
+                return occ
+        return None
     n = len(needle)
     for start in range(start_from, len(haystack) - n + 1):
         if haystack[start:start+n] == needle:
             return start
     return None
 
-def find_contiguous_block_fuzzy(haystack: List[str], needle: List[str], start_from: int = 0) -> Tuple[Optional[int], int, bool]:
+def find_contiguous_block_fuzzy(haystack: List[str], needle: List[str], start_from: int = 0, index: Optional[LineIndex] = None) -> Tuple[Optional[int], int, bool]:
     """Trouver l'index de needle dans haystack avec fallback tolérant whitespace; retourne (index, indent_delta, was_fuzzy); ->tuple."""
     if not needle:
         return start_from, 0, False
     
-    exact_idx = find_contiguous_block(haystack, needle, start_from)
+    exact_idx = find_contiguous_block(haystack, needle, start_from, index)
     if exact_idx is not None:
         return exact_idx, 0, False
+
+    if index is not None:
+        occurrences = index.find_all_fuzzy(needle)
+        for occ_idx, occ_delta in occurrences:
+            if occ_idx >= start_from:
+                return occ_idx, occ_delta, True
+        if occurrences and occurrences[0][0] < start_from:
+            return occurrences[0][0], occurrences[0][1], True
+        return None, 0, False
     
     n = len(needle)
     for start in range(start_from, len(haystack) - n + 1):
@@ -372,10 +1478,12 @@ def find_contiguous_block_fuzzy(haystack: List[str], needle: List[str], start_fr
     
     return None, 0, False
 
-def find_all_occurrences(haystack: List[str], needle: List[str]) -> List[int]:
-    """Trouver tous les index où needle apparaît dans haystack (exact); ->list[int]."""
+def find_all_occurrences(haystack: List[str], needle: List[str], index: Optional[LineIndex] = None) -> List[int]:
+    """Trouver tous les index où needle apparaît dans haystack (exact, via index si fourni); ->list[int]."""
     if not needle:
         return []
+    if index is not None:
+        return index.find_all(needle)
     results: List[int] = []
     n = len(needle)
     for start in range(len(haystack) - n + 1):
@@ -383,10 +1491,12 @@ def find_all_occurrences(haystack: List[str], needle: List[str]) -> List[int]:
             results.append(start)
     return results
 
-def find_all_occurrences_fuzzy(haystack: List[str], needle: List[str]) -> List[Tuple[int, int]]:
-    """Trouver tous les index où needle apparaît (fuzzy); retourne list[(index, indent_delta)]; ->list[tuple]."""
+def find_all_occurrences_fuzzy(haystack: List[str], needle: List[str], index: Optional[LineIndex] = None) -> List[Tuple[int, int]]:
+    """Trouver tous les index où needle apparaît (fuzzy, via index si fourni); retourne list[(index, indent_delta)]; ->list[tuple]."""
     if not needle:
         return []
+    if index is not None:
+        return index.find_all_fuzzy(needle)
     results: List[Tuple[int, int]] = []
     n = len(needle)
     for start in range(len(haystack) - n + 1):
@@ -413,86 +1523,327 @@ def _compact_noncomment(lines: List[str]) -> List[str]:
     """Filtrer commentaires et lignes vides; lines->lines."""
     return [ln for ln in lines if not _is_comment_or_blank(ln)]
 
-def _emit_grep_hint_for_minus(old_path: str, g_minus: List[str]) -> None:
-    """Imprimer et exécuter un grep d'aide (contexte) pour toutes les lignes '-'; path,lines->None."""
+# ===== FIX #33: INDICE DES CORRESPONDANCES LES PLUS PROCHES (EN MÉMOIRE) =====
+HINT_TOP_K = 3            # régions proposées
+HINT_MIN_SCORE = 0.3      # similarité minimale pour être proposée
+HINT_MAX_CANDIDATES = 64  # débuts évalués finement (les plus votés)
+HINT_COMMON_LINE = 256    # lignes plus fréquentes que ça: ignorées au vote (accolades, balises…)
+HINT_WIDTH = 48           # largeur d'une colonne du côte-à-côte
+HINT_MAX_ROWS = 8         # lignes différentes affichées par région
+HINT_SCORE_CHARS = 200    # caractères par ligne pris en compte dans le score
+
+def _hint_vote_starts(old_lines: List[str], block_norm: List[str], index: Optional[LineIndex]) -> Dict[int, int]:
+    """Votes par début de région: chaque ligne du bloc retrouvée (normalisée) vote pour le début qu'elle implique; (lines,bloc,index)->{début: votes}."""
+    if index is not None:
+        positions_of = index.norm_positions
+    else:
+        wanted = set(block_norm)
+        pos_norm: Dict[str, List[int]] = {}
+        for i, l in enumerate(old_lines):
+            nl = _normalize_line_whitespace(l)
+            if nl in wanted:
+                pos_norm.setdefault(nl, []).append(i)
+        positions_of = lambda nl: pos_norm.get(nl, [])
+    limit = max(0, len(old_lines) - 1)
+    votes: Dict[int, int] = {}
+    for rare_only in (True, False):
+        for j, nl in enumerate(block_norm):
+            positions = positions_of(nl)
+            if not nl.strip() or not positions or (rare_only and len(positions) > HINT_COMMON_LINE):
+                continue
+            for p in positions:
+                st = min(max(p - j, 0), limit)
+                votes[st] = votes.get(st, 0) + 1
+        if votes:
+            break
+    return votes
+
+def _hint_score(window_norm: List[str], block_norm: List[str]) -> float:
+    """Similarité (0..1) d'une région du fichier avec le bloc recherché, lignes tronquées; (fenêtre,bloc)->float."""
+    import difflib
+    a = "\n".join(l[:HINT_SCORE_CHARS] for l in window_norm)
+    b = "\n".join(l[:HINT_SCORE_CHARS] for l in block_norm)
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+def nearest_matches(old_lines: List[str], block: List[str], index: Optional[LineIndex] = None, k: int = HINT_TOP_K) -> List[Tuple[int, float]]:
+    """Les k régions du fichier les plus proches du bloc (débuts 0-based sans chevauchement, score décroissant) via les positions de l'index; (lines,bloc,index,k)->list[(début, score)]."""
+    block_norm = [_normalize_line_whitespace(l) for l in block]
+    n = len(block_norm)
+    if not n or not old_lines:
+        return []
+    votes = _hint_vote_starts(old_lines, block_norm, index)
+    if not votes:
+        return []
+    starts = sorted(votes, key=lambda st: (-votes[st], st))[:HINT_MAX_CANDIDATES]
+    scored: List[Tuple[float, int]] = []
+    for st in starts:
+        window = [_normalize_line_whitespace(l) for l in old_lines[st:st + n]] if index is None else index.norm[st:st + n]
+        scored.append((_hint_score(window, block_norm), st))
+    scored.sort(key=lambda t: (-t[0], t[1]))
+    picked: List[Tuple[int, float]] = []
+    for score, st in scored:
+        if score < HINT_MIN_SCORE or len(picked) >= k:
+            break
+        if all(abs(st - other) >= max(1, n // 2) for other, _ in picked):
+            picked.append((st, score))
+    return picked
+
+def _hint_cell(text: str) -> str:
+    """Cellule du côte-à-côte: ligne sans fin de ligne, tronquée à HINT_WIDTH; str->str."""
+    t = text.rstrip("\r\n").expandtabs(4)
+    return t if len(t) <= HINT_WIDTH else t[:HINT_WIDTH - 1] + "…"
+
+def _hint_side_by_side(window: List[str], block: List[str], first_line: int) -> List[str]:
+    """Lignes différentes entre la région du fichier (gauche) et le bloc du patch (droite), numérotées et tronquées; (fenêtre,bloc,ligne)->list[str]."""
+    import difflib
+    wn = [_normalize_line_whitespace(l) for l in window]
+    bn = [_normalize_line_whitespace(l) for l in block]
+    rows: List[str] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, wn, bn, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        for d in range(max(i2 - i1, j2 - j1)):
+            left = _hint_cell(window[i1 + d]) if i1 + d < i2 else ""
+            right = _hint_cell(block[j1 + d]) if j1 + d < j2 else ""
+            num = str(first_line + i1 + d) if i1 + d < i2 else ""
+            mark = "|" if left and right else ("<" if left else ">")
+            rows.append(f"    {num:>7} {left:<{HINT_WIDTH}} {mark} {right}")
+    if len(rows) > HINT_MAX_ROWS:
+        rows = rows[:HINT_MAX_ROWS] + [f"    … ({len(rows) - HINT_MAX_ROWS} ligne(s) différente(s) de plus)"]
+    return rows
+
+def _emit_nearest_match_hint(old_path: str, old_lines: List[str], block: List[str], index: Optional[LineIndex] = None) -> Optional[str]:
+    """Imprimer (stderr) et retourner les régions les plus proches du bloc introuvable: ligne, score et côte-à-côte des différences; (path,lines,bloc,index)->str|None."""
     try:
-        pats: List[str] = []
-        for x in g_minus:
-            s = (x or "").rstrip("\n")
-            if s.strip():
-                pats.append(s)
-        if not pats:
-            return
-        args: List[str] = ["grep", "-n", "-H", "-C10", "-F"]
-        for p in pats:
-            args += ["-e", p]
-        args += ["--", old_path]
-        try:
-            sys.stderr.write(f"[ASTUCE] grep contexte ({len(pats)} motif(s)) dans: {old_path}\n")
-            proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out = proc.stdout.decode(errors="replace")
-            err = proc.stderr.decode(errors="replace")
-            if out and out.strip():
-                sys.stderr.write(out)
-            if err and err.strip():
-                sys.stderr.write(err)
-        except Exception as e2:
-            sys.stderr.write(f"[WARN] grep échoué: {e2}\n")
+        matches = nearest_matches(old_lines, block, index)
+        if not matches:
+            text = f"[ASTUCE] Aucune région proche du bloc ({len(block)} lignes) dans: {old_path}\n"
+            sys.stderr.write(text)
+            return None
+        out = [f"[ASTUCE] Régions les plus proches du bloc ({len(block)} lignes) dans: {old_path} (gauche: fichier, droite: patch)"]
+        for rank, (st, score) in enumerate(matches, 1):
+            out.append(f"  #{rank} {old_path}:{st + 1} score {score:.2f}")
+            out.extend(_hint_side_by_side(old_lines[st:st + len(block)], block, st + 1) or ["    (identique au whitespace près)"])
+        text = "\n".join(out) + "\n"
+        sys.stderr.write(text)
+        return text
     except Exception as e:
-        sys.stderr.write(f"[WARN] grep_hint erreur: {e}\n")
+        sys.stderr.write(f"[WARN] Indice de correspondance échoué: {e}\n")
+        return None
+
+# ===== FIX #34: ANCRAGE FLOU SCORÉ (CONTEXTE DÉRIVÉ) =====
+FUZZY_MAX_CANDIDATES = 256  # pivots notés au plus (les plus proches de search_from, ou les plus votés)
+FUZZY_MARGIN = 0.05         # scores à moins de ça du meilleur: considérés ex æquo (premier après search_from)
+
+FUZZY_WEAK_LINE = 0.25     # poids d'une ligne de contexte sans mot (vide, accolade…)
+LINE_WORDS_CACHE = 8192    # ensembles de mots mémorisés (une ligne d'ancre est notée contre chaque candidat)
+_WORD_RE = re.compile(r"\w+")
+
+@functools.lru_cache(maxsize=LINE_WORDS_CACHE)
+def _line_words(stripped: str) -> frozenset:
+    """Ensemble des mots d'une ligne déjà strip(), calculé une fois par texte distinct; str->frozenset."""
+    return frozenset(_WORD_RE.findall(stripped))
+
+def _line_similarity(a: str, b: str) -> float:
+    """Similarité (0..1) de deux lignes: 1 si égales au whitespace de bord près, sinon Jaccard de leurs mots; (a,b)->float."""
+    sa, sb = a.strip(), b.strip()
+    if sa == sb:
+        return 1.0
+    wa, wb = _line_words(sa), _line_words(sb)
+    if not wa or not wb:
+        return 0.0
+    return len(wa & wb) / len(wa | wb)
+
+def _context_score(old_lines: List[str], pivot: int, nm: int, anchor_before: List[str], anchor_after: List[str]) -> float:
+    """Note moyenne (pondérée: lignes sans mot comptent peu) des lignes de contexte autour de old_lines[pivot:pivot+nm], ligne absente du fichier = 0; (lines,pivot,nm,avant,après)->float."""
+    nb = len(anchor_before)
+    pairs = [(pivot - nb + k, want) for k, want in enumerate(anchor_before)]
+    pairs += [(pivot + nm + k, want) for k, want in enumerate(anchor_after)]
+    total = weight = 0.0
+    for pos, want in pairs:
+        w = 1.0 if _line_words(want.strip()) else FUZZY_WEAK_LINE
+        weight += w
+        if 0 <= pos < len(old_lines):
+            total += w * _line_similarity(old_lines[pos], want)
+    return total / weight if weight else 0.0
+
+def _insertion_pivots(old_lines: List[str], anchor_before: List[str], anchor_after: List[str], index: Optional[LineIndex]) -> List[int]:
+    """Points d'insertion candidats votés par les lignes d'ancre retrouvées (positions de l'index), les plus votés d'abord; (lines,avant,après,index)->list[int]."""
+    nb = len(anchor_before)
+    wanted = [(_normalize_line_whitespace(l), nb - j) for j, l in enumerate(anchor_before)]
+    wanted += [(_normalize_line_whitespace(l), -j) for j, l in enumerate(anchor_after)]
+    if index is not None:
+        positions_of = index.norm_positions
+    else:
+        keys = {w for w, _ in wanted}
+        pos_norm: Dict[str, List[int]] = {}
+        for i, l in enumerate(old_lines):
+            nl = _normalize_line_whitespace(l)
+            if nl in keys:
+                pos_norm.setdefault(nl, []).append(i)
+        positions_of = lambda nl: pos_norm.get(nl, [])
+    votes: Dict[int, int] = {}
+    for nl, shift in wanted:
+        positions = positions_of(nl)
+        if not nl.strip() or not positions or len(positions) > HINT_COMMON_LINE:
+            continue
+        for q in positions:
+            p = q + shift
+            if 0 <= p <= len(old_lines):
+                votes[p] = votes.get(p, 0) + 1
+    return sorted(votes, key=lambda p: (-votes[p], p))[:FUZZY_MAX_CANDIDATES]
+
+def _fuzzy_anchor(old_lines: List[str], anchor_before: List[str], g_minus: List[str], g_plus: List[str], anchor_after: List[str], search_from: int, index: Optional[LineIndex], min_score: float, expected: Optional[int] = None) -> Optional[Dict]:
+    """Ancrer un groupe dont le contexte a dérivé: lignes '-' retrouvées telles quelles (whitespace de début toléré), contexte noté, ex æquo départagés par la ligne attendue; retourne {start, anchors, indent_delta, score} | {'already': True} | None; (lines,avant,moins,plus,après,début,index,seuil,attendu)->dict|None."""
+    if not anchor_before and not anchor_after:
+        return None
+    if g_plus and _compact_noncomment(g_plus):
+        # Idempotence: les lignes '+' déjà présentes dans un contexte assez proche
+        done = find_all_occurrences_fuzzy(old_lines, g_plus, index)[:FUZZY_MAX_CANDIDATES]
+        if any(_context_score(old_lines, p, len(g_plus), anchor_before, anchor_after) >= min_score for p, _ in done):
+            return {"already": True}
+    nm = len(g_minus)
+    if g_minus:
+        occ = find_all_occurrences_fuzzy(old_lines, g_minus, index)
+        target = expected if expected is not None else search_from
+        occ.sort(key=lambda t: (t[0] < search_from, abs(t[0] - target)))
+        candidates = occ[:FUZZY_MAX_CANDIDATES]
+    else:
+        candidates = [(p, 0) for p in _insertion_pivots(old_lines, anchor_before, anchor_after, index)]
+    if not candidates:
+        return None
+    scored = [(_context_score(old_lines, p, nm, anchor_before, anchor_after), p, delta) for p, delta in candidates]
+    best = max(sc for sc, _, _ in scored)
+    if best < min_score:
+        sys.stderr.write(f"[WARN] Ancrage flou refusé: meilleure confiance {best:.2f} < {min_score:.2f}\n")
+        return None
+    tied = sorted((p, delta, sc) for sc, p, delta in scored if sc >= best - FUZZY_MARGIN)
+    pivot, delta = _pick_occurrence([(p, d) for p, d, _ in tied], search_from, expected)
+    score = next(sc for p, _, sc in tied if p == pivot)
+    if not g_minus:
+        for k, want in enumerate(anchor_before[::-1]):
+            pos = pivot - 1 - k
+            if pos >= 0 and want.strip() and _normalize_line_whitespace(old_lines[pos]) == _normalize_line_whitespace(want):
+                delta = _indent_delta_at(old_lines, pos, want, index)
+                break
+    nb = min(len(anchor_before), pivot)
+    na = min(len(anchor_after), len(old_lines) - pivot - nm)
+    return {"start": pivot - nb, "anchors": (nb, nm, na), "indent_delta": delta, "score": score}
+
+# ===== FIX #35: LIGNE ATTENDUE (ENTÊTES @@) ET DÉCALAGE CUMULÉ =====
+def _probe_near(old_lines: List[str], block: List[str], near: int, search_from: int, index: Optional[LineIndex] = None, radius: int = LINE_HINT_RADIUS) -> Optional[Tuple[int, int]]:
+    """Chercher block (whitespace de début toléré) en partant de la ligne near vers l'extérieur (near, near+1, near-1…), sans descendre sous search_from; retourne (index, indent_delta) de la plus proche ou None; (lines,bloc,near,début,index,rayon)->tuple|None."""
+    n = len(block)
+    if not n or n > len(old_lines):
+        return None
+    block_norm = [_normalize_line_whitespace(l) for l in block]
+    first = block_norm[0]
+    norm = index.norm if index is not None else None
+    last = len(old_lines) - n
+    for d in range(radius + 1):
+        for p in ((near,) if d == 0 else (near + d, near - d)):
+            if p < search_from or p < 0 or p > last:
+                continue
+            head = norm[p] if norm is not None else _normalize_line_whitespace(old_lines[p])
+            if head != first:
+                continue
+            window = norm[p:p + n] if norm is not None else [_normalize_line_whitespace(l) for l in old_lines[p:p + n]]
+            if window == block_norm:
+                ref = next((k for k, ne in enumerate(block) if ne.strip()), -1)
+                return p, (_indent_delta_at(old_lines, p + ref, block[ref], index) if ref >= 0 else 0)
+    return None
+
+def _pick_occurrence(occurrences: List[Tuple[int, int]], search_from: int, near: Optional[int]) -> Tuple[int, int]:
+    """Choisir parmi les occurrences (triées): la plus proche de near parmi celles >= search_from (sinon parmi toutes), ou sans indice la première >= search_from (sinon la première); (occ,début,near?)->(index, delta)."""
+    after = [o for o in occurrences if o[0] >= search_from]
+    if near is None:
+        return after[0] if after else occurrences[0]
+    return min(after or occurrences, key=lambda o: (abs(o[0] - near), o[0]))
+
+def _line_offset(res: Dict, pivot: int) -> int:
+    """Décalage (lignes actuelles - lignes de l'ancien fichier) valable après un groupe appliqué dont la première ligne -/+ était au pivot; (res,pivot)->int."""
+    nb = res["anchors"][0] if res.get("anchors") else 0
+    return res["start"] + nb - pivot + len(res["new_block"]) - len(res["old_block"])
+
+# ===== FIX #13 + #14 + #15 + #16: RÉSOLUTION D'UN GROUPE =====
+def _group_anchors(context_before: List[str], context_after: List[str]) -> Tuple[List[str], List[str]]:
+    """Ancres d'un groupe: les CONTEXT_ANCHOR_MIN..MAX dernières lignes de contexte avant et premières après; (avant,après)->(ancre_avant, ancre_après)."""
+    anchor_before_count = min(CONTEXT_ANCHOR_MAX, max(CONTEXT_ANCHOR_MIN, len(context_before)))
+    anchor_after_count = min(CONTEXT_ANCHOR_MAX, max(CONTEXT_ANCHOR_MIN, len(context_after)))
+    anchor_before = context_before[-anchor_before_count:] if context_before else []
+    anchor_after = context_after[:anchor_after_count] if context_after else []
+    return anchor_before, anchor_after
+
+@_instrumented("resolve")
+def _resolve_group(old_lines: List[str], context_before: List[str], g_minus: List[str], g_plus: List[str], context_after: List[str], search_from: int, old_path: str = "", index: Optional[LineIndex] = None, fuzzy_min_score: Optional[float] = FUZZY_MIN_SCORE, expected: Optional[int] = None) -> Dict:
+    """Résoudre un groupe avec ancrage explicite, tolérance whitespace, ancrage flou scoré (si fuzzy_min_score), reconstruction précise et détection no-op (recherches via l'index du fichier si fourni, d'abord autour de la ligne attendue de la première ligne -/+ si expected); retourne {status:'apply'|'already'|'notfound', start, old_block, new_block, search_from, indent_delta, mode, at?} (at: début du bloc déjà présent, absent pour un no-op); (lines,context,group,start,path,index,seuil,attendu)->dict."""
+    res: Dict = {"status": "already", "start": search_from, "old_block": [], "new_block": [], "search_from": search_from, "indent_delta": 0, "mode": "noop"}
 
-# ===== FIX #13 + #14 + #15 + #16: CONSTRUCTION DIFF =====
-def _build_single_group_diff(old_hdr: str, new_hdr: str, old_lines: List[str], context_before: List[str], g_minus: List[str], g_plus: List[str], context_after: List[str], search_from: int, old_path: str = "") -> Tuple[str, int, bool]:
-    """Construire diff unifié avec ancrage explicite, tolérance whitespace, reconstruction précise et détection no-op; retourne (diff_text, new_search_from, already_applied); (headers,lines,context,group,start,path)->(str,int,bool)."""
-    
     if not g_minus and not g_plus:
-        return "", search_from, True
+        return res
 
     if _is_noop_group(g_minus, g_plus):
         sys.stderr.write(f"[WARN] Patch no-op détecté: les lignes - et + sont identiques, aucune modification.\n")
         if g_minus:
             preview = g_minus[0].rstrip()[:60]
             sys.stderr.write(f"  Première ligne: {preview}...\n")
-        return "", search_from, True
+        return res
     
     if _is_noop_group_fuzzy(g_minus, g_plus) and g_minus != g_plus:
         sys.stderr.write(f"[WARN] Patch quasi no-op: seul le whitespace diffère entre - et +.\n")
 
-    anchor_before_count = min(CONTEXT_ANCHOR_MAX, max(CONTEXT_ANCHOR_MIN, len(context_before)))
-    anchor_after_count = min(CONTEXT_ANCHOR_MAX, max(CONTEXT_ANCHOR_MIN, len(context_after)))
-    
-    anchor_before = context_before[-anchor_before_count:] if context_before else []
-    anchor_after = context_after[:anchor_after_count] if context_after else []
+    anchor_before, anchor_after = _group_anchors(context_before, context_after)
+    anchor_before_count, anchor_after_count = len(anchor_before), len(anchor_after)
 
     old_block = anchor_before + g_minus + anchor_after
 
+    res["mode"] = "already"
     if g_plus:
         new_block_check = anchor_before + g_plus + anchor_after
         new_block_code = _compact_noncomment(new_block_check)
         if new_block_code:
-            fuzzy_new = find_all_occurrences_fuzzy(old_lines, new_block_code)
+            fuzzy_new = find_all_occurrences_fuzzy(old_lines, new_block_code, index)
             if fuzzy_new:
-                return "", search_from, True
-        idx, _, _ = find_contiguous_block_fuzzy(old_lines, new_block_check, 0)
+                res["at"] = _pick_occurrence(fuzzy_new, 0, expected - len(anchor_before) if expected is not None else None)[0]
+                return res
+        idx, _, _ = find_contiguous_block_fuzzy(old_lines, new_block_check, 0, index)
         if idx is not None:
             if g_minus:
-                old_idx, _, _ = find_contiguous_block_fuzzy(old_lines, old_block, 0)
+                old_idx, _, _ = find_contiguous_block_fuzzy(old_lines, old_block, 0, index)
                 if old_idx is None:
-                    return "", search_from, True
+                    res["at"] = idx
+                    return res
 
+    res["mode"] = "exact"
     if old_block:
-        occurrences = find_all_occurrences_fuzzy(old_lines, old_block)
+        near = expected - len(anchor_before) if expected is not None else None
+        probed = _probe_near(old_lines, old_block, near, search_from, index) if near is not None else None
+        occurrences = [probed] if probed is not None else find_all_occurrences_fuzzy(old_lines, old_block, index)
         indent_delta = 0
+        fuzzy_anchors: Optional[Tuple[int, int, int]] = None
         
         if not occurrences:
             if not g_minus and anchor_before and anchor_after:
                 combined = anchor_before + anchor_after
-                occ_combined = find_all_occurrences_fuzzy(old_lines, combined)
+                occ_combined = find_all_occurrences_fuzzy(old_lines, combined, index)
                 if occ_combined:
                     occurrences = occ_combined
                     old_block = combined
                     anchor_before_count = len(anchor_before)
                     anchor_after_count = len(anchor_after)
+                    res["mode"] = "combined-anchor"
+
+            if not occurrences and fuzzy_min_score is not None:
+                fz = _fuzzy_anchor(old_lines, anchor_before, g_minus, g_plus, anchor_after, search_from, index, fuzzy_min_score, expected)
+                if fz is not None and fz.get("already"):
+                    res["mode"] = "already"
+                    return res
+                if fz is not None:
+                    occurrences = [(fz["start"], fz["indent_delta"])]
+                    fuzzy_anchors = fz["anchors"]
+                    res["mode"] = "fuzzy-context"
+                    res["score"] = round(fz["score"], 3)
+                    sys.stderr.write(f"[WARN] Contexte dérivé: ancrage flou à la ligne {fz['start'] + 1} (confiance {fz['score']:.2f})\n")
             
             if not occurrences:
                 sys.stderr.write(f"[ERREUR] Bloc non trouvé pour patch.\n")
@@ -500,44 +1851,59 @@ def _build_single_group_diff(old_hdr: str, new_hdr: str, old_lines: List[str], c
                 sys.stderr.write(format_lines("  ", old_block[:10]))
                 if len(old_block) > 10:
                     sys.stderr.write(f"  ... ({len(old_block) - 10} lignes supplémentaires)\n")
-                if g_minus:
-                    _emit_grep_hint_for_minus(old_path, g_minus)
-                return "", search_from, False
-        
-        best_idx = None
-        best_delta = 0
-        for occ_idx, occ_delta in occurrences:
-            if occ_idx >= search_from:
-                best_idx = occ_idx
-                best_delta = occ_delta
-                break
-        if best_idx is None and occurrences:
-            best_idx, best_delta = occurrences[0]
-        
-        if best_idx is None:
-            sys.stderr.write(f"[ERREUR] Aucune occurrence valide trouvée.\n")
-            return "", search_from, False
+                res["hint"] = _emit_nearest_match_hint(old_path, old_lines, old_block, index)
+                res["status"] = "notfound"
+                res["mode"] = "notfound"
+                return res
         
-        start_idx = best_idx
-        indent_delta = best_delta
+        start_idx, indent_delta = _pick_occurrence(occurrences, search_from, near)
         
-        exact_occurrences = find_all_occurrences(old_lines, old_block)
-        if start_idx not in exact_occurrences:
+        if fuzzy_anchors is None and old_lines[start_idx:start_idx + len(old_block)] != old_block:
             sys.stderr.write(f"[WARN] Match fuzzy (différence d'indentation: {indent_delta} espaces) à la ligne {start_idx + 1}\n")
+            if res["mode"] == "exact":
+                res["mode"] = "fuzzy"
         
-        file_anchor_before = old_lines[start_idx:start_idx + len(anchor_before)]
-        g_minus_start = start_idx + len(anchor_before)
-        file_g_minus = old_lines[g_minus_start:g_minus_start + len(g_minus)] if g_minus else []
-        anchor_after_start = g_minus_start + len(g_minus)
-        file_anchor_after = old_lines[anchor_after_start:anchor_after_start + len(anchor_after)]
-        
-        old_block = file_anchor_before + file_g_minus + file_anchor_after
-        adjusted_g_plus = _adjust_lines_indent(g_plus, indent_delta) if g_plus else []
-        new_block = file_anchor_before + adjusted_g_plus + file_anchor_after
+        anchors = fuzzy_anchors or (len(anchor_before), len(g_minus), len(anchor_after))
+        old_block, new_block = _anchored_blocks(old_lines, start_idx, anchors, g_plus, indent_delta)
     else:
         start_idx = search_from
+        indent_delta = 0
+        anchors = (0, 0, 0)
         new_block = g_plus
+        res["mode"] = "insert"
 
+    res.update({
+        "status": "apply",
+        "start": start_idx,
+        "old_block": old_block,
+        "new_block": new_block,
+        "search_from": start_idx + len(new_block),
+        "indent_delta": indent_delta,
+        "anchors": anchors,
+    })
+    return res
+
+def _anchored_blocks(old_lines: List[str], start_idx: int, anchors: Tuple[int, int, int], g_plus: List[str], indent_delta: int) -> Tuple[List[str], List[str]]:
+    """FIX #15: Reconstruire (old_block, new_block) depuis le fichier: ancres lues dans old_lines, seul g_plus ajusté avec indent_delta; (lines,start,(nb,nm,na),plus,delta)->(old,new)."""
+    nb, nm, na = anchors
+    file_anchor_before = old_lines[start_idx:start_idx + nb]
+    g_minus_start = start_idx + nb
+    file_g_minus = old_lines[g_minus_start:g_minus_start + nm] if nm else []
+    anchor_after_start = g_minus_start + nm
+    file_anchor_after = old_lines[anchor_after_start:anchor_after_start + na]
+
+    old_block = file_anchor_before + file_g_minus + file_anchor_after
+    adjusted_g_plus = _adjust_lines_indent(g_plus, indent_delta) if g_plus else []
+    new_block = file_anchor_before + adjusted_g_plus + file_anchor_after
+    return old_block, new_block
+
+def _render_group_diff(old_hdr: str, new_hdr: str, res: Dict) -> str:
+    """Rendre un groupe résolu en diff unifié à un seul hunk (mode compatibilité patch); (headers,res)->str."""
+    if res.get("status") != "apply":
+        return ""
+    start_idx = res["start"]
+    old_block = res["old_block"]
+    new_block = res["new_block"]
     out_chunks: List[str] = []
     out_chunks.append(f"--- {old_hdr}\n")
     out_chunks.append(f"+++ {new_hdr}\n")
@@ -548,31 +1914,439 @@ def _build_single_group_diff(old_hdr: str, new_hdr: str, old_lines: List[str], c
     out_chunks.append(f"@@ -{start_idx+1},{old_count} +{start_idx+1},{new_count} @@\n")
     out_chunks.extend(["-" + l for l in old_block])
     out_chunks.extend(["+" + l for l in new_block])
-    
-    new_search = start_idx + len(new_block)
-    return "".join(out_chunks), new_search, False
+    return "".join(out_chunks)
 
-# ===== WRAPPERS PATCH =====
-def _patch_base_args(diff_text: str) -> List[str]:
-    """Construire les arguments de base pour patch -p0 (et -d / si chemins absolus); text->args."""
-    patch_bin = shutil.which("patch") or "patch"
-    base = [patch_bin, "-p0", "--batch"]
-    if any(line.startswith(("--- /", "+++ /")) for line in diff_text.splitlines()):
-        base += ["-d", "/"]
-    return base
+def _build_single_group_diff(old_hdr: str, new_hdr: str, old_lines: List[str], context_before: List[str], g_minus: List[str], g_plus: List[str], context_after: List[str], search_from: int, old_path: str = "", index: Optional[LineIndex] = None, fuzzy_min_score: Optional[float] = FUZZY_MIN_SCORE, expected: Optional[int] = None) -> Tuple[str, int, bool, Dict]:
+    """Construire diff unifié d'un groupe (via _resolve_group); retourne (diff_text, new_search_from, already_applied, res); (headers,lines,context,group,start,path,index,seuil,attendu)->(str,int,bool,dict)."""
+    t0 = time.perf_counter()
+    res = _resolve_group(old_lines, context_before, g_minus, g_plus, context_after, search_from, old_path, index, fuzzy_min_score, expected)
+    _metrics_group(res, time.perf_counter() - t0)
+    if res["status"] != "apply":
+        return "", search_from, res["status"] == "already", res
+    return _render_group_diff(old_hdr, new_hdr, res), res["search_from"], False, res
 
-def _apply_diff_text(diff_text: str) -> Tuple[int, str, str]:
-    """Exécuter patch --dry-run puis patch; text->(rc,stdout,stderr)."""
-    with tempfile.NamedTemporaryFile("w+", delete=False) as tmp:
-        tmp.write(diff_text)
+# ===== FIX #27: CACHE PERSISTANT DES RÉSOLUTIONS =====
+CACHE_VERSION = "3"
+CACHE_MAX_ENTRIES = 50000
+
+def _user_cache_base() -> str:
+    """Racine des données de super_patch hors de l'arbre patché: $XDG_CACHE_HOME/super_patch, sinon ~/.cache/super_patch; ->str."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "super_patch")
+
+def _default_cache_dir() -> str:
+    """Dossier du cache: $SUPER_PATCH_CACHE_DIR, sinon $XDG_CACHE_HOME/super_patch, sinon ~/.cache/super_patch; ->str."""
+    return os.environ.get("SUPER_PATCH_CACHE_DIR") or _user_cache_base()
+
+def _content_digest(lines: List[str]) -> str:
+    """Empreinte sha256 du contenu d'un fichier (liste de lignes); lines->hex."""
+    h = hashlib.sha256()
+    for l in lines:
+        h.update(l.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+def _group_key(state: str, group: Tuple[List[str], List[str], List[str], List[str]], search_from: int, expected: Optional[int] = None,
+               fuzzy_min_score: Optional[float] = FUZZY_MIN_SCORE, line_hints: bool = True) -> str:
+    """Clé (état du fichier, groupe): sha256 de l'état chaîné, du groupe, de search_from, de la ligne attendue et des options dont dépend le verdict (seuil d'ancrage flou, indices de ligne); (state,group,start,attendu,seuil,hints)->hex."""
+    h = hashlib.sha256(f"{CACHE_VERSION}\x01{state}\x01{search_from}\x01{expected}\x01{fuzzy_min_score!r}\x01{line_hints}".encode())
+    for part in group:
+        h.update(b"\x02")
+        for l in part:
+            h.update(l.encode("utf-8", "surrogatepass"))
+            h.update(b"\x00")
+    return h.hexdigest()
+
+def _next_state(group_key: str, status: str) -> str:
+    """État du fichier après un groupe: l'application étant déterministe, (clé du groupe, verdict) suffit à l'identifier; (key,status)->hex."""
+    return hashlib.sha256(f"{group_key}\x01{status}".encode()).hexdigest()
+
+class GroupCache:
+    """Cache disque (sqlite) des résolutions de groupes: (empreinte du contenu, groupe) -> {status,start,indent_delta,anchors,mode}; éviction LRU bornée."""
+
+    def __init__(self, cache_dir: str, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(os.path.join(cache_dir, "groups.sqlite"), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS groups (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS groups_lru ON groups(last_used)")
+        self.db.commit()
+        self._pending: Dict[str, str] = {}
+        self._touched: List[str] = []
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Lire une résolution mémorisée; key->dict|None."""
+        row = self.db.execute("SELECT value FROM groups WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._touched.append(key)
+        return json.loads(row[0])
+
+    def put(self, key: str, res: Dict) -> None:
+        """Mémoriser (en attente du flush) le verdict et l'ancrage d'un groupe résolu; (key,res)->None."""
+        self._pending[key] = json.dumps({
+            "status": res["status"],
+            "start": res.get("start", 0),
+            "indent_delta": res.get("indent_delta", 0),
+            "anchors": list(res.get("anchors") or (0, 0, 0)),
+            "mode": res.get("mode", ""),
+            "at": res.get("at"),
+        })
+
+    def flush(self) -> None:
+        """Écrire les entrées en attente, rafraîchir les entrées lues et évincer les moins récemment utilisées au-delà de max_entries."""
+        if not self._pending and not self._touched:
+            return
+        now = time.time()
+        try:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO groups(key, value, last_used) VALUES (?, ?, ?)",
+                                    [(k, v, now) for k, v in self._pending.items()])
+                self.db.executemany("UPDATE groups SET last_used=? WHERE key=?", [(now, k) for k in self._touched])
+                count = self.db.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+                if count > self.max_entries:
+                    self.db.execute("DELETE FROM groups WHERE key IN (SELECT key FROM groups ORDER BY last_used ASC LIMIT ?)",
+                                    (count - self.max_entries,))
+        except sqlite3.Error as e:
+            sys.stderr.write(f"[WARN] Cache non mis à jour: {e}\n")
+        self._pending.clear()
+        self._touched.clear()
+
+_GROUP_CACHES: Dict[Tuple[str, int], GroupCache] = {}
+
+def _group_cache(opts: Dict) -> Optional[GroupCache]:
+    """Cache du processus courant pour opts (None si désactivé ou indisponible); opts->GroupCache|None."""
+    if not opts.get("cache") or sqlite3 is None:
+        return None
+    cache_dir = opts.get("cache_dir") or _default_cache_dir()
+    key = (cache_dir, os.getpid())
+    cache = _GROUP_CACHES.get(key)
+    if cache is None:
+        try:
+            cache = GroupCache(cache_dir, opts.get("cache_max_entries") or CACHE_MAX_ENTRIES)
+        except (OSError, sqlite3.Error) as e:
+            sys.stderr.write(f"[WARN] Cache désactivé ({cache_dir}): {e}\n")
+            opts["cache"] = False
+            return None
+        _GROUP_CACHES[key] = cache
+    return cache
+
+@_instrumented("cache")
+def _resolve_from_cache(entry: Dict, old_lines: List[str], group: Tuple[List[str], List[str], List[str], List[str]]) -> Optional[Dict]:
+    """Reconstruire une résolution depuis le cache sans recherche; l'ancrage 'apply' est revérifié sur le fichier; (entry,lines,group)->res|None."""
+    context_before, g_minus, g_plus, context_after = group
+    start = entry["start"]
+    res: Dict = {"status": entry["status"], "start": start, "old_block": [], "new_block": [], "search_from": start,
+                 "indent_delta": entry["indent_delta"], "mode": entry["mode"], "cached": True}
+    if entry["status"] == "already":
+        if entry.get("at") is not None:
+            res["at"] = entry["at"]
+        return res
+    if entry["status"] != "apply":
+        return None
+    nb, nm, na = entry["anchors"]
+    expected = (context_before[-nb:] if nb else []) + (g_minus[:nm] if nm else []) + context_after[:na]
+    if start < 0 or start + len(expected) > len(old_lines) or not _lines_match_fuzzy(old_lines[start:start + len(expected)], expected):
+        return None
+    old_block, new_block = _anchored_blocks(old_lines, start, (nb, nm, na), g_plus, entry["indent_delta"])
+    res.update({"old_block": old_block, "new_block": new_block, "search_from": start + len(new_block), "anchors": (nb, nm, na)})
+    return res
+
+# ===== FIX #36: MODE GROS FICHIERS (MMAP, DÉCOUPAGE PAR OCTETS) =====
+class MappedFile:
+    """Fichier projeté en mémoire en lecture seule + tableau compact des débuts de ligne (offsets[k] = octet de début de la ligne k, offsets[-1] = taille)."""
+    __slots__ = ("path", "mm", "offsets")
+
+    def __init__(self, path: str, mm: mmap.mmap) -> None:
+        self.path = path
+        self.mm = mm
+        offsets = array.array("q", [0])
+        find = mm.find
+        pos = 0
+        while True:
+            k = find(b"\n", pos)
+            if k < 0:
+                break
+            pos = k + 1
+            offsets.append(pos)
+        if pos < len(mm):
+            offsets.append(len(mm))
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def line(self, k: int) -> str:
+        """Décoder la ligne k (0-based); int->str."""
+        return self.mm[self.offsets[k]:self.offsets[k + 1]].decode("utf-8")
+
+    def occurrences(self, needle: bytes, nlines: int, lo: int, hi: int) -> Iterator[int]:
+        """Débuts (lignes) des occurrences de needle (nlines lignes entières) entre les lignes lo et hi; (octets,n,lo,hi)->iter[int]."""
+        offsets, find = self.offsets, self.mm.find
+        b_hi = offsets[hi]
+        pos = find(needle, offsets[lo], b_hi)
+        while pos >= 0:
+            k = bisect.bisect_left(offsets, pos)
+            if offsets[k] == pos and offsets[k + nlines] == pos + len(needle):
+                yield k
+            pos = find(needle, pos + 1, b_hi)
+
+class SplicedLines(collections.abc.Sequence):
+    """Contenu courant d'un fichier projeté: table de morceaux (plage de lignes d'origine (lo, hi) ou liste de lignes nouvelles), lignes décodées à la demande; splice() a la signature de LineIndex.splice."""
+
+    def __init__(self, mapped: MappedFile) -> None:
+        self.mapped = mapped
+        self.pieces: List = [(0, len(mapped))] if len(mapped) else []
+        self._reindex()
+
+    def copy(self) -> "SplicedLines":
+        """Copie indépendante (mêmes octets d'origine, table de morceaux dupliquée); ->SplicedLines."""
+        other = SplicedLines.__new__(SplicedLines)
+        other.mapped = self.mapped
+        other.pieces = [p if isinstance(p, tuple) else list(p) for p in self.pieces]
+        other._reindex()
+        return other
+
+    def _reindex(self) -> None:
+        """Recalculer les débuts (lignes courantes) des morceaux; ->None."""
+        starts, n = [], 0
+        for p in self.pieces:
+            starts.append(n)
+            n += p[1] - p[0] if isinstance(p, tuple) else len(p)
+        self._starts = starts
+        self._len = n
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _line(self, i: int) -> str:
+        k = bisect.bisect_right(self._starts, i) - 1
+        p = self.pieces[k]
+        off = i - self._starts[k]
+        return self.mapped.line(p[0] + off) if isinstance(p, tuple) else p[off]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._line(k) for k in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return self._line(i)
+
+    def __iter__(self) -> Iterator[str]:
+        for p in self.pieces:
+            if isinstance(p, tuple):
+                for k in range(p[0], p[1]):
+                    yield self.mapped.line(k)
+            else:
+                yield from p
+
+    def splice(self, start: int, count: int, new_lines: List[str]) -> None:
+        """Remplacer les lignes [start, start+count) par new_lines (un morceau nouveau, éventuellement vide, sépare toujours deux plages d'origine); (start,count,lines)->None."""
+        end = start + count
+        out: List = []
+        placed = False
+        for p, ps in zip(self.pieces, self._starts):
+            plen = p[1] - p[0] if isinstance(p, tuple) else len(p)
+            pe = ps + plen
+            if pe <= start or ps >= end:
+                if ps >= end and not placed:
+                    out.append(list(new_lines))
+                    placed = True
+                out.append(p)
+                continue
+            if ps < start:
+                out.append((p[0], p[0] + start - ps) if isinstance(p, tuple) else p[:start - ps])
+            if not placed:
+                out.append(list(new_lines))
+                placed = True
+            if pe > end:
+                out.append((p[0] + end - ps, p[1]) if isinstance(p, tuple) else p[end - ps:])
+        if not placed:
+            out.append(list(new_lines))
+        merged: List = []
+        for p in out:
+            if merged and isinstance(p, list) and isinstance(merged[-1], list):
+                merged[-1] = merged[-1] + p
+            elif isinstance(p, tuple) and p[0] == p[1]:
+                continue
+            else:
+                merged.append(p)
+        self.pieces = merged
+        self._reindex()
+
+    def contains_fuzzy(self, block: List[str]) -> bool:
+        """Vrai si block apparaît (whitespace de début toléré) dans le contenu courant: la ligne la plus longue du bloc est cherchée dans les octets d'origine, les abords des morceaux nouveaux comparés ligne à ligne; bloc->bool."""
+        n = len(block)
+        if not n or n > self._len:
+            return False
+        norm = [_normalize_line_whitespace(l) for l in block]
+        j = max(range(n), key=lambda k: len(norm[k]))
+        if not norm[j]:
+            return True  # bloc de lignes vides: rien à chercher, on ne conclut pas à l'absence
+        key = norm[j].encode("utf-8")
+        mm, offsets = self.mapped.mm, self.mapped.offsets
+        for p, ps in zip(self.pieces, self._starts):
+            if isinstance(p, tuple):
+                b_hi = offsets[p[1]]
+                pos = mm.find(key, offsets[p[0]], b_hi)
+                while pos >= 0:
+                    k = bisect.bisect_right(offsets, pos) - 1
+                    head = mm[offsets[k]:pos].decode("utf-8")
+                    start = ps + k - p[0] - j
+                    if (not head or head.isspace()) and offsets[k + 1] == pos + len(key) and 0 <= start <= self._len - n \
+                            and [_normalize_line_whitespace(l) for l in self[start:start + n]] == norm:
+                        return True
+                    pos = mm.find(key, pos + 1, b_hi)
+            else:
+                pe = ps + len(p)
+                a, b = max(0, ps - n + 1), min(self._len, pe + n - 1)
+                window = [_normalize_line_whitespace(l) for l in self[a:b]]
+                for q in range(len(window) - n + 1):
+                    st = a + q
+                    crosses = st < pe and st + n > ps if pe > ps else st < ps < st + n
+                    if crosses and window[q:q + n] == norm:
+                        return True
+        return False
+
+    def find_block(self, block: List[str], lo: int = 0, hi: Optional[int] = None) -> List[int]:
+        """Débuts (lignes courantes) des occurrences exactes de block entièrement comprises dans [lo, hi): octets d'origine cherchés par mmap, abords des morceaux nouveaux comparés ligne à ligne; (bloc,lo,hi)->list[int] triée."""
+        n = len(block)
+        hi = self._len if hi is None else min(hi, self._len)
+        lo = max(0, lo)
+        if not n or hi - lo < n:
+            return []
+        needle = "".join(block).encode("utf-8")
+        found = set()
+        for p, ps in zip(self.pieces, self._starts):
+            if isinstance(p, tuple):
+                pe = ps + p[1] - p[0]
+                a, b = max(lo, ps), min(hi, pe)
+                if b - a >= n:
+                    found.update(ps + k - p[0] for k in self.mapped.occurrences(needle, n, p[0] + a - ps, p[0] + b - ps))
+            else:
+                pe = ps + len(p)
+                a, b = max(lo, ps - n + 1), min(hi, pe + n - 1)
+                if b - a < n:
+                    continue
+                window = self[a:b]
+                for q in range(len(window) - n + 1):
+                    st = a + q
+                    crosses = st < pe and st + n > ps if pe > ps else st < ps < st + n
+                    if crosses and window[q:q + n] == block:
+                        found.add(st)
+        return sorted(found)
+
+    def write_to(self, f) -> None:
+        """Écrire le contenu courant dans f (binaire): plages d'origine recopiées telles quelles, lignes nouvelles encodées; file->None."""
+        offsets = self.mapped.offsets
+        with memoryview(self.mapped.mm) as mv:
+            for p in self.pieces:
+                if isinstance(p, tuple):
+                    f.write(mv[offsets[p[0]]:offsets[p[1]]])
+                elif p:
+                    f.write("".join(p).encode("utf-8"))
+
+def _map_large_file(path: str, opts: Dict) -> Optional[SplicedLines]:
+    """Projeter path en mémoire si le mode gros fichiers s'applique (taille >= opts['large_file_bytes'], pas de validateur actif, pas de '\r'); (path,opts)->SplicedLines|None."""
+    threshold = opts["large_file_bytes"]
+    if not threshold:
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size < threshold or (opts["validate"] != VALIDATE_OFF and _validator_for(path) is not None):
+        return None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm.find(b"\r") >= 0:
+        # Fins de ligne CR/CRLF: le moteur normal (mode texte) les convertit, le mode octets ne saurait pas le reproduire
+        mm.close()
+        return None
+    if _METRICS is not None:
+        _metrics_bytes("bytes_read", size)
+    with _timed("index"):
+        return SplicedLines(MappedFile(path, mm))
+
+def _resolve_group_mapped(view: SplicedLines, context_before: List[str], g_minus: List[str], g_plus: List[str], context_after: List[str], search_from: int, expected: Optional[int] = None) -> Optional[Dict]:
+    """Résoudre un groupe sur un fichier projeté par correspondance exacte seulement; None si le groupe demande le moteur normal (no-op, déjà appliqué possible, bloc absent ou seulement à l'indentation près); (view,context,group,start,attendu)->res|None."""
+    if _is_noop_group_fuzzy(g_minus, g_plus):
+        return None
+    anchor_before, anchor_after = _group_anchors(context_before, context_after)
+    old_block = anchor_before + g_minus + anchor_after
+    if not old_block:
+        return None
+    if g_plus:
+        # Même verdict 'déjà appliqué' que _resolve_group: au moindre doute, le moteur normal tranche
+        check = anchor_before + g_plus + anchor_after
+        code = _compact_noncomment(check)
+        if (code and view.contains_fuzzy(code)) or view.contains_fuzzy(check):
+            return None
+    near = expected - len(anchor_before) if expected is not None else None
+    occurrences: List[int] = []
+    if near is not None:
+        occurrences = [p for p in view.find_block(old_block, near - LINE_HINT_RADIUS, near + LINE_HINT_RADIUS + len(old_block)) if p >= search_from]
+    if not occurrences:
+        occurrences = view.find_block(old_block)
+    if not occurrences:
+        return None
+    start, _ = _pick_occurrence([(p, 0) for p in occurrences], search_from, near)
+    anchors = (len(anchor_before), len(g_minus), len(anchor_after))
+    old_block, new_block = _anchored_blocks(view, start, anchors, g_plus, 0)
+    return {"status": "apply", "start": start, "old_block": old_block, "new_block": new_block, "search_from": start + len(new_block),
+            "indent_delta": 0, "mode": "exact", "anchors": anchors}
+
+# ===== FIX #20: APPLICATION EN MÉMOIRE =====
+@_instrumented("splice")
+def _splice_group(current_lines: List[str], res: Dict, index: Optional[LineIndex] = None) -> Optional[List[str]]:
+    """Remplacer en place old_block par new_block à res['start'] après vérification exacte (index maintenu si fourni); retourne les lignes insérées ou None si le bloc ne correspond pas; (lines,res,index)->lines|None."""
+    start = res["start"]
+    old_block = res["old_block"]
+    new_block = list(res["new_block"])
+    end = start + len(old_block)
+    if start < 0 or end > len(current_lines) or current_lines[start:end] != old_block:
+        return None
+    # Une ligne sans '\n' ne peut rester telle quelle que si elle termine le fichier
+    for k in range(len(new_block)):
+        if not new_block[k].endswith("\n") and (k < len(new_block) - 1 or end < len(current_lines)):
+            new_block[k] += "\n"
+    if index is not None:
+        index.splice(start, len(old_block), new_block)
+    else:
+        current_lines[start:end] = new_block
+    return new_block
+
+def _replay_edits(base_lines: List[str], edits: List[Tuple[int, int, List[str]]]) -> List[str]:
+    """Rejouer des éditions (start, old_len, new_lines) sur une copie de base_lines; (base,edits)->lines."""
+    lines = list(base_lines)
+    for start, old_len, new_lines in edits:
+        lines[start:start + old_len] = new_lines
+    return lines
+
+# ===== WRAPPERS PATCH =====
+def _patch_base_args(diff_text: str) -> List[str]:
+    """Construire les arguments de base pour patch -p0 (et -d / si chemins absolus); text->args."""
+    patch_bin = shutil.which("patch") or "patch"
+    base = [patch_bin, "-p0", "--batch"]
+    if any(line.startswith(("--- /", "+++ /")) for line in diff_text.splitlines()):
+        base += ["-d", "/"]
+    return base
+
+@_instrumented("patch")
+def _apply_diff_text(diff_text: str) -> Tuple[int, str, str]:
+    """Exécuter patch --dry-run puis patch; text->(rc,stdout,stderr)."""
+    with tempfile.NamedTemporaryFile("w+", delete=False) as tmp:
+        tmp.write(diff_text)
         tmp_path = tmp.name
     try:
         base_args = _patch_base_args(diff_text)
         dry = base_args + ["--dry-run", "-i", tmp_path]
-        p1 = subprocess.run(dry, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p1 = _run_subprocess(dry, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if p1.returncode != 0:
             return p1.returncode, p1.stdout.decode(errors="replace"), p1.stderr.decode(errors="replace")
-        p2 = subprocess.run(base_args + ["-i", tmp_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        p2 = _run_subprocess(base_args + ["-i", tmp_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return p2.returncode, p2.stdout.decode(errors="replace"), p2.stderr.decode(errors="replace")
     finally:
         try:
@@ -584,26 +2358,43 @@ def _apply_diff_text(diff_text: str) -> Tuple[int, str, str]:
 # FIX #17: Variable globale pour stocker les backups créés (pour diff final)
 _all_backups: Dict[str, str] = {}
 
-def backup_file_once(src: str, backups: Dict[str, str]) -> None:
-    """Créer une sauvegarde horodatée unique si absente; (src,backups)->None."""
+@_instrumented("backup")
+def backup_file_once(src: str, backups: Dict[str, str], link_ok: bool = False) -> None:
+    """Créer une sauvegarde unique si absente: objet du magasin (FIX #30; lien dur si link_ok: l'appelant remplace ensuite le fichier par os.replace, ou appelle _detach_backup en cas d'échec) ou copie horodatée voisine (mode sidecar); (src,backups,link_ok)->None."""
     if src in backups:
         return
-    ts = __import__("datetime").datetime.now().strftime("%Y%m%dT%H%M%S")
-    dst = f"{src}.{ts}"
     try:
-        shutil.copy2(src, dst)
+        if _backup_config["mode"] == BACKUP_STORE:
+            dst = _store_backup(src, link_ok)
+        else:
+            dst = _reserve_sidecar(src)
+            shutil.copy2(src, dst)
         backups[src] = dst
         _all_backups[src] = dst
         print(f"[BACKUP] {src} -> {dst}")
     except Exception as e:
         sys.stderr.write(f"[WARN] Sauvegarde échouée pour {src}: {e}\n")
 
+def _reserve_sidecar(src: str) -> str:
+    """FIX #42: Réserver (création exclusive) le nom de copie voisine src.AAAAmmjjTHHMMSS, suffixé -1, -2… s'il est déjà pris dans la même seconde; src->chemin."""
+    ts = time.strftime("%Y%m%dT%H%M%S")
+    for n in itertools.count():
+        dst = f"{src}.{ts}" if n == 0 else f"{src}.{ts}-{n}"
+        try:
+            os.close(os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+            return dst
+        except FileExistsError:
+            continue
+
 def restore_from_backup(src: str, backups: Dict[str, str]) -> None:
     """Restaurer un fichier depuis sa sauvegarde si existante; (src,backups)->None."""
     bak = backups.get(src)
     if not bak:
         return
     try:
+        if os.path.exists(src) and os.path.samefile(bak, src):
+            # Objet lié (lien dur) au fichier pas encore remplacé: contenu d'origine intact
+            return
         shutil.copy2(bak, src)
         print(f"[ROLLBACK] Restauration: {bak} -> {src}")
         if src in _all_backups:
@@ -611,9 +2402,317 @@ def restore_from_backup(src: str, backups: Dict[str, str]) -> None:
     except Exception as e:
         sys.stderr.write(f"[WARN] Échec restauration {src} depuis {bak}: {e}\n")
 
+def _detach_backup(src: str, backups: Dict[str, str]) -> None:
+    """Si la sauvegarde de src partage encore son inode (lien dur pris avant un remplacement qui a échoué), lui donner sa propre copie: une écriture en place ultérieure de src ne doit pas modifier la sauvegarde; (src,backups)->None."""
+    bak = backups.get(src)
+    if not bak:
+        return
+    try:
+        if not (os.path.exists(src) and os.path.samefile(bak, src)):
+            return
+        tmp = f"{bak}.{os.getpid()}.tmp"
+        shutil.copy2(bak, tmp)
+        os.replace(tmp, bak)
+    except OSError as e:
+        sys.stderr.write(f"[WARN] Sauvegarde {bak} toujours liée à {src}: {e}\n")
+
+# ===== FIX #30: MAGASIN DE SAUVEGARDES ADRESSÉ PAR CONTENU =====
+_FICLONE = 0x40049409  # ioctl Linux (btrfs, xfs, ...): copie par reflink
+
+# Configuration active des sauvegardes (posée par _configure_backups) et exécution courante (créée à la première sauvegarde)
+_backup_config: Dict = {"mode": BACKUP_STORE, "dir": None, "lock_timeout": LOCK_TIMEOUT}
+_backup_run: Optional[Dict] = None
+
+def _default_backup_dir() -> str:
+    """Dossier du magasin: $SUPER_PATCH_BACKUP_DIR, sinon backups/ sous $XDG_CACHE_HOME/super_patch ou ~/.cache/super_patch (hors de l'arbre patché: un bundle ne doit pas l'embarquer); ->str."""
+    return os.environ.get("SUPER_PATCH_BACKUP_DIR") or os.path.join(_user_cache_base(), "backups")
+
+def _configure_backups(opts: Dict) -> None:
+    """Appliquer les options de sauvegarde (mode, dossier) pour les commits à venir; opts->None."""
+    _backup_config["mode"] = opts["backup_mode"]
+    _backup_config["dir"] = os.path.abspath(opts["backup_dir"] or _default_backup_dir())
+    _backup_config["lock_timeout"] = opts["lock_timeout"]
+
+def _store_dir(opts: Optional[Dict] = None) -> str:
+    """Dossier du magasin pour opts (ou la configuration active); opts?->str."""
+    if opts is not None:
+        return os.path.abspath(opts["backup_dir"] or _default_backup_dir())
+    return _backup_config["dir"] or os.path.abspath(_default_backup_dir())
+
+def _file_sha256(path: str) -> str:
+    """Empreinte sha256 des octets d'un fichier; path->hex."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _object_path(store: str, digest: str) -> str:
+    """Chemin d'un objet du magasin (objects/ab/abcd…); (store,hex)->str."""
+    return os.path.join(store, "objects", digest[:2], digest)
+
+def _clone_file(src: str, dst: str, link_ok: bool) -> str:
+    """Copier src vers dst sans dupliquer les données si possible: lien dur (link_ok, et src sans autre lien: un autre chemin pourrait l'écrire en place), reflink, sinon copie; (src,dst,link_ok)->méthode."""
+    if link_ok and os.stat(src).st_nlink == 1:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fs, open(dst, "wb") as fd:
+                fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+            shutil.copymode(src, dst)
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+    return "copy"
+
+def _current_run() -> Dict:
+    """Exécution de sauvegarde courante, créée (identifiant + manifeste runs/<RUN_ID>.jsonl) à la première sauvegarde; ->dict."""
+    global _backup_run
+    if _backup_run is None:
+        store = _store_dir()
+        os.makedirs(os.path.join(store, "runs"), exist_ok=True)
+        run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{os.urandom(3).hex()}"
+        _backup_run = {"id": run_id, "store": store, "manifest": os.path.join(store, "runs", f"{run_id}.jsonl")}
+    return _backup_run
+
+def _manifest_append(record: Dict) -> None:
+    """Ajouter une ligne au manifeste de l'exécution courante (append: un arrêt brutal laisse un manifeste lisible); record->None."""
+    run = _current_run()
+    record = dict(record, time=time.time())
+    with open(run["manifest"], "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _store_backup(src: str, link_ok: bool) -> str:
+    """Ranger le contenu actuel de src dans le magasin (dédupliqué par sha256) et l'inscrire au manifeste, sous le verrou partagé du magasin (FIX #42: prune_backups ne voit jamais un objet pas encore inscrit); (src,link_ok)->chemin de l'objet."""
+    run = _current_run()
+    with store_lock(run["store"], _backup_config["lock_timeout"], shared=True):
+        digest = _file_sha256(src)
+        obj = _object_path(run["store"], digest)
+        method = "dedup"
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            tmp = f"{obj}.{os.getpid()}.tmp"
+            try:
+                method = _clone_file(src, tmp, link_ok)
+                os.replace(tmp, obj)
+            except BaseException:
+                _discard_staged(tmp)
+                raise
+        st = os.stat(src)
+        _manifest_append({"path": os.path.abspath(src), "object": digest, "mode": st.st_mode & 0o7777, "size": st.st_size, "method": method})
+    return obj
+
+def _record_created(path: str) -> None:
+    """Inscrire au manifeste un fichier créé par l'exécution (supprimé par --restore); path->None."""
+    if _backup_config["mode"] != BACKUP_STORE:
+        return
+    try:
+        _manifest_append({"path": os.path.abspath(path), "created": True})
+    except OSError as e:
+        sys.stderr.write(f"[WARN] Manifeste non mis à jour pour {path}: {e}\n")
+
+def _read_manifest(path: str) -> List[Dict]:
+    """Lire un manifeste JSONL (lignes illisibles ignorées); path->list[dict]."""
+    records: List[Dict] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def list_backup_runs(opts: Optional[Dict] = None) -> List[Tuple[str, List[Dict]]]:
+    """Exécutions présentes dans le magasin, plus anciennes d'abord; opts->list[(run_id, records)]."""
+    runs_dir = os.path.join(_store_dir(make_options(opts)), "runs")
+    try:
+        names = sorted(n for n in os.listdir(runs_dir) if n.endswith(".jsonl"))
+    except FileNotFoundError:
+        return []
+    return [(n[:-len(".jsonl")], _read_manifest(os.path.join(runs_dir, n))) for n in names]
+
+def restore_run(run_id: str, opts: Optional[Dict] = None) -> int:
+    """--restore RUN_ID: remettre chaque fichier sauvegardé par l'exécution dans son état d'avant (première sauvegarde par chemin) et supprimer les fichiers qu'elle a créés; (run_id,opts)->rc."""
+    opts = make_options(opts)
+    store = _store_dir(opts)
+    manifest = os.path.join(store, "runs", f"{run_id}.jsonl")
+    if not os.path.exists(manifest):
+        sys.stderr.write(f"[ERREUR] Exécution inconnue: {run_id} (magasin: {store})\n")
+        return 1
+    first: Dict[str, Dict] = {}
+    for rec in _read_manifest(manifest):
+        first.setdefault(rec["path"], rec)
+    rc = 0
+    for path, rec in first.items():
+        try:
+            if rec.get("created"):
+                if os.path.exists(path):
+                    os.remove(path)
+                    print(f"[RESTORE] Suppression fichier créé: {path}")
+                continue
+            dir_name = os.path.dirname(path) or "."
+            os.makedirs(dir_name, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+            os.close(fd)
+            try:
+                _clone_file(_object_path(store, rec["object"]), tmp_path, link_ok=False)
+                os.chmod(tmp_path, rec["mode"])
+                os.replace(tmp_path, path)
+            except BaseException:
+                _discard_staged(tmp_path)
+                raise
+            print(f"[RESTORE] {path} <- {rec['object'][:12]}")
+        except (OSError, KeyError) as e:
+            sys.stderr.write(f"[ERREUR] Restauration impossible pour {path}: {e}\n")
+            rc = 1
+    return rc
+
+def prune_backups(opts: Optional[Dict] = None) -> None:
+    """Rétention: garder les backup_keep_runs dernières exécutions de moins de backup_max_age_days jours, puis supprimer les objets non référencés, sous le verrou exclusif du magasin (les sauvegardes concurrentes attendent); opts->None."""
+    opts = make_options(opts)
+    store = _store_dir(opts)
+    try:
+        with store_lock(store, opts["lock_timeout"]):
+            _prune_store(store, opts)
+    except TimeoutError as e:
+        sys.stderr.write(f"[WARN] Rétention des sauvegardes reportée: {e}\n")
+
+def _prune_store(store: str, opts: Dict) -> None:
+    """Corps de prune_backups, verrou du magasin tenu; (store,opts)->None."""
+    runs = list_backup_runs(opts)
+    if not runs:
+        return
+    keep_n = opts["backup_keep_runs"]
+    max_age = opts["backup_max_age_days"]
+    now = time.time()
+    kept: List[Tuple[str, List[Dict]]] = []
+    current = _backup_run["id"] if _backup_run else None
+    for pos, (run_id, records) in enumerate(runs):
+        newest = max((r.get("time", 0) for r in records), default=0)
+        too_many = keep_n is not None and keep_n >= 0 and pos < len(runs) - keep_n
+        too_old = max_age is not None and max_age >= 0 and now - newest > max_age * 86400
+        if run_id != current and (too_many or too_old):
+            try:
+                os.remove(os.path.join(store, "runs", f"{run_id}.jsonl"))
+            except OSError:
+                pass
+            continue
+        kept.append((run_id, records))
+    live = {r["object"] for _, records in kept for r in records if "object" in r}
+    objects_dir = os.path.join(store, "objects")
+    for root, _, names in os.walk(objects_dir):
+        for name in names:
+            if name not in live and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(root, name))
+                except OSError:
+                    pass
+
+# ===== FIX #42: EXÉCUTIONS CONCURRENTES (VERROUS + CONTRÔLE OPTIMISTE) =====
+LOCK_POLL = 0.05  # secondes entre deux tentatives de prise d'un verrou occupé
+
+def _lock_dir() -> str:
+    """Dossier des fichiers verrous: $SUPER_PATCH_LOCK_DIR, sinon un dossier par utilisateur sous le temporaire système (partagé quel que soit le dossier courant); ->str."""
+    return os.environ.get("SUPER_PATCH_LOCK_DIR") or os.path.join(tempfile.gettempdir(), f"super_patch-locks-{getattr(os, 'getuid', lambda: 0)()}")
+
+@contextlib.contextmanager
+def file_lock(path: str, timeout: Optional[float] = LOCK_TIMEOUT, shared: bool = False) -> Iterator[None]:
+    """Verrou consultatif (flock) exclusif, ou partagé si shared, sur path, porté par un fichier verrou nommé d'après son chemin réel (le fichier lui-même est remplacé par os.replace); TimeoutError après timeout s; sans effet si timeout None ou fcntl absent; (path,timeout,shared)->context."""
+    if fcntl is None or timeout is None:
+        yield
+        return
+    lock_dir = _lock_dir()
+    os.makedirs(lock_dir, exist_ok=True)
+    name = hashlib.sha1(os.path.realpath(path).encode("utf-8", "surrogatepass")).hexdigest()
+    fd = os.open(os.path.join(lock_dir, f"{name}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"verrou de {path} non obtenu en {timeout:g}s (autre exécution en cours)")
+                time.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+def store_lock(store: str, timeout: Optional[float] = LOCK_TIMEOUT, shared: bool = False) -> "contextlib.AbstractContextManager[None]":
+    """Verrou du magasin de sauvegardes: partagé pour ranger un objet et l'inscrire au manifeste, exclusif pour la rétention; (store,timeout,shared)->context."""
+    return file_lock(os.path.join(store, "objects"), timeout, shared)
+
+@contextlib.contextmanager
+def files_locked(paths: Iterable[str], timeout: Optional[float] = LOCK_TIMEOUT) -> Iterator[None]:
+    """Verrouiller plusieurs fichiers, toujours dans l'ordre de leurs chemins réels (pas d'interblocage entre exécutions); (paths,timeout)->context."""
+    with contextlib.ExitStack() as stack:
+        for path in sorted(set(paths), key=os.path.realpath):
+            stack.enter_context(file_lock(path, timeout))
+        yield
+
+def _changed_on_disk(prep: Dict) -> bool:
+    """Le fichier de prep a-t-il changé depuis sa lecture? Identité stat d'abord, contenu comparé seulement si elle diffère (simple touch toléré); prep->bool."""
+    if "stamp" not in prep:
+        return False
+    path = prep["path"]
+    now = _stat_key(path)
+    if now == prep["stamp"]:
+        return False
+    if now is None or prep["stamp"] is None or isinstance(prep["orig_lines"], SplicedLines):
+        return True
+    try:
+        return read_file_lines(path) != list(prep["orig_lines"])
+    except (OSError, UnicodeDecodeError):
+        return True
+
+def _commit_locked(preps: List[Dict], opts: Dict) -> Optional[int]:
+    """Commit en deux phases sous les verrous des fichiers, après contrôle qu'aucun n'a changé depuis sa lecture; None (rien d'écrit) si l'un a changé; (preps,opts)->rc|None."""
+    try:
+        with files_locked([prep["path"] for prep in preps], opts["lock_timeout"]):
+            conflicts = [prep["path"] for prep in preps if _changed_on_disk(prep)]
+            if conflicts:
+                sys.stderr.write(f"[CONFLIT] Modifié(s) par un autre processus depuis la lecture: {', '.join(conflicts)}\n")
+                return None
+            return _commit_transaction(preps)
+    except TimeoutError as e:
+        sys.stderr.write(f"[ERREUR] {e}; aucun fichier modifié.\n")
+        return 1
+
 # ===== APPLICATION SEQUENTIELLE PAR FICHIER =====
-def apply_file_sequential(file_entry: Dict) -> int:
-    """Appliquer séquentiellement les groupes d'un fichier avec validation syntaxique et pré-division des déplacements; entry->rc."""
+def _collect_file_groups(file_entry: Dict, pivots: Optional[List[Optional[int]]] = None) -> List[Tuple[List[str], List[str], List[str], List[str]]]:
+    """Découper tous les hunks d'un fichier en groupes puis pré-diviser les déplacements (pivots d'après les entêtes @@ remplis en parallèle si fourni); (entry,pivots?)->groups."""
+    all_groups: List[Tuple[List[str], List[str], List[str], List[str]]] = []
+    for hk in file_entry.get("hunks") or []:
+        all_groups.extend(split_groups_with_context(hk, pivots))
+    if not all_groups:
+        return []
+    return _split_move_groups(all_groups, pivots)
+
+def _rollback_file(old_path: str, backups: Dict[str, str], old_exists_before: bool) -> None:
+    """Restaurer la sauvegarde ou supprimer le fichier créé (mode compatibilité patch); (path,backups,existed)->None."""
+    if backups:
+        restore_from_backup(old_path, backups)
+    if (not old_exists_before) and os.path.exists(old_path):
+        try:
+            os.remove(old_path)
+            print(f"[ROLLBACK] Suppression fichier créé: {old_path}")
+        except Exception as e:
+            sys.stderr.write(f"[WARN] Échec suppression {old_path}: {e}\n")
+
+def _apply_file_patch_engine(file_entry: Dict, opts: Optional[Dict] = None) -> int:
+    """Mode compatibilité: appliquer chaque groupe via le binaire 'patch' avec relecture du fichier; validation après chaque groupe (per-group) ou à la fin (per-file); (entry,opts)->rc."""
+    opts = make_options(opts)
+    validate = opts["validate"]
     old_hdr, new_hdr = file_entry["old"], file_entry["new"]
     old_path = normalize_old_path(old_hdr)
 
@@ -624,23 +2723,23 @@ def apply_file_sequential(file_entry: Dict) -> int:
         sys.stderr.write(f"[ERREUR] Fichier source introuvable: {old_path}\n")
         return 1
 
-    all_groups: List[Tuple[List[str], List[str], List[str], List[str]]] = []
-    for hk in file_entry.get("hunks") or []:
-        all_groups.extend(split_groups_with_context(hk))
+    pivots: List[Optional[int]] = []
+    all_groups = _collect_file_groups(file_entry, pivots)
     if not all_groups:
         return 0
 
-    all_groups = _split_move_groups(all_groups)
-
     backups: Dict[str, str] = {}
     search_from = 0
+    offset = 0
     old_exists_before = os.path.exists(old_path)
 
     for gi in range(len(all_groups)):
+        pivot = pivots[gi] if opts["line_hints"] else None
         try:
             context_before, g_minus, g_plus, context_after = all_groups[gi]
-            diff_text, new_search, already = _build_single_group_diff(
-                old_hdr, new_hdr, current_lines, context_before, g_minus, g_plus, context_after, search_from, old_path
+            diff_text, new_search, already, res = _build_single_group_diff(
+                old_hdr, new_hdr, current_lines, context_before, g_minus, g_plus, context_after, search_from, old_path,
+                LineIndex(current_lines), opts["fuzzy_min_score"], pivot + offset if pivot is not None else None
             )
         except RuntimeError:
             return 1
@@ -661,28 +2760,14 @@ def apply_file_sequential(file_entry: Dict) -> int:
             sys.stderr.write(out)
             sys.stderr.write(err)
             sys.stderr.write("=> ROLLBACK fichier en cours…\n")
-            if backups:
-                restore_from_backup(old_path, backups)
-            if (not old_exists_before) and os.path.exists(old_path):
-                try:
-                    os.remove(old_path)
-                    print(f"[ROLLBACK] Suppression fichier créé: {old_path}")
-                except Exception as e:
-                    sys.stderr.write(f"[WARN] Échec suppression {old_path}: {e}\n")
+            _rollback_file(old_path, backups, old_exists_before)
             sys.stderr.write("=======================================\n")
             return rc
 
-        if not _validate_python_syntax(old_path):
+        if validate == VALIDATE_PER_GROUP and not _validate_file(old_path, backups.get(old_path)):
             sys.stderr.write("==== ERREUR SYNTAXE détectée après patch ====\n")
             sys.stderr.write(f"=> ROLLBACK fichier: {old_path}\n")
-            if backups:
-                restore_from_backup(old_path, backups)
-            if (not old_exists_before) and os.path.exists(old_path):
-                try:
-                    os.remove(old_path)
-                    print(f"[ROLLBACK] Suppression fichier créé: {old_path}")
-                except Exception as e:
-                    sys.stderr.write(f"[WARN] Échec suppression {old_path}: {e}\n")
+            _rollback_file(old_path, backups, old_exists_before)
             sys.stderr.write("============================================\n")
             return 1
 
@@ -692,41 +2777,1426 @@ def apply_file_sequential(file_entry: Dict) -> int:
             current_lines = []
 
         search_from = new_search
+        if pivot is not None:
+            offset = _line_offset(res, pivot)
+
+    if validate == VALIDATE_PER_FILE and (backups or not old_exists_before) and os.path.exists(old_path):
+        if not _validate_file(old_path, backups.get(old_path)):
+            sys.stderr.write("==== ERREUR SYNTAXE détectée après patch ====\n")
+            sys.stderr.write(f"=> ROLLBACK fichier: {old_path}\n")
+            _rollback_file(old_path, backups, old_exists_before)
+            sys.stderr.write("============================================\n")
+            return 1
+
+    if not old_exists_before and os.path.exists(old_path):
+        _record_created(old_path)
+    return 0
+
+def _prepare_file_in_memory(file_entry: Dict, prev_prep: Optional[Dict] = None, opts: Optional[Dict] = None) -> Dict:
+    """FIX #20: Appliquer tous les groupes d'un fichier sur current_lines sans rien écrire (en partant du résultat prev_prep si fourni), puis valider selon opts['validate']; (entry,prev?,opts)->{path,rc,exists_before,base_lines,lines,changed,edits}."""
+    opts = make_options(opts)
+    old_path = normalize_old_path(file_entry["old"])
+    prep: Dict = {"path": old_path, "rc": 0, "exists_before": os.path.exists(old_path), "base_lines": [], "lines": [], "changed": False, "edits": [], "groups": []}
+
+    is_creation = bool(file_entry.get("is_creation"))
+    if prev_prep is not None:
+        base_lines = prev_prep["lines"]
+        prep["exists_before"] = prev_prep["exists_before"] or prev_prep["changed"]
+        prep["stamp"] = prev_prep["stamp"]
+    else:
+        # FIX #42: identité du fichier relevée avant lecture, recontrôlée sous verrou au commit
+        prep["stamp"] = _stat_key(old_path)
+        try:
+            mapped = None if is_creation else _map_large_file(old_path, opts)
+            base_lines = mapped if mapped is not None else [] if is_creation else read_file_lines(old_path)
+        except FileNotFoundError:
+            sys.stderr.write(f"[ERREUR] Fichier source introuvable: {old_path}\n")
+            prep["rc"] = 1
+            return prep
+
+    # FIX #36: fichier projeté en mémoire, pas d'index de lignes tant que les correspondances exactes suffisent
+    large = isinstance(base_lines, SplicedLines)
+    # fin de ligne du fichier (lignes projetées: octets recopiés tels quels)
+    prep["eol"] = prev_prep.get("eol", "\n") if prev_prep is not None else "\n" if large or is_creation else file_eol(old_path)
+    index = _take_warm_index(old_path, base_lines) if prev_prep is None and not large else None
+    if large:
+        current_lines = base_lines.copy()
+    else:
+        if index is None:
+            with _timed("index"):
+                index = LineIndex(base_lines)
+        current_lines = index.lines
+    prep["index"] = index
+    prep["base_lines"] = base_lines
+    prep["lines"] = current_lines
+    prep["orig_lines"] = prev_prep["orig_lines"] if prev_prep is not None else base_lines
+    prep["prev_edits"] = prev_prep["prev_edits"] + prev_prep["edits"] if prev_prep is not None else []
+    search_from = 0
+    cache = _group_cache(opts) if not large else None
+    state = _content_digest(base_lines) if cache is not None else ""
+
+    offset = 0
+    pivots: List[Optional[int]] = []
+    groups = _collect_file_groups(file_entry, pivots)
+    for group, pivot in zip(groups, pivots):
+        context_before, g_minus, g_plus, context_after = group
+        if not opts["line_hints"]:
+            pivot = None
+        expected = pivot + offset if pivot is not None else None
+        t0 = time.perf_counter()
+        gkey = _group_key(state, group, search_from, expected, opts["fuzzy_min_score"], opts["line_hints"]) if cache is not None else ""
+        cached = cache.get(gkey) if cache is not None else None
+        res = _resolve_from_cache(cached, current_lines, group) if cached is not None else None
+        if large:
+            res = _resolve_group_mapped(current_lines, context_before, g_minus, g_plus, context_after, search_from, expected)
+            if res is None:
+                # Repli sur le moteur normal pour la suite du fichier: lignes décodées et indexées une fois
+                large = False
+                with _timed("index"):
+                    index = LineIndex(current_lines)
+                    current_lines = index.lines
+                prep["lines"] = current_lines
+                prep["index"] = index
+        if res is None:
+            try:
+                res = _resolve_group(current_lines, context_before, g_minus, g_plus, context_after, search_from, old_path, index, opts["fuzzy_min_score"], expected)
+            except RuntimeError:
+                prep["rc"] = 1
+                return prep
+            if cache is not None and res["status"] in ("apply", "already"):
+                cache.put(gkey, res)
+        if cache is not None:
+            state = _next_state(gkey, res["status"])
+        _metrics_group(res, time.perf_counter() - t0)
+        # ligne du bloc remplacé, ou du bloc trouvé déjà en place (aucune pour un no-op ou un bloc introuvable)
+        at = res["start"] if res["status"] == "apply" else res.get("at") if res["status"] == "already" else None
+        prep["groups"].append({"status": res["status"], "mode": res.get("mode", ""), "line": at + 1 if at is not None else None})
+        if res.get("hint"):
+            prep["groups"][-1]["hint"] = res["hint"]
+
+        if res["status"] == "already":
+            print("[INFO] Groupe déjà appliqué: skip.")
+            continue
+        if res["status"] != "apply":
+            continue
+
+        inserted = _splice_group(current_lines, res, current_lines if large else index)
+        if inserted is None:
+            sys.stderr.write("==== ERREUR application en mémoire (hunk séquentiel) ====\n")
+            sys.stderr.write(f"Bloc attendu à la ligne {res['start'] + 1} absent de {old_path}\n")
+            sys.stderr.write(f"=> Fichier laissé intact: {old_path}\n")
+            sys.stderr.write("=======================================\n")
+            prep["rc"] = 1
+            return prep
+        prep["changed"] = True
+        prep["edits"].append((res["start"], len(res["old_block"]), inserted))
+
+        search_from = res["search_from"]
+        if pivot is not None:
+            offset = _line_offset(res, pivot)
+
+    if cache is not None:
+        cache.flush()
+    if not large:
+        # FIX #37: les blocs restent à l'index (gardé au chaud); validation, écriture et diff travaillent sur une liste
+        current_lines = prep["lines"] = list(current_lines)
+
+    if prep["changed"] and opts["validate"] != VALIDATE_OFF and _validator_for(old_path) is not None:
+        if not _validate_content(old_path, "".join(current_lines), base_lines):
+            sys.stderr.write("==== ERREUR SYNTAXE détectée après patch ====\n")
+            if opts["validate"] == VALIDATE_PER_GROUP:
+                _bisect_breaking_group(old_path, base_lines, prep["edits"])
+            sys.stderr.write(f"=> Fichier laissé intact: {old_path}\n")
+            sys.stderr.write("============================================\n")
+            prep["rc"] = 1
+            return prep
+
+    return prep
+
+@_instrumented("validate")
+def _bisect_breaking_group(old_path: str, base_lines: List[str], edits: List[Tuple[int, int, List[str]]]) -> Optional[int]:
+    """FIX #26: Retrouver par dichotomie le premier groupe appliqué après lequel le fichier devient invalide; (path,base,edits)->int 1-based|None."""
+    checker = _validator_for(old_path)
+    if checker is None or not edits:
+        return None
+    lo, hi = 0, len(edits)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if checker(old_path, "".join(_replay_edits(base_lines, edits[:mid]))) is None:
+            lo = mid
+        else:
+            hi = mid
+    start, _, new_lines = edits[hi - 1]
+    sys.stderr.write(f"[SYNTAX ERROR] Groupe #{hi}/{len(edits)} appliqué à la ligne {start + 1} ({len(new_lines)} ligne(s)) casse le fichier.\n")
+    return hi
+
+def _commit_prepared_file(prep: Dict, opts: Optional[Dict] = None) -> int:
+    """FIX #42: Committer le résultat préparé sous le verrou du fichier; s'il a changé depuis sa lecture, le résoudre à nouveau depuis le disque (au plus opts['conflict_retries'] fois, entrée non chaînée), sinon fichier laissé intact; (prep,opts?)->rc."""
+    opts = make_options(opts)
+    retries = opts["conflict_retries"] or 0
+    for attempt in itertools.count():
+        if prep["rc"] != 0 or not prep["changed"]:
+            return _write_prepared_file(prep)
+        try:
+            with file_lock(prep["path"], opts["lock_timeout"]):
+                if not _changed_on_disk(prep):
+                    return _write_prepared_file(prep)
+        except TimeoutError as e:
+            sys.stderr.write(f"[ERREUR] {e}: fichier laissé intact.\n")
+            _record_file_result(prep["path"], 1, False, prep["groups"])
+            return 1
+        if attempt >= retries or prep["prev_edits"] or "entry" not in prep:
+            break
+        print(f"[CONFLIT] {prep['path']} modifié par un autre processus depuis sa lecture: nouvelle résolution ({attempt + 1}/{retries}).")
+        prep = _prepare_metered(prep["entry"], None, opts, prep.get("metrics"))
+    sys.stderr.write(f"[ERREUR] {prep['path']} modifié par un autre processus pendant la résolution: fichier laissé intact.\n")
+    _record_file_result(prep["path"], 1, False, prep["groups"])
+    return 1
 
+def _write_prepared_file(prep: Dict) -> int:
+    """Sauvegarder puis écrire une seule fois, atomiquement, le résultat préparé; prep->rc."""
+    if prep["rc"] != 0 or not prep["changed"]:
+        if prep["rc"] == 0 and prep["exists_before"]:
+            _remember_lines(prep["path"], prep["lines"], prep.get("index"))
+        _record_file_result(prep["path"], prep["rc"], False, prep["groups"])
+        return prep["rc"]
+    old_path = prep["path"]
+    backups: Dict[str, str] = {}
+    with _metrics_scope(prep.get("metrics")):
+        if prep["exists_before"]:
+            backup_file_once(old_path, backups, link_ok=True)
+        try:
+            write_file_atomic(old_path, prep["lines"], prep.get("eol", "\n"))
+        except OSError as e:
+            _detach_backup(old_path, backups)
+            sys.stderr.write(f"[ERREUR] Écriture échouée pour {old_path}: {e}\n")
+            _record_file_result(old_path, 1, False, prep["groups"])
+            return 1
+        if not prep["exists_before"]:
+            _record_created(old_path)
+    if _line_cache is not None and isinstance(prep["lines"], list):
+        _remember_lines(old_path, prep["lines"], prep.get("index"))
+    _remember_final(prep)
+    _record_file_result(old_path, 0, True, prep["groups"])
     return 0
 
+def apply_file_sequential(file_entry: Dict, opts: Optional[Dict] = None) -> int:
+    """Appliquer séquentiellement les groupes d'un fichier (en mémoire, ou via 'patch' en compatibilité) avec validation syntaxique; (entry,opts)->rc."""
+    opts = make_options(opts)
+    rec = _metrics_new_file(normalize_old_path(file_entry["old"]))
+    if opts["engine"] == ENGINE_PATCH:
+        old_path = normalize_old_path(file_entry["old"])
+        before = _stat_key(old_path)
+        # Relectures et écritures entrelacées groupe par groupe: verrou tenu pendant tout le fichier
+        try:
+            with file_lock(old_path, opts["lock_timeout"]), _metrics_scope(rec):
+                rc = _apply_file_patch_engine(file_entry, opts)
+        except TimeoutError as e:
+            sys.stderr.write(f"[ERREUR] {e}: fichier laissé intact.\n")
+            rc = 1
+        _record_file_result(old_path, rc, rc == 0 and _stat_key(old_path) != before, None)
+        return rc
+    return _commit_prepared_file(_prepare_metered(file_entry, None, opts, rec), opts)
+
+def _prepare_metered(file_entry: Dict, prev_prep: Optional[Dict], opts: Dict, rec: Optional[Dict]) -> Dict:
+    """_prepare_file_in_memory avec temps/octets attribués à l'enregistrement de métriques rec (attaché à prep['metrics']); (entry,prev?,opts,rec)->prep."""
+    with _metrics_scope(rec):
+        prep = _prepare_file_in_memory(file_entry, prev_prep, opts)
+    prep["metrics"] = rec
+    prep["entry"] = file_entry  # FIX #42: nouvelle résolution en cas de conflit au commit
+    return prep
+
 # ===== PILOTAGE GLOBAL =====
-def apply_all(files: List[Dict]) -> int:
-    """Appliquer séquentiellement tous les fichiers; files->rc global."""
+def apply_all(files: Iterable[Dict], opts: Optional[Dict] = None) -> int:
+    """Appliquer tous les fichiers au fil de l'eau (séquentiel, ou préparation parallèle si opts['jobs']!=1); opts['fail_fast']: arrêt au premier fichier en échec; (files,opts)->rc global."""
+    opts = make_options(opts)
+    _configure_backups(opts)
+    if opts["jobs"] != 1 and opts["engine"] == ENGINE_PATCH:
+        sys.stderr.write("[WARN] --jobs ignoré avec --engine patch: application séquentielle.\n")
+        opts["jobs"] = 1
+    if opts["jobs"] != 1:
+        return _apply_all_parallel(files, opts)
+    first_rc = 0
     for fe in files:
-        rc = apply_file_sequential(fe)
+        rc = apply_file_sequential(fe, opts)
         if rc != 0:
-            return rc
+            if opts["fail_fast"]:
+                return rc
+            first_rc = first_rc or rc
+    return first_rc
+
+# ===== PARALLÉLISME MULTI-FICHIERS =====
+def _prepare_entry_worker(file_entry: Dict, prev_prep: Optional[Dict], opts: Dict) -> Dict:
+    """Worker: préparer une entrée en mémoire; sorties capturées dans prep['stdout'/'stderr']; (entry,prev?,opts)->prep."""
+    out, err = io.StringIO(), io.StringIO()
+    opts = dict(opts, large_file_bytes=None)  # une projection mmap ne traverse pas la frontière du processus
+    run_metrics = metrics_enable() if opts["metrics"] else None
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        prep = _prepare_metered(file_entry, prev_prep, opts, _metrics_new_file(normalize_old_path(file_entry["old"])))
+    prep["stdout"] = out.getvalue()
+    prep["stderr"] = err.getvalue()
+    prep.pop("index", None)  # coûteux à transférer, reconstruit au besoin
+    # prep['metrics'] et run_metrics['files'] partagent le même objet: le pickle de retour conserve ce lien
+    prep["metrics_run"] = run_metrics
+    return prep
+
+def _emit_prepared(prep: Dict) -> Dict:
+    """Recopier les sorties capturées d'un worker sur stdout/stderr et fusionner ses métriques; prep->prep."""
+    sys.stdout.write(prep.pop("stdout", ""))
+    sys.stdout.flush()
+    sys.stderr.write(prep.pop("stderr", ""))
+    _metrics_merge(prep.pop("metrics_run", None))
+    return prep
+
+def _iter_prepared(files: Iterable[Dict], opts: Dict, chain_in_memory: bool = True) -> Iterator[Dict]:
+    """Préparer en mémoire les entrées au fil du flux (pool de processus si jobs != 1) et les générer dans l'ordre du diff; une entrée répétant un chemin part du résultat précédent en mémoire (chain_in_memory) ou du disque une fois le précédent consommé; (files,opts,chain)->iter[prep]."""
+    jobs = opts["jobs"]
+    if jobs == 1:
+        last: Dict[str, Dict] = {}
+        for fe in files:
+            path = normalize_old_path(fe["old"])
+            prep = _prepare_metered(fe, last.get(path) if chain_in_memory else None, opts, _metrics_new_file(path))
+            if prep["rc"] == 0 and chain_in_memory:
+                last[path] = prep
+            yield prep
+        return
+
+    workers = jobs if jobs > 0 else (os.cpu_count() or 1)
+    window = workers * 4
+    pending: "collections.deque[concurrent.futures.Future]" = collections.deque()
+    tail: Dict[str, Tuple[concurrent.futures.Future, Optional[Dict]]] = {}
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        for fe in files:
+            path = normalize_old_path(fe["old"])
+            prev: Optional[Dict] = None
+            if path in tail:
+                fut_prev, ok_prev = tail[path]
+                if chain_in_memory:
+                    p_prev = fut_prev.result()
+                    prev = p_prev if p_prev["rc"] == 0 else ok_prev
+                else:
+                    # Le précédent doit être commité (consommé) avant de relire le disque
+                    while fut_prev in pending:
+                        yield _emit_prepared(pending.popleft().result())
+            fut = pool.submit(_prepare_entry_worker, fe, prev, opts)
+            tail[path] = (fut, prev if chain_in_memory else None)
+            pending.append(fut)
+            while pending and (pending[0].done() or len(pending) > window):
+                yield _emit_prepared(pending.popleft().result())
+        while pending:
+            yield _emit_prepared(pending.popleft().result())
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _apply_all_parallel(files: Iterable[Dict], opts: Dict) -> int:
+    """Préparer les fichiers dans un pool de processus puis committer dans l'ordre du diff (sorties stables par fichier); (files,opts)->rc."""
+    first_rc = 0
+    with contextlib.closing(_iter_prepared(files, opts, chain_in_memory=False)) as preps:
+        for prep in preps:
+            rc = _commit_prepared_file(prep, opts)
+            if rc != 0:
+                if opts["fail_fast"]:
+                    return rc
+                first_rc = first_rc or rc
+    return first_rc
+
+# ===== FIX #23: TRANSACTION MULTI-FICHIERS (COMMIT EN DEUX PHASES) =====
+def apply_transaction(files: Iterable[Dict], opts: Optional[Dict] = None) -> int:
+    """Tout ou rien: préparer et valider tous les fichiers en mémoire, puis commit en deux phases sous verrous; rien n'est écrit si un seul fichier échoue ou a un groupe introuvable; tout est résolu à nouveau si un fichier a changé depuis sa lecture (FIX #42); (files,opts)->rc."""
+    opts = make_options(opts, engine=ENGINE_MEMORY)
+    _configure_backups(opts)
+    files = list(files)
+    retries = opts["conflict_retries"] or 0
+    for attempt in itertools.count():
+        finals: Dict[str, Dict] = {}
+        changed: Dict[str, bool] = {}
+        first_rc = 0
+        failed: List[str] = []
+        with contextlib.closing(_iter_prepared(files, opts)) as preps:
+            for prep in preps:
+                path = prep["path"]
+                if prep["rc"] == 0 and any(g["status"] == "notfound" for g in prep["groups"]):
+                    # tout ou rien: un groupe introuvable fait échouer son fichier, donc la transaction
+                    sys.stderr.write(f"[TRANSACTION] {path}: groupe(s) introuvable(s).\n")
+                    prep["rc"] = 1
+                if prep["rc"] != 0:
+                    first_rc = first_rc or prep["rc"]
+                    failed.append(path)
+                    continue
+                finals[path] = prep
+                changed[path] = changed.get(path, False) or prep["changed"]
+
+        if failed:
+            sys.stderr.write(f"[TRANSACTION] Annulée: {len(failed)} fichier(s) en échec ({', '.join(failed)}); aucun fichier modifié.\n")
+            for path in failed:
+                _record_file_result(path, first_rc, False, None)
+            return first_rc
+
+        to_commit = [prep for path, prep in finals.items() if changed[path]]
+        rc = _commit_locked(to_commit, opts) if to_commit else 0
+        if rc is not None:
+            break
+        if attempt >= retries:
+            sys.stderr.write("[TRANSACTION] Annulée: fichiers modifiés par un autre processus à chaque tentative; aucun fichier modifié.\n")
+            rc = 1
+            break
+        print(f"[CONFLIT] Nouvelle résolution de la transaction ({attempt + 1}/{retries}).")
+    for path, prep in finals.items():
+        _record_file_result(path, rc, rc == 0 and changed[path], prep["groups"])
+    return rc
+
+def _commit_transaction(preps: List[Dict]) -> int:
+    """Phase 1: écrire chaque résultat dans un fichier temporaire voisin; phase 2: sauvegarde + os.replace; annule les renames déjà faits si un échoue; preps->rc."""
+    staged: List[Tuple[Dict, str]] = []
+    try:
+        for prep in preps:
+            with _metrics_scope(prep.get("metrics")):
+                staged.append((prep, _stage_file(prep["path"], prep["lines"], prep.get("eol", "\n"))))
+    except OSError as e:
+        sys.stderr.write(f"[TRANSACTION] Échec préparation de l'écriture: {e}; aucun fichier modifié.\n")
+        for _, tmp_path in staged:
+            _discard_staged(tmp_path)
+        return 1
+
+    done: List[Tuple[Dict, Dict[str, str]]] = []
+    for pos, (prep, tmp_path) in enumerate(staged):
+        old_path = prep["path"]
+        backups: Dict[str, str] = {}
+        if prep["exists_before"]:
+            with _metrics_scope(prep.get("metrics")):
+                backup_file_once(old_path, backups, link_ok=True)
+        try:
+            os.replace(tmp_path, old_path)
+        except OSError as e:
+            _detach_backup(old_path, backups)
+            sys.stderr.write(f"[TRANSACTION] Échec commit {old_path}: {e}\n=> ROLLBACK des fichiers déjà remplacés…\n")
+            for _, later_tmp in staged[pos:]:
+                _discard_staged(later_tmp)
+            for done_prep, done_backups in reversed(done):
+                _rollback_file(done_prep["path"], done_backups, done_prep["exists_before"])
+            return 1
+        if not prep["exists_before"]:
+            _record_created(old_path)
+        _remember_lines(old_path, prep["lines"])
+        _remember_final(prep)
+        done.append((prep, backups))
+    print(f"[TRANSACTION] Validée: {len(done)} fichier(s) modifié(s).")
     return 0
 
-# ===== MAIN =====
-stdin_text = sys.stdin.read()
-if not stdin_text.strip():
-    sys.stderr.write("Aucun diff reçu sur STDIN.\n")
-    sys.exit(1)
-
-files = parse_diff(stdin_text.splitlines(keepends=True))
-if not files:
-    sys.stderr.write("Diff invalide ou vide.\n")
-    sys.exit(1)
-
-_normalize_devnull_headers(files)
-
-rc = apply_all(files)
-if rc != 0:
-    sys.exit(rc)
-
-# FIX #17: Afficher diff -u pour chaque fichier modifié
-for src, bak in _all_backups.items():
-    if os.path.exists(src) and os.path.exists(bak):
-        sys.stdout.write(f"\n")
+# ===== FIX #29: DIFF UNIFIÉ EN PROCESSUS =====
+DIFF_FULL = "full"
+DIFF_SUMMARY = "summary"
+DIFF_NONE = "none"
+DIFF_EXACT_MAX_CELLS = 4_000_000  # au-delà, une zone sans ancre unique est rendue en bloc remplacé
+_COLORS = {"hdr": "\033[1m", "@": "\033[36m", "-": "\033[31m", "+": "\033[32m", "end": "\033[0m"}
+
+# FIX #29: (contenu d'origine, dernier contenu écrit, éditions depuis l'origine|None) des fichiers commités par le moteur mémoire
+_final_lines: Dict[str, Tuple[List[str], List[str], Optional[List[Tuple[int, int, List[str]]]]]] = {}
+
+def _remember_final(prep: Dict) -> None:
+    """Mémoriser pour le diff final l'origine (premier commit), le contenu écrit et les éditions cumulées d'un fichier; prep->None."""
+    path = prep["path"]
+    edits: Optional[List[Tuple[int, int, List[str]]]] = prep["prev_edits"] + prep["edits"]
+    known = _final_lines.get(path)
+    if known is None:
+        _final_lines[path] = (prep["orig_lines"], prep["lines"], edits)
+        return
+    before, after, prev_edits = known
+    # Entrée répétée relue depuis le disque: ses éditions prolongent les précédentes si elle part du dernier contenu écrit
+    edits = prev_edits + edits if prev_edits is not None and prep["orig_lines"] == after else None
+    _final_lines[path] = (before, prep["lines"], edits)
+
+def _edit_regions(edits: List[Tuple[int, int, List[str]]]) -> List[List[int]]:
+    """Zones modifiées [début, fin, delta de longueur] en coordonnées finales à partir d'éditions séquentielles (start, old_len, inserted); edits->regions."""
+    regions: List[List[int]] = []
+    for start, old_len, inserted in edits:
+        d = len(inserted) - old_len
+        lo, hi, delta = start, start + len(inserted), d
+        kept: List[List[int]] = []
+        for x, y, rd in regions:
+            if y < start:
+                kept.append([x, y, rd])
+            elif x > start + old_len:
+                kept.append([x + d, y + d, rd])
+            else:
+                lo = min(lo, x)
+                hi = max(hi, y + d if y > start + old_len else start + len(inserted))
+                delta += rd
+        kept.append([lo, hi, delta])
+        kept.sort()
+        regions = kept
+    return regions
+
+def _opcodes_from_edits(a: List[str], b: List[str], edits: List[Tuple[int, int, List[str]]]) -> List[Tuple[str, int, int, int, int]]:
+    """Opcodes de a vers b limités aux zones touchées par les éditions (le reste est égal par construction); (a,b,edits)->ops."""
+    ops: List[Tuple[str, int, int, int, int]] = []
+    ia = jb = 0
+    for lo, hi, delta in _edit_regions(edits):
+        i_lo = lo - (jb - ia)
+        if lo > jb:
+            ops.append(("equal", ia, i_lo, jb, lo))
+        raw: List[Tuple[str, int, int, int, int]] = []
+        _diff_range(a, i_lo, i_lo + (hi - lo) - delta, b, lo, hi, raw)
+        ops.extend(raw)
+        ia, jb = i_lo + (hi - lo) - delta, hi
+    if jb < len(b) or ia < len(a):
+        ops.append(("equal", ia, len(a), jb, len(b)))
+    return _merge_opcodes(ops)
+
+def _diff_range(a: List[str], alo: int, ahi: int, b: List[str], blo: int, bhi: int, ops: List[Tuple[str, int, int, int, int]]) -> None:
+    """Patience diff de a[alo:ahi] vs b[blo:bhi]: préfixe/suffixe communs, ancres = lignes uniques des deux côtés en LIS, récursion entre ancres; ajoute à ops."""
+    plo = 0
+    while alo + plo < ahi and blo + plo < bhi and a[alo + plo] == b[blo + plo]:
+        plo += 1
+    if plo:
+        ops.append(("equal", alo, alo + plo, blo, blo + plo))
+        alo += plo
+        blo += plo
+    slo = 0
+    while ahi - slo > alo and bhi - slo > blo and a[ahi - slo - 1] == b[bhi - slo - 1]:
+        slo += 1
+    ahi_in, bhi_in = ahi - slo, bhi - slo
+    _diff_middle(a, alo, ahi_in, b, blo, bhi_in, ops)
+    if slo:
+        ops.append(("equal", ahi_in, ahi, bhi_in, bhi))
+
+def _diff_middle(a: List[str], alo: int, ahi: int, b: List[str], blo: int, bhi: int, ops: List[Tuple[str, int, int, int, int]]) -> None:
+    """Cœur de _diff_range une fois préfixe et suffixe communs retirés; ajoute à ops."""
+    if alo == ahi and blo == bhi:
+        return
+    if alo == ahi:
+        ops.append(("insert", alo, alo, blo, bhi))
+        return
+    if blo == bhi:
+        ops.append(("delete", alo, ahi, blo, blo))
+        return
+    count_a: Dict[str, int] = {}
+    for i in range(alo, ahi):
+        count_a[a[i]] = count_a.get(a[i], 0) + 1
+    count_b: Dict[str, int] = {}
+    pos_b: Dict[str, int] = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        if count_a.get(line) == 1:
+            count_b[line] = count_b.get(line, 0) + 1
+            pos_b[line] = j
+    pairs = [(i, pos_b[a[i]]) for i in range(alo, ahi) if count_a[a[i]] == 1 and count_b.get(a[i]) == 1]
+    anchors = _longest_increasing_pairs(pairs)
+    if not anchors:
+        if (ahi - alo) * (bhi - blo) <= DIFF_EXACT_MAX_CELLS:
+            import difflib
+            for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False).get_opcodes():
+                ops.append((tag, alo + i1, alo + i2, blo + j1, blo + j2))
+        else:
+            ops.append(("replace", alo, ahi, blo, bhi))
+        return
+    ia, jb = alo, blo
+    for i, j in anchors:
+        _diff_range(a, ia, i, b, jb, j, ops)
+        ops.append(("equal", i, i + 1, j, j + 1))
+        ia, jb = i + 1, j + 1
+    _diff_range(a, ia, ahi, b, jb, bhi, ops)
+
+def _longest_increasing_pairs(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Plus longue sous-suite de paires (i croissant) dont les j sont croissants (patience sorting); pairs->pairs."""
+    tails: List[int] = []
+    tail_idx: List[int] = []
+    prev: List[int] = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(k)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos else -1
+    out: List[Tuple[int, int]] = []
+    k = tail_idx[-1] if tail_idx else -1
+    while k >= 0:
+        out.append(pairs[k])
+        k = prev[k]
+    out.reverse()
+    return out
+
+def line_opcodes(a: List[str], b: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    """Opcodes ('equal'|'replace'|'delete'|'insert', i1, i2, j1, j2) façon difflib, par patience diff; (a,b)->ops."""
+    raw: List[Tuple[str, int, int, int, int]] = []
+    _diff_range(a, 0, len(a), b, 0, len(b), raw)
+    return _merge_opcodes(raw)
+
+def _merge_opcodes(raw: List[Tuple[str, int, int, int, int]]) -> List[Tuple[str, int, int, int, int]]:
+    """Fusionner les opcodes adjacents de même nature (égaux / modifiés) et retirer les vides; ops->ops."""
+    ops: List[Tuple[str, int, int, int, int]] = []
+    for tag, i1, i2, j1, j2 in raw:
+        if i1 == i2 and j1 == j2:
+            continue
+        if ops and (ops[-1][0] == "equal") == (tag == "equal"):
+            _, pi1, _, pj1, _ = ops[-1]
+            if tag != "equal":
+                tag = "replace" if pi1 < i2 and pj1 < j2 else ("delete" if pi1 < i2 else "insert")
+            ops[-1] = (tag, pi1, i2, pj1, j2)
+            continue
+        ops.append((tag, i1, i2, j1, j2))
+    return ops
+
+def _group_opcodes(ops: List[Tuple[str, int, int, int, int]], n: int) -> Iterator[List[Tuple[str, int, int, int, int]]]:
+    """Regrouper les opcodes en hunks avec n lignes de contexte (même logique que difflib.get_grouped_opcodes); (ops,n)->iter[hunk]."""
+    if not ops:
+        return
+    codes = list(ops)
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    nn = n + n
+    group: List[Tuple[str, int, int, int, int]] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+def _unified_range(start: int, length: int) -> str:
+    """Plage d'en-tête de hunk au format diff -u ('l', 'l,n', 'l,0' pour vide); (start0,len)->str."""
+    beginning = start + 1
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+def _diff_line(prefix: str, line: str) -> str:
+    """Ligne de diff terminée par '\\n' (marqueur '\\ No newline at end of file' sinon); (prefix,line)->str."""
+    if line.endswith("\n"):
+        return prefix + line
+    return f"{prefix}{line}\n\\ No newline at end of file\n"
+
+def _paint(prefix: str, line: str, c: Dict[str, str]) -> str:
+    """Ligne '-'/'+' de diff, colorée si c porte des codes ANSI; (prefix,line,colors)->str."""
+    text = _diff_line(prefix, line)
+    if not c[prefix]:
+        return text
+    return c[prefix] + text.replace("\n", c["end"] + "\n", 1)
+
+def iter_unified_diff(a: List[str], b: List[str], from_hdr: str, to_hdr: str, context: int = 3, color: bool = False,
+                      edits: Optional[List[Tuple[int, int, List[str]]]] = None) -> Iterator[str]:
+    """Générer hunk par hunk le diff unifié de a vers b (format diff -u, couleur optionnelle); avec edits (a -> b), seules les zones éditées sont comparées; (a,b,headers,n,color,edits?)->iter[str]."""
+    c = _COLORS if color else dict.fromkeys(_COLORS, "")
+    started = False
+    ops = _opcodes_from_edits(a, b, edits) if edits is not None else line_opcodes(a, b)
+    for group in _group_opcodes(ops, context):
+        if not started:
+            yield f"{c['hdr']}--- {from_hdr}{c['end']}\n{c['hdr']}+++ {to_hdr}{c['end']}\n"
+            started = True
+        first, last = group[0], group[-1]
+        chunks = [f"{c['@']}@@ -{_unified_range(first[1], last[2] - first[1])} +{_unified_range(first[3], last[4] - first[3])} @@{c['end']}\n"]
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                chunks.extend(_diff_line(" ", l) for l in a[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                chunks.extend(_paint("-", l, c) for l in a[i1:i2])
+            if tag in ("replace", "insert"):
+                chunks.extend(_paint("+", l, c) for l in b[j1:j2])
+        yield "".join(chunks)
+
+def diff_stat(a: List[str], b: List[str], edits: Optional[List[Tuple[int, int, List[str]]]] = None) -> Tuple[int, int, int]:
+    """Résumé d'un diff: (lignes ajoutées, lignes supprimées, hunks à 3 lignes de contexte); (a,b,edits?)->(int,int,int)."""
+    ops = _opcodes_from_edits(a, b, edits) if edits is not None else line_opcodes(a, b)
+    added = sum(j2 - j1 for tag, _, _, j1, j2 in ops if tag in ("replace", "insert"))
+    removed = sum(i2 - i1 for tag, i1, i2, _, _ in ops if tag in ("replace", "delete"))
+    return added, removed, sum(1 for _ in _group_opcodes(ops, 3))
+
+def _file_stamp(path: str, label: Optional[str] = None) -> str:
+    """En-tête de diff 'chemin\\tdate' comme diff -u (date de modification, heure locale), chemin affiché remplacé par label si donné; (path,label?)->str."""
+    shown = label or path
+    try:
+        st = os.stat(path)
+    except OSError:
+        return shown
+    ts = __import__("datetime").datetime.fromtimestamp(st.st_mtime).astimezone()
+    return f"{shown}\t{ts.strftime('%Y-%m-%d %H:%M:%S')}.{st.st_mtime_ns % 1_000_000_000:09d} {ts.strftime('%z')}"
+
+@_instrumented("diff")
+def emit_final_diffs(opts: Optional[Dict] = None, out=None) -> None:
+    """FIX #17 + #29: Afficher, pour chaque fichier sauvegardé, le diff sauvegarde -> fichier rendu en processus (full), ou une ligne de résumé (summary); (opts,out)->None."""
+    opts = make_options(opts)
+    out = out or sys.stdout
+    mode = opts["diff"]
+    if mode == DIFF_NONE:
+        return
+    run_id = _backup_run["id"] if _backup_config["mode"] == BACKUP_STORE and _backup_run else None
+    for src, bak in _all_backups.items():
+        if not (os.path.exists(src) and os.path.exists(bak)):
+            continue
+        known = _final_lines.get(src)
+        try:
+            before, after, edits = known if known is not None else (read_file_lines(bak), read_file_lines(src), None)
+        except (OSError, UnicodeDecodeError) as e:
+            sys.stderr.write(f"[WARN] Diff impossible pour {src}: {e}\n")
+            continue
+        if mode == DIFF_SUMMARY:
+            added, removed, hunks = diff_stat(before, after, edits)
+            out.write(f"{src} | +{added} -{removed} ({hunks} hunk(s))\n")
+            continue
+        out.write("\n")
+        # Magasin: l'objet (objects/ab/abcd…) ne dit rien au lecteur, l'en-tête montre le fichier et son exécution
+        old_hdr = f"{_file_stamp(bak, src)} (run {run_id})" if run_id else _file_stamp(bak)
+        for chunk in iter_unified_diff(before, after, old_hdr, _file_stamp(src), opts["diff_context"], opts["color"], edits):
+            out.write(chunk)
+        out.flush()
+
+# ===== FIX #31: MODE BATCH (PLUSIEURS DIFFS, UN SEUL PROCESSUS) =====
+BATCH_SUFFIXES = (".diff", ".patch")
+
+# Résultats par fichier de l'application en cours (un enregistrement par entrée du diff)
+_file_results: List[Dict] = []
+
+def _record_file_result(path: str, rc: int, changed: bool, groups: Optional[List[Dict]]) -> None:
+    """Enregistrer l'issue d'une entrée: applied | unchanged | failed, avec le décompte des groupes par verdict et leur détail; (path,rc,changed,groups)->None."""
+    rec: Dict = {"path": path, "rc": rc, "status": "failed" if rc else ("applied" if changed else "unchanged")}
+    if groups is not None:
+        counts: Dict[str, int] = {}
+        for g in groups:
+            counts[g["status"]] = counts.get(g["status"], 0) + 1
+        rec["groups"] = counts
+        rec["details"] = [dict(g) for g in groups]
+    _file_results.append(rec)
+
+def _reset_run_state() -> None:
+    """Oublier l'état global d'une application (sauvegardes, diff final, résultats, exécution du magasin) avant le diff suivant; ->None."""
+    global _backup_run
+    _all_backups.clear()
+    _final_lines.clear()
+    _file_results.clear()
+    _backup_run = None
+
+def _stream_entries(stream: Iterable[str]) -> Optional[Iterator[Dict]]:
+    """Entrées du diff parsées au fil du flux, ou None (message sur stderr) si le flux est vide ou sans entrée; lignes->iter[entry]|None."""
+    stdin_lines = _skip_leading_blank(stream)
+    if stdin_lines is None:
+        sys.stderr.write("Aucun diff reçu sur STDIN.\n")
+        return None
+
+    # FIX #24: parsing en flux, chaque fichier est appliqué dès que son entrée est complète
+    entries = _timed_iter("parse", iter_parse_diff(stdin_lines))
+    first = next(entries, None)
+    if first is None:
+        sys.stderr.write("Diff invalide ou vide.\n")
+        return None
+    return (_normalize_devnull_entry(fe) for fe in itertools.chain([first], entries))
+
+def apply_diff_stream(stream: Iterable[str], opts: Dict) -> int:
+    """Parser en flux et appliquer un diff, puis rétention du magasin et diff final; (lignes,opts)->rc."""
+    files = _stream_entries(stream)
+    if files is None:
+        return 1
+    if opts["transaction"]:
+        rc = apply_transaction(files, opts)
+    else:
+        rc = apply_all(files, opts)
+    return _finish_run(rc, opts)
+
+def _finish_run(rc: int, opts: Dict) -> int:
+    """Fin d'une application: exécution du magasin annoncée puis rétention, archives --bundles des fichiers modifiés mises à jour, diff final (sauf échec en fail-fast); (rc,opts)->rc."""
+    if _backup_run is not None:
+        print(f"[BACKUP] Exécution {_backup_run['id']} (annuler: --restore {_backup_run['id']})")
+        prune_backups(opts)
+    if opts["bundles"]:
+        changed = [r["path"] for r in _file_results if r["status"] == "applied"]
+        if changed and refresh_bundles(changed, opts) != 0:
+            rc = rc or 1
+    if rc != 0 and opts["fail_fast"]:
+        return rc
+
+    # FIX #17 + #29: diff de chaque fichier modifié, rendu en processus depuis les contenus en mémoire
+    emit_final_diffs(opts)
+    return rc
+
+def _batch_inputs(paths: List[str]) -> List[str]:
+    """Développer les arguments de --batch: fichiers tels quels, dossiers en leurs *.diff/*.patch triés par nom; paths->list[str]."""
+    out: List[str] = []
+    for p in paths:
+        if os.path.isdir(p):
+            out.extend(os.path.join(p, n) for n in sorted(os.listdir(p))
+                       if n.endswith(BATCH_SUFFIXES) and not n.startswith(".") and os.path.isfile(os.path.join(p, n)))
+        else:
+            out.append(p)
+    return out
+
+def apply_diff_file(diff_path: str, opts: Dict) -> Dict:
+    """Appliquer un fichier diff (état global remis à zéro avant) et retourner son enregistrement de résultat; (path,opts)->record."""
+    _reset_run_state()
+    t0 = time.perf_counter()
+    try:
+        with open(diff_path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            rc = apply_diff_stream(f, opts)
+    except OSError as e:
+        sys.stderr.write(f"[ERREUR] Lecture du diff impossible: {diff_path}: {e}\n")
+        rc = 1
+    return {"diff": diff_path, "rc": rc, "status": "ok" if rc == 0 else "failed",
+            "run_id": _backup_run["id"] if _backup_run else None,
+            "seconds": round(time.perf_counter() - t0, 6), "files": list(_file_results)}
+
+def _emit_result(record: Dict, results_out: str) -> None:
+    """Écrire l'enregistrement d'un diff: ligne '[RESULT] {json}' sur stdout ('-') ou ligne JSON ajoutée au fichier; (record,dest)->None."""
+    line = json.dumps(record, ensure_ascii=False)
+    if results_out == "-":
+        print(f"[RESULT] {line}")
         sys.stdout.flush()
-        subprocess.run(["diff", "-u", bak, src])
+        return
+    with open(results_out, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+def run_batch(paths: List[str], opts: Dict, results_out: str = "-") -> int:
+    """--batch: appliquer dans l'ordre chaque diff (fichiers, ou *.diff/*.patch des dossiers) dans ce processus, lignes des fichiers gardées au chaud; (paths,opts,dest)->rc du premier échec."""
+    enable_line_cache()
+    first_rc = 0
+    for diff_path in _batch_inputs(paths):
+        record = apply_diff_file(diff_path, opts)
+        _emit_result(record, results_out)
+        first_rc = first_rc or record["rc"]
+    return first_rc
+
+def run_spool(spool_dir: str, opts: Dict, results_out: str = "-", poll: float = 1.0, once: bool = False) -> int:
+    """--spool: surveiller un dossier, appliquer chaque nouveau *.diff/*.patch par ordre de nom puis le ranger dans done/ ou failed/; (dir,opts,dest,poll,once)->rc."""
+    enable_line_cache()
+    for sub in ("done", "failed"):
+        os.makedirs(os.path.join(spool_dir, sub), exist_ok=True)
+    first_rc = 0
+    try:
+        while True:
+            pending = _batch_inputs([spool_dir])
+            if not pending:
+                if once:
+                    break
+                time.sleep(poll)
+                continue
+            for diff_path in pending:
+                record = apply_diff_file(diff_path, opts)
+                dest = os.path.join(spool_dir, "done" if record["rc"] == 0 else "failed", os.path.basename(diff_path))
+                try:
+                    os.replace(diff_path, dest)
+                    record["moved_to"] = dest
+                except OSError as e:
+                    sys.stderr.write(f"[WARN] Diff non déplacé ({diff_path}): {e}\n")
+                _emit_result(record, results_out)
+                first_rc = first_rc or record["rc"]
+    except KeyboardInterrupt:
+        sys.stderr.write("[SPOOL] Arrêt demandé.\n")
+    return first_rc
+
+# ===== FIX #39: API PYTHON (apply_patch) =====
+# Verdicts de groupe exposés aux appelants (API, serveur)
+GROUP_VERDICTS = {"apply": "applied", "already": "already-applied", "notfound": "not-found"}
+# Dossier courant, stdout/stderr et état d'exécution sont globaux au processus: un seul appel à la fois
+_API_LOCK = threading.Lock()
+
+def _file_result_view(rec: Dict) -> Dict:
+    """Traduire l'enregistrement d'une entrée pour l'appelant: verdicts de groupes applied | already-applied | not-found (+ indice); rec->dict."""
+    out: Dict = {"path": rec["path"], "rc": rec["rc"], "status": rec["status"], "groups": []}
+    for g in rec.get("details", []):
+        item = {"status": GROUP_VERDICTS.get(g["status"], g["status"]), "mode": g.get("mode", ""), "line": g.get("line")}
+        if g.get("hint"):
+            item["hint"] = g["hint"]
+        out["groups"].append(item)
+    return out
+
+def apply_patch(text: str, root: Optional[str] = None, options: Optional[Dict] = None) -> Dict:
+    """Appliquer le diff text aux fichiers sous root (défaut: dossier courant, chdir le temps de l'appel) sans rien écrire sur stdout/stderr ni quitter; options: clés de DEFAULT_OPTIONS (ValueError sinon); retourne {rc, status: applied|already-applied|not-found|failed, files: [{path, rc, status, groups: [{status, mode, line|None, hint?}]}], run_id, seconds, stdout, stderr}; non réentrant: les appels concurrents (threads) sont sérialisés par _API_LOCK, et pendant un appel le dossier courant et sys.stdout/sys.stderr du processus entier sont détournés; (texte,root?,options?)->dict."""
+    unknown = sorted(set(options or {}) - set(DEFAULT_OPTIONS))
+    if unknown:
+        raise ValueError(f"option(s) inconnue(s): {', '.join(unknown)}")
+    with _API_LOCK:
+        return _apply_patch_locked(text, root, make_options(options))
+
+def _apply_patch_locked(text: str, root: Optional[str], opts: Dict) -> Dict:
+    """Corps d'apply_patch, sous _API_LOCK; (texte,root?,opts)->dict."""
+    out, err = io.StringIO(), io.StringIO()
+    home = os.getcwd()
+    t0 = time.perf_counter()
+    error = None
+    _reset_run_state()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                os.chdir(root or home)
+                rc = apply_diff_stream(io.StringIO(text or ""), opts)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                sys.stderr.write(f"[ERREUR] {error}\n")
+                rc = 1
+    finally:
+        os.chdir(home)
+    files = [_file_result_view(r) for r in _file_results]
+    verdicts = [g["status"] for f in files for g in f["groups"]]
+    if "not-found" in verdicts:
+        status = "not-found"
+    elif rc != 0:
+        status = "failed"
+    elif any(f["status"] == "applied" for f in files):
+        status = "applied"
+    else:
+        status = "already-applied"
+    result = {"rc": rc, "status": status, "files": files, "run_id": _backup_run["id"] if _backup_run else None,
+              "seconds": round(time.perf_counter() - t0, 6), "stdout": out.getvalue(), "stderr": err.getvalue()}
+    if error is not None:
+        result["error"] = error
+    return result
+
+# ===== FIX #40: PLAN RÉSOLU (--plan / --replay) =====
+PLAN_FORMAT = "super_patch-plan"
+PLAN_VERSION = 1
+
+def build_plan(files: Iterable[Dict], opts: Optional[Dict] = None) -> Tuple[int, Dict]:
+    """Résoudre et valider en mémoire toutes les entrées sans rien écrire, puis décrire par fichier modifié l'empreinte du contenu de départ, celle du résultat et les éditions (début, lignes retirées, lignes insérées, indentation déjà ajustée); (files,opts)->(rc, plan)."""
+    opts = make_options(opts, engine=ENGINE_MEMORY)
+    finals: Dict[str, Dict] = {}
+    first_rc = 0
+    with contextlib.closing(_iter_prepared(files, opts)) as preps:
+        for prep in preps:
+            if prep["rc"] != 0:
+                first_rc = first_rc or prep["rc"]
+                if opts["fail_fast"]:
+                    break
+                continue
+            finals[prep["path"]] = prep
+    plan: Dict = {"format": PLAN_FORMAT, "version": PLAN_VERSION, "files": []}
+    for path, prep in finals.items():
+        edits = prep["prev_edits"] + prep["edits"]
+        if not edits:
+            continue
+        plan["files"].append({"path": path, "exists": os.path.exists(path),
+                              "sha256": _content_digest(prep["orig_lines"]), "result_sha256": _content_digest(prep["lines"]),
+                              "edits": [[start, old_len, list(new_lines)] for start, old_len, new_lines in edits]})
+    return first_rc, plan
+
+def apply_plan(plan: Dict, opts: Optional[Dict] = None) -> int:
+    """Rejouer un plan sans aucune recherche: chaque fichier doit avoir l'empreinte de départ du plan (ou déjà celle du résultat: ignoré), sinon rien n'est écrit; puis commit en deux phases; (plan,opts)->rc."""
+    opts = make_options(opts, engine=ENGINE_MEMORY)
+    if plan.get("format") != PLAN_FORMAT or plan.get("version") != PLAN_VERSION:
+        sys.stderr.write(f"[ERREUR] Plan illisible: format {plan.get('format')!r} version {plan.get('version')!r} (attendu {PLAN_FORMAT!r} {PLAN_VERSION})\n")
+        return 1
+    _configure_backups(opts)
+    preps: List[Dict] = []
+    failed: List[str] = []
+    for entry in plan.get("files", []):
+        path = entry["path"]
+        stamp = _stat_key(path)
+        exists = stamp is not None
+        try:
+            current = read_file_lines(path) if exists else []
+        except (OSError, UnicodeDecodeError) as e:
+            sys.stderr.write(f"[ERREUR] Lecture impossible: {path}: {e}\n")
+            failed.append(path)
+            continue
+        digest = _content_digest(current)
+        if exists and digest == entry["result_sha256"]:
+            print(f"[INFO] Plan déjà appliqué: {path}")
+            _record_file_result(path, 0, False, None)
+            continue
+        if exists != entry["exists"] or digest != entry["sha256"]:
+            sys.stderr.write(f"[ERREUR] {path}: contenu différent de celui pour lequel le plan a été résolu "
+                             f"(sha256 {digest[:12]}, attendu {entry['sha256'][:12]})\n")
+            failed.append(path)
+            continue
+        edits = [(start, old_len, new_lines) for start, old_len, new_lines in entry["edits"]]
+        with _timed("splice"):
+            lines = _replay_edits(current, edits)
+        if _content_digest(lines) != entry["result_sha256"]:
+            sys.stderr.write(f"[ERREUR] {path}: plan incohérent (résultat rejoué différent de l'empreinte enregistrée)\n")
+            failed.append(path)
+            continue
+        preps.append({"path": path, "rc": 0, "exists_before": exists, "base_lines": current, "lines": lines, "changed": True,
+                      "edits": edits, "groups": [], "orig_lines": current, "prev_edits": [], "stamp": stamp,
+                      "eol": file_eol(path) if exists else "\n"})
+    if failed:
+        sys.stderr.write(f"[REPLAY] Annulé: {len(failed)} fichier(s) refusé(s) ({', '.join(failed)}); aucun fichier modifié.\n")
+        for path in failed:
+            _record_file_result(path, 1, False, None)
+        return 1
+    rc = _commit_locked(preps, opts) if preps else 0
+    if rc is None:
+        sys.stderr.write("[REPLAY] Annulé: fichier(s) modifié(s) pendant le rejeu; aucun fichier modifié.\n")
+        rc = 1
+    for prep in preps:
+        _record_file_result(prep["path"], rc, rc == 0, None)
+    return rc
+
+def run_plan(stream: Iterable[str], opts: Dict, plan_path: str) -> int:
+    """--plan: résoudre le diff de STDIN et écrire le plan (JSON compact) dans plan_path, arborescence inchangée; (lignes,opts,path)->rc."""
+    files = _stream_entries(stream)
+    if files is None:
+        return 1
+    rc, plan = build_plan(files, opts)
+    if rc != 0:
+        sys.stderr.write("[PLAN] Résolution en échec: aucun plan écrit.\n")
+        return rc
+    with open(plan_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        json.dump(plan, f, ensure_ascii=False, separators=(",", ":"))
+        f.write("\n")
+    edits = sum(len(e["edits"]) for e in plan["files"])
+    print(f"[PLAN] {len(plan['files'])} fichier(s), {edits} édition(s) -> {plan_path}")
+    return 0
+
+def run_replay(plan_path: str, opts: Dict) -> int:
+    """--replay: rejouer le plan plan_path (empreintes vérifiées, aucune recherche), puis rétention du magasin et diff final; (path,opts)->rc."""
+    try:
+        with open(plan_path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"[ERREUR] Plan illisible: {plan_path}: {e}\n")
+        return 1
+    return _finish_run(apply_plan(plan, opts), opts)
+
+# ===== FIX #43: ARCHIVES new_manager INCRÉMENTALES (--bundles) =====
+def parse_bundle_script(script_path: str) -> Dict:
+    """Lire les archives d'un script de génération (new_generate_manager_tars.sh): dossier du 'cd', puis pour chaque 'tar -cf ARCHIVE' ses membres et motifs --exclude (lignes continuées par '\\' jointes, autres commandes ignorées); path->{root, bundles:[{tar, members, excludes}]}."""
+    with open(script_path, "r", encoding="utf-8") as f:
+        text = f.read().replace("\\\n", " ")
+    root: Optional[str] = None
+    bundles: List[Dict] = []
+    for line in text.splitlines():
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError:
+            continue
+        if len(words) >= 2 and words[0] == "cd":
+            root = words[1]
+        elif words and words[0] == "tar" and "-cf" in words[:-1]:
+            pos = words.index("-cf")
+            bundle: Dict = {"tar": words[pos + 1], "members": [], "excludes": []}
+            rest = iter(words[1:pos] + words[pos + 2:])
+            for w in rest:
+                if w.startswith("--exclude="):
+                    bundle["excludes"].append(w[len("--exclude="):])
+                elif w == "--exclude":
+                    bundle["excludes"].append(next(rest, ""))
+                elif not w.startswith("-"):
+                    bundle["members"].append(w)
+            bundles.append(bundle)
+    return {"root": root, "bundles": bundles}
+
+def _bundle_name(name: str) -> str:
+    """Nom de membre d'archive sans './' de tête ('.' -> ''), comme comparé aux chemins modifiés; name->str."""
+    name = name.rstrip("/")
+    while name.startswith("./"):
+        name = name[2:]
+    return "" if name == "." else name
+
+def _bundle_excluded(rel: str, excludes: List[str]) -> bool:
+    """rel (ou l'un de ses dossiers parents) est-il écarté par un motif --exclude de tar (noms en './…')?; (rel,motifs)->bool."""
+    parts = rel.split("/")
+    return any(fnmatch.fnmatchcase("./" + "/".join(parts[:k]), pat) for k in range(1, len(parts) + 1) for pat in excludes)
+
+def _bundle_contains(bundle: Dict, rel: str) -> bool:
+    """rel (relatif au dossier du script) est-il dans l'archive: égal à un membre ou sous un membre dossier, et non exclu; (bundle,rel)->bool."""
+    for member in map(_bundle_name, bundle["members"]):
+        if member == "" or rel == member or rel.startswith(member + "/"):
+            return not _bundle_excluded(rel, bundle["excludes"])
+    return False
+
+def _bundle_add(out: tarfile.TarFile, root: str, rel: str) -> None:
+    """Ajouter un chemin du disque (non récursif) sous le nom './rel'; (archive,racine,rel)->None."""
+    path = os.path.join(root, rel)
+    info = out.gettarinfo(path, arcname="./" + rel if rel else ".")
+    if info.isreg():
+        with open(path, "rb") as f:
+            out.addfile(info, f)
+    else:
+        out.addfile(info)
+
+def _build_bundle(out: tarfile.TarFile, root: str, bundle: Dict) -> None:
+    """Construire une archive complète comme 'tar -cf' (membres parcourus récursivement, exclusions appliquées); (archive,racine,bundle)->None."""
+    for member in map(_bundle_name, bundle["members"]):
+        if not os.path.lexists(os.path.join(root, member)) or (member and _bundle_excluded(member, bundle["excludes"])):
+            continue
+        _bundle_add(out, root, member)
+        if not os.path.isdir(os.path.join(root, member)) or os.path.islink(os.path.join(root, member)):
+            continue
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root, member)):
+            base = os.path.relpath(dirpath, root).replace(os.sep, "/")
+            base = "" if base == "." else base + "/"
+            dirnames[:] = sorted(d for d in dirnames if not _bundle_excluded(base + d, bundle["excludes"]))
+            for name in sorted(dirnames) + sorted(filenames):
+                if not _bundle_excluded(base + name, bundle["excludes"]):
+                    _bundle_add(out, root, base + name)
+
+def _repack_bundle(out: tarfile.TarFile, tar_path: str, root: str, bundle: Dict, changed: List[str]) -> Tuple[int, int, int]:
+    """Recopier l'archive existante membre par membre (données relues depuis l'ancienne archive), en reprenant du disque les seuls chemins modifiés, retirant ceux supprimés et ajoutant à la fin les nouveaux (dossiers parents manquants de l'archive compris); (archive,chemin,racine,bundle,modifiés)->(remplacés, ajoutés, retirés)."""
+    pending = set(changed)
+    names = set()
+    replaced = removed = 0
+    with tarfile.open(tar_path, "r:") as old:
+        for info in old:
+            name = _bundle_name(info.name)
+            names.add(name)
+            if name in pending:
+                pending.discard(name)
+                if os.path.lexists(os.path.join(root, name)):
+                    _bundle_add(out, root, name)
+                    replaced += 1
+                else:
+                    removed += 1
+                continue
+            out.addfile(info, old.extractfile(info) if info.isreg() else None)
+    added = 0
+    for rel in sorted(pending):
+        if not os.path.lexists(os.path.join(root, rel)):
+            continue
+        parts = rel.split("/")
+        for k in range(1, len(parts)):
+            parent = "/".join(parts[:k])
+            if parent not in names and _bundle_contains(bundle, parent):
+                _bundle_add(out, root, parent)
+                names.add(parent)
+        _bundle_add(out, root, rel)
+        names.add(rel)
+        added += 1
+    return replaced, added, removed
+
+def _umask() -> int:
+    """Masque de création de fichiers du processus (lu sans le modifier durablement); ->int."""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+def refresh_bundles(paths: Iterable[str], opts: Optional[Dict] = None) -> int:
+    """Réécrire les seules archives du script opts['bundles'] contenant un des chemins modifiés (membres inchangés recopiés, archive absente construite entièrement), chacune via fichier temporaire + os.replace; (paths,opts)->rc."""
+    opts = make_options(opts)
+    try:
+        script = parse_bundle_script(opts["bundles"])
+    except OSError as e:
+        sys.stderr.write(f"[ERREUR] Script des archives illisible: {opts['bundles']}: {e}\n")
+        return 1
+    root = os.path.abspath(opts["bundle_root"] or script["root"] or ".")
+    rels = []
+    for path in paths:
+        rel = os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+        if rel != ".." and not rel.startswith("../"):
+            rels.append(rel)
+    rc = 0
+    touched = 0
+    with _timed("bundles"):
+        for bundle in script["bundles"]:
+            changed = [rel for rel in rels if _bundle_contains(bundle, rel)]
+            if not changed:
+                continue
+            tar_path = os.path.join(opts["bundle_dir"], os.path.basename(bundle["tar"])) if opts["bundle_dir"] else bundle["tar"]
+            existed = os.path.exists(tar_path)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(tar_path)), prefix=f".{os.path.basename(tar_path)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w", format=tarfile.GNU_FORMAT) as out:
+                    if existed:
+                        replaced, added, removed = _repack_bundle(out, tar_path, root, bundle, changed)
+                    else:
+                        _build_bundle(out, root, bundle)
+                if existed:
+                    shutil.copymode(tar_path, tmp_path)
+                else:
+                    os.chmod(tmp_path, 0o666 & ~_umask())
+                os.replace(tmp_path, tar_path)
+            except (OSError, tarfile.TarError) as e:
+                _discard_staged(tmp_path)
+                sys.stderr.write(f"[ERREUR] Archive {tar_path} non mise à jour: {e}\n")
+                rc = 1
+                continue
+            touched += 1
+            if existed:
+                print(f"[BUNDLE] {tar_path}: {replaced} remplacé(s), {added} ajouté(s), {removed} retiré(s)")
+            else:
+                print(f"[BUNDLE] {tar_path}: absente, construite entièrement")
+    print(f"[BUNDLE] {touched}/{len(script['bundles'])} archive(s) mise(s) à jour")
+    return rc
+
+# ===== FIX #32: MODE SERVEUR (SOCKET UNIX) =====
+# Options qu'une requête peut surcharger; le reste (cache, sauvegardes, jobs) reste celui du serveur
+DAEMON_REQUEST_OPTIONS = ("engine", "fail_fast", "transaction", "validate", "diff", "diff_context", "color", "fuzzy_min_score", "line_hints")
+
+_daemon_state: Dict = {"stop": False, "served": 0, "started": 0.0}
+
+def _daemon_option_ok(key: str, value) -> bool:
+    """Valeur d'option de requête du même type que celle de DEFAULT_OPTIONS (nombre ou None pour fuzzy_min_score); (clé,valeur)->bool."""
+    if key == "fuzzy_min_score":
+        return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+    expected = type(DEFAULT_OPTIONS[key])
+    return isinstance(value, expected) and (expected is bool or not isinstance(value, bool))
+
+def _daemon_apply(req: Dict, opts: Dict) -> Dict:
+    """Appliquer le diff d'une requête dans son dossier de travail via apply_patch (options de la requête limitées à DAEMON_REQUEST_OPTIONS); (req,opts)->réponse."""
+    cwd = req.get("cwd")
+    if cwd is not None and (not isinstance(cwd, str) or not os.path.isdir(cwd)):
+        return {"ok": False, "error": f"cwd invalide: {cwd!r}"}
+    options = req.get("options") or {}
+    if not isinstance(options, dict):
+        return {"ok": False, "error": "options: objet JSON attendu"}
+    run_opts = dict(opts)
+    for k, v in options.items():
+        if k in DAEMON_REQUEST_OPTIONS:
+            if not _daemon_option_ok(k, v):
+                return {"ok": False, "error": f"option invalide: {k}={v!r}"}
+            run_opts[k] = v
+    return apply_patch(req.get("diff") or "", cwd, run_opts)
+
+def handle_daemon_request(req: Dict, opts: Dict) -> Dict:
+    """Traiter une requête du serveur: {'cmd': 'apply'|'ping'|'stats'|'shutdown', ...}; (req,opts)->réponse."""
+    cmd = req.get("cmd", "apply")
+    if cmd == "ping":
+        return {"ok": True, "pid": os.getpid()}
+    if cmd == "stats":
+        cached = _line_cache or {}
+        return {"ok": True, "pid": os.getpid(), "served": _daemon_state["served"],
+                "uptime": round(time.time() - _daemon_state["started"], 3),
+                "cached_files": len(cached), "indexed_files": sum(1 for e in cached.values() if e[2] is not None)}
+    if cmd == "shutdown":
+        _daemon_state["stop"] = True
+        return {"ok": True}
+    if cmd != "apply":
+        return {"ok": False, "error": f"commande inconnue: {cmd}"}
+    _daemon_state["served"] += 1
+    return _daemon_apply(req, opts)
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    """Connexion cliente: une requête JSON par ligne, une réponse JSON par ligne."""
+
+    def handle(self) -> None:
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            try:
+                req = json.loads(raw)
+                if not isinstance(req, dict):
+                    raise ValueError("objet JSON attendu")
+                resp = handle_daemon_request(req, self.server.opts)  # type: ignore[attr-defined]
+            except ValueError as e:
+                resp = {"ok": False, "error": f"requête invalide: {e}"}
+            except Exception as e:  # une requête qui échoue ne doit pas couper la connexion
+                resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if _daemon_state["stop"]:
+                return
+
+def serve(socket_path: str, opts: Dict) -> int:
+    """--serve: écouter sur un socket Unix et appliquer les diffs reçus un par un, fichiers gardés au chaud entre requêtes; (path,opts)->rc."""
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            sys.stderr.write(f"[ERREUR] Un serveur écoute déjà sur {socket_path}\n")
+            return 1
+        except OSError:
+            os.unlink(socket_path)  # socket orphelin d'un serveur arrêté
+        finally:
+            probe.close()
+    enable_line_cache()
+    old_umask = os.umask(0o177)  # socket accessible au seul propriétaire
+    try:
+        server = socketserver.UnixStreamServer(socket_path, _DaemonHandler)
+    finally:
+        os.umask(old_umask)
+    server.opts = opts  # type: ignore[attr-defined]
+    _daemon_state.update(stop=False, served=0, started=time.time())
+    sys.stderr.write(f"[SERVE] En écoute sur {socket_path} (pid {os.getpid()})\n")
+    try:
+        while not _daemon_state["stop"]:
+            server.handle_request()
+    except KeyboardInterrupt:
+        sys.stderr.write("[SERVE] Arrêt demandé.\n")
+    finally:
+        server.server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(socket_path)
+    return 0
+
+def daemon_call(socket_path: str, req: Dict) -> Dict:
+    """Envoyer une requête au serveur et attendre sa réponse; (path,req)->réponse."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(req, ensure_ascii=False) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise OSError(f"connexion fermée par le serveur ({socket_path})")
+    return json.loads(line)
+
+def run_client(socket_path: str, opts: Dict, stream: Iterable[str]) -> int:
+    """--client: faire appliquer le diff de STDIN par le serveur, puis reproduire ses sorties et une ligne [RESULT]; (path,opts,stream)->rc."""
+    req = {"cmd": "apply", "diff": "".join(stream), "cwd": os.getcwd(),
+           "options": {k: opts[k] for k in DAEMON_REQUEST_OPTIONS}}
+    try:
+        resp = daemon_call(socket_path, req)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"[ERREUR] Serveur injoignable ({socket_path}): {e}\n")
+        return 1
+    if "rc" not in resp:
+        sys.stderr.write(f"[ERREUR] {resp.get('error', 'réponse invalide')}\n")
+        return 1
+    sys.stderr.write(resp.pop("stderr", ""))
+    sys.stdout.write(resp.pop("stdout", ""))
+    print(f"[RESULT] {json.dumps(resp, ensure_ascii=False)}")
+    return resp["rc"]
+
+# ===== MAIN =====
+def _skip_leading_blank(stream: Iterable[str]) -> Optional[Iterator[str]]:
+    """Consommer les lignes vides initiales; retourne un itérateur reprenant à la première ligne non vide, ou None si le flux est vide; stream->iter|None."""
+    it = iter(stream)
+    for line in it:
+        if line.strip():
+            return itertools.chain([line], it)
+    return None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Point d'entrée CLI: lire le diff sur STDIN, appliquer, afficher les diffs; argv->rc."""
+    ap = argparse.ArgumentParser(description="Applique un diff souple lu sur STDIN.")
+    ap.add_argument("--engine", choices=[ENGINE_MEMORY, ENGINE_PATCH], default=ENGINE_MEMORY,
+                    help="memory: application en mémoire + écriture atomique (défaut); patch: compatibilité via le binaire patch")
+    ap.add_argument("-j", "--jobs", type=int, default=1,
+                    help="nombre de processus pour préparer les fichiers en parallèle (0 = nombre de CPU; défaut 1)")
+    ap.add_argument("--keep-going", action="store_true",
+                    help="continuer après un fichier en échec au lieu de s'arrêter au premier")
+    ap.add_argument("--transaction", action="store_true",
+                    help="tout ou rien: tous les fichiers préparés et validés en mémoire, sinon aucune écriture")
+    ap.add_argument("--validate", choices=[VALIDATE_PER_FILE, VALIDATE_PER_GROUP, VALIDATE_OFF], default=VALIDATE_PER_FILE,
+                    help="per-file: valider le résultat final de chaque fichier (défaut); per-group: idem + dichotomie vers le groupe fautif; off: aucune validation")
+    ap.add_argument("--fuzzy-min-score", type=float, default=FUZZY_MIN_SCORE, metavar="S",
+                    help=f"confiance minimale (0..1) pour appliquer un groupe dont le contexte a dérivé (défaut {FUZZY_MIN_SCORE})")
+    ap.add_argument("--large-file-mb", type=float, default=LARGE_FILE_BYTES / (1024 * 1024), metavar="MO",
+                    help=f"taille à partir de laquelle un fichier est traité en mode mmap sur les octets (défaut {LARGE_FILE_BYTES // (1024 * 1024)}; 0 = jamais)")
+    ap.add_argument("--ignore-line-numbers", action="store_true",
+                    help="ne pas utiliser les numéros de ligne des entêtes @@ comme indice (première occurrence après le groupe précédent)")
+    ap.add_argument("--lock-timeout", type=float, default=LOCK_TIMEOUT, metavar="SECONDES",
+                    help=f"attente maximale du verrou d'un fichier tenu par une autre exécution (défaut {LOCK_TIMEOUT:g}; -1 = pas de verrou)")
+    ap.add_argument("--conflict-retries", type=int, default=CONFLICT_RETRIES, metavar="N",
+                    help=f"nouvelles résolutions d'un fichier modifié par un autre processus entre lecture et écriture (défaut {CONFLICT_RETRIES})")
+    ap.add_argument("--no-fuzzy", action="store_true",
+                    help="désactiver l'ancrage flou: contexte exact (au whitespace de début près) exigé")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="ne pas lire ni écrire le cache disque des résolutions de groupes")
+    ap.add_argument("--cache-dir", default=None,
+                    help="dossier du cache (défaut: $SUPER_PATCH_CACHE_DIR ou ~/.cache/super_patch)")
+    ap.add_argument("--cache-max", type=int, default=CACHE_MAX_ENTRIES,
+                    help=f"nombre maximal d'entrées conservées, éviction LRU (défaut {CACHE_MAX_ENTRIES})")
+    ap.add_argument("--metrics", choices=["json"], default=None,
+                    help="json: rapport de temps par phase/fichier/groupe, modes de correspondance, octets lus/écrits et sous-processus")
+    ap.add_argument("--metrics-out", default="-",
+                    help="fichier du rapport de métriques (défaut '-': stderr, stdout portant déjà les diffs)")
+    ap.add_argument("--diff", choices=[DIFF_FULL, DIFF_SUMMARY, DIFF_NONE], default=DIFF_FULL,
+                    help="diff final des fichiers modifiés: full (diff -u, défaut), summary (une ligne +/- par fichier), none")
+    ap.add_argument("--diff-context", type=int, default=3, metavar="N",
+                    help="lignes de contexte du diff final (défaut 3)")
+    ap.add_argument("--color", choices=["auto", "always", "never"], default="auto",
+                    help="couleur du diff final (auto: si stdout est un terminal)")
+    ap.add_argument("--backup-mode", choices=[BACKUP_STORE, BACKUP_SIDECAR], default=BACKUP_STORE,
+                    help="store: magasin adressé par contenu (défaut); sidecar: copie src.AAAAmmjjTHHMMSS à côté du fichier")
+    ap.add_argument("--backup-dir", default=None,
+                    help="dossier du magasin de sauvegardes (défaut: $SUPER_PATCH_BACKUP_DIR, sinon $XDG_CACHE_HOME/super_patch/backups ou ~/.cache/super_patch/backups)")
+    ap.add_argument("--backup-keep", type=int, default=BACKUP_KEEP_RUNS, metavar="N",
+                    help=f"exécutions conservées dans le magasin (défaut {BACKUP_KEEP_RUNS}; -1 = toutes)")
+    ap.add_argument("--backup-max-age", type=float, default=BACKUP_MAX_AGE_DAYS, metavar="JOURS",
+                    help=f"âge maximal d'une exécution conservée (défaut {BACKUP_MAX_AGE_DAYS}; -1 = illimité)")
+    ap.add_argument("--restore", metavar="RUN_ID", default=None,
+                    help="restaurer les fichiers sauvegardés par l'exécution RUN_ID (aucun diff lu sur STDIN)")
+    ap.add_argument("--list-runs", action="store_true",
+                    help="lister les exécutions présentes dans le magasin de sauvegardes")
+    ap.add_argument("--batch", nargs="+", metavar="DIFF", default=None,
+                    help="appliquer dans l'ordre ces fichiers diff (ou les *.diff/*.patch de ces dossiers) dans un seul processus")
+    ap.add_argument("--spool", metavar="DOSSIER", default=None,
+                    help="surveiller ce dossier et appliquer chaque nouveau *.diff/*.patch (rangé ensuite dans done/ ou failed/)")
+    ap.add_argument("--spool-once", action="store_true",
+                    help="avec --spool: traiter les diffs présents puis s'arrêter")
+    ap.add_argument("--poll", type=float, default=1.0, metavar="SECONDES",
+                    help="intervalle de scrutation de --spool (défaut 1s)")
+    ap.add_argument("--results", default="-", metavar="FICHIER",
+                    help="batch/spool: enregistrement JSON par diff ajouté à ce fichier (défaut '-': ligne [RESULT] sur stdout)")
+    ap.add_argument("--plan", metavar="FICHIER", default=None,
+                    help="résoudre le diff de STDIN sans rien modifier et écrire le plan résolu (empreintes + éditions) dans FICHIER")
+    ap.add_argument("--replay", metavar="FICHIER", default=None,
+                    help="appliquer un plan écrit par --plan sans recherche (refusé si un fichier n'a pas l'empreinte attendue)")
+    ap.add_argument("--bundles", metavar="SCRIPT", default=None,
+                    help="après application, réécrire seulement les archives de ce script de génération (new_generate_manager_tars.sh) qui contiennent un fichier modifié")
+    ap.add_argument("--bundle-root", metavar="DOSSIER", default=None,
+                    help="avec --bundles: dossier dont les membres des archives sont relatifs (défaut: celui du 'cd' du script)")
+    ap.add_argument("--bundle-dir", metavar="DOSSIER", default=None,
+                    help="avec --bundles: dossier des archives (défaut: celui des chemins 'tar -cf' du script)")
+    ap.add_argument("--serve", metavar="SOCKET", default=None,
+                    help="rester résident et appliquer les diffs reçus sur ce socket Unix (fichiers et index gardés en mémoire)")
+    ap.add_argument("--client", metavar="SOCKET", default=None,
+                    help="envoyer le diff de STDIN au serveur --serve écoutant sur ce socket")
+    args = ap.parse_args(argv)
+    if args.transaction and args.engine == ENGINE_PATCH:
+        sys.stderr.write("[WARN] --transaction impose --engine memory.\n")
+        args.engine = ENGINE_MEMORY
+    opts = make_options(engine=args.engine, jobs=args.jobs, fail_fast=not args.keep_going, validate=args.validate,
+                        transaction=args.transaction, cache=not args.no_cache, cache_dir=args.cache_dir, cache_max_entries=args.cache_max,
+                        metrics=args.metrics is not None, diff=args.diff, diff_context=max(0, args.diff_context),
+                        color=args.color == "always" or (args.color == "auto" and sys.stdout.isatty()),
+                        backup_mode=args.backup_mode, backup_dir=args.backup_dir,
+                        backup_keep_runs=args.backup_keep, backup_max_age_days=args.backup_max_age,
+                        fuzzy_min_score=None if args.no_fuzzy else args.fuzzy_min_score, line_hints=not args.ignore_line_numbers,
+                        large_file_bytes=int(args.large_file_mb * 1024 * 1024) or None,
+                        lock_timeout=None if args.lock_timeout < 0 else args.lock_timeout, conflict_retries=max(0, args.conflict_retries),
+                        bundles=args.bundles, bundle_root=args.bundle_root, bundle_dir=args.bundle_dir)
+    if args.restore:
+        return restore_run(args.restore, opts)
+    if args.list_runs:
+        for run_id, records in list_backup_runs(opts):
+            saved = sum(1 for r in records if "object" in r)
+            created = sum(1 for r in records if r.get("created"))
+            print(f"{run_id}  {saved} sauvegarde(s), {created} création(s)")
+        return 0
+    if not opts["metrics"]:
+        return _run_cli(opts, args)
+
+    metrics_enable()
+    rc = 1
+    try:
+        rc = _run_cli(opts, args)
+        return rc
+    finally:
+        report = json.dumps(metrics_report(rc, opts), ensure_ascii=False)
+        if args.metrics_out == "-":
+            sys.stderr.write(report + "\n")
+        else:
+            with open(args.metrics_out, "w", encoding="utf-8") as f:
+                f.write(report + "\n")
+
+def _run_cli(opts: Dict, args: argparse.Namespace) -> int:
+    """Appliquer le diff de STDIN (ou les diffs de --batch / --spool, un plan --plan / --replay, ou servir / déléguer via --serve / --client) selon opts; (opts,args)->rc."""
+    if args.serve:
+        return serve(args.serve, opts)
+    if args.client:
+        rc = run_client(args.client, opts, sys.stdin)
+        if rc != 0 and opts["fail_fast"]:
+            return rc
+    elif args.batch:
+        rc = run_batch(args.batch, opts, args.results)
+    elif args.spool:
+        rc = run_spool(args.spool, opts, args.results, args.poll, args.spool_once)
+    elif args.plan:
+        rc = run_plan(sys.stdin, opts, args.plan)
+        if rc != 0:
+            return rc
+    elif args.replay:
+        rc = run_replay(args.replay, opts)
+        if rc != 0 and opts["fail_fast"]:
+            return rc
+    else:
+        rc = apply_diff_stream(sys.stdin, opts)
+        if rc != 0 and opts["fail_fast"]:
+            return rc
+
+    sys.stdout.write("\n" * 10)
+    sys.stdout.flush()
+    return rc
 
-sys.stdout.write("\n" * 10)
-sys.stdout.flush()
+if __name__ == "__main__":
+    sys.exit(main())
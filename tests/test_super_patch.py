@@ -0,0 +1,69 @@
+"""Tests de non-régression de super_patch.py (API apply_patch, fichiers temporaires)."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import super_patch as sp
+
+def _write(root, name, text):
+    with open(os.path.join(root, name), "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+def _read(root, name):
+    with open(os.path.join(root, name), "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+def _apply(root, text, **options):
+    store = root.parent / f"{root.name}-store"
+    return sp.apply_patch(text, root=str(root), options=dict({"cache": False, "diff": "none", "backup_dir": str(store)}, **options))
+
+def test_transaction_notfound_group_writes_nothing(tmp_path):
+    _write(tmp_path, "f.txt", "a\nb\nc\nd\n")
+    _write(tmp_path, "g.txt", "x\ny\nz\n")
+    diff = ("--- f.txt\n+++ f.txt\n@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n"
+            "--- g.txt\n+++ g.txt\n@@ -1,3 +1,3 @@\n x\n-QQ\n+W\n z\n")
+    result = _apply(tmp_path, diff, transaction=True)
+    assert result["rc"] != 0
+    assert _read(tmp_path, "f.txt") == "a\nb\nc\nd\n"
+    assert _read(tmp_path, "g.txt") == "x\ny\nz\n"
+
+def test_crlf_file_keeps_line_endings(tmp_path):
+    _write(tmp_path, "c.txt", "one\r\ntwo\r\nthree\r\nfour\r\n")
+    diff = "--- c.txt\n+++ c.txt\n@@ -1,3 +1,3 @@\n one\n-two\n+TWO\n three\n"
+    assert _apply(tmp_path, diff)["rc"] == 0
+    assert _read(tmp_path, "c.txt") == "one\r\nTWO\r\nthree\r\nfour\r\n"
+    assert _apply(tmp_path, diff)["status"] == "already-applied"
+
+def test_apply_patch_missing_root_returns_failure(tmp_path):
+    result = sp.apply_patch("--- a.txt\n+++ a.txt\n@@ -1 +1 @@\n-a\n+b\n", root=str(tmp_path / "missing"), options={"cache": False})
+    assert result["rc"] == 1
+    assert result["status"] == "failed"
+    assert "FileNotFoundError" in result["error"]
+
+def test_daemon_rejects_bad_cwd_and_option_types(tmp_path):
+    opts = sp.make_options(cache=False, diff="none", backup_dir=str(tmp_path / "store"))
+    bad_cwd = sp.handle_daemon_request({"cmd": "apply", "diff": "", "cwd": str(tmp_path / "missing")}, opts)
+    assert bad_cwd["ok"] is False and "cwd" in bad_cwd["error"]
+    bad_option = sp.handle_daemon_request({"cmd": "apply", "diff": "", "cwd": str(tmp_path), "options": {"diff_context": "x"}}, opts)
+    assert bad_option["ok"] is False and "diff_context" in bad_option["error"]
+
+def test_default_backup_store_is_outside_the_tree(tmp_path, monkeypatch):
+    monkeypatch.delenv("SUPER_PATCH_BACKUP_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    assert sp._default_backup_dir() == str(tmp_path / "xdg" / "super_patch" / "backups")
+
+def test_store_diff_header_names_the_file_and_run(tmp_path):
+    root = tmp_path / "tree"
+    root.mkdir()
+    _write(root, "a.txt", "a\n")
+    result = _apply(root, "--- a.txt\n+++ a.txt\n@@ -1 +1 @@\n-a\n+b\n", diff="full")
+    run_id = result["run_id"]
+    header = next(l for l in result["stdout"].splitlines() if l.startswith("--- "))
+    assert header.startswith("--- a.txt\t") and header.endswith(f"(run {run_id})")
+
+def test_js_regex_after_statement_header():
+    check = sp._validator_for("a.js")
+    assert check("a.js", "if (ok) /a}/.test(s);\nwhile (x) /[)]/.exec(s);\n") is None
+    assert check("a.js", "const r = (a) / 2 / b;\n") is None
+    assert check("a.js", "x = f(a) /b}/ 2;\n") == (1, "'}' sans ouverture correspondante")